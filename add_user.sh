@@ -18,24 +18,40 @@ if [ ! -f "/etc/openvpn/server/easy-rsa/easyrsa" ]; then
     exit 1
 fi
 
-# Проверяем, что пользователь не существует
-if [ -e "/etc/openvpn/server/easy-rsa/pki/issued/${USERNAME}.crt" ]; then
-    echo "Ошибка: Пользователь $USERNAME уже существует"
-    exit 1
-fi
-
 # Переходим в директорию easy-rsa
 cd /etc/openvpn/server/easy-rsa/
 
-# Устанавливаем правильные права доступа для pki директории
-chmod -R 755 pki/
-chown -R root:root pki/
+# Берем ту же блокировку PKI, что и бот, чтобы не выпускать сертификаты одновременно с ним
+exec 9>pki.lock
+if ! flock -w 120 9; then
+    echo "Ошибка: PKI занята другим процессом"
+    exit 1
+fi
+
+# Проверяем под блокировкой, что пользователь не существует, иначе два процесса могут пройти проверку одновременно
+if [ -e "pki/issued/${USERNAME}.crt" ]; then
+    echo "Ошибка: Пользователь $USERNAME уже существует"
+    exit 1
+fi
 
 # Создаем сертификат для пользователя
 echo "Создаю сертификат для пользователя: $USERNAME"
 ./easyrsa --batch --days=3650 build-client-full "$USERNAME" nopass
+RESULT=$?
+
+# Освобождаем блокировку сразу после изменения PKI
+flock -u 9
+
+if [ $RESULT -eq 0 ]; then
+    # Устанавливаем права доступа только для файлов нового пользователя
+    chown root:root pki/private/"$USERNAME".key pki/reqs/"$USERNAME".req pki/issued/"$USERNAME".crt
+    chmod 600 pki/private/"$USERNAME".key
+    chmod 644 pki/reqs/"$USERNAME".req pki/issued/"$USERNAME".crt
+    if [ -f pki/inline/private/"$USERNAME".inline ]; then
+        chown root:root pki/inline/private/"$USERNAME".inline
+        chmod 600 pki/inline/private/"$USERNAME".inline
+    fi
 
-if [ $? -eq 0 ]; then
     # Создаем .ovpn файл в директории /root/ovpns
     OVPN_DIR="/root/ovpns"
     if [ -f "/etc/openvpn/server/client-common.txt" ]; then
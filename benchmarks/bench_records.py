@@ -0,0 +1,150 @@
+"""
+Бенчмарк памяти и времени на страницу для записей пользователей
+
+Сравнивает прежний формат (словарь с username, filename, file_path
+и size_kb на каждый профиль) с компактными UserRecord: память полного
+списка и время отрисовки одной страницы - как через полный список
+(get_all_users + постраничный рендер), так и через страницу реестра.
+
+Профили в реестр записываются напрямую, без файлов, поэтому
+замер быстрый даже для сотен тысяч пользователей.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_records --sizes 10000,100000
+"""
+import argparse
+import gc
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+from benchmarks.bench_services import measure
+from services.file_service import FileService
+from services.user_registry import UserRecord, UserRegistry
+
+
+class LegacyUser(dict):
+    """Запись в прежнем формате get_all_users с доступом через атрибуты для рендеров FileService"""
+
+    __getattr__ = dict.get
+
+
+def make_legacy_users(registry: UserRegistry) -> List[LegacyUser]:
+    """Строит список в прежнем формате: по словарю и две строки пути на каждый профиль"""
+    rows = registry._connection.execute(
+        "SELECT username, file_size FROM users WHERE status = 'active' ORDER BY username"
+    ).fetchall()
+    users = []
+    for username, file_size in rows:
+        filename = f"{username}{registry.extension}"
+        users.append(LegacyUser(
+            username=username,
+            filename=filename,
+            file_path=os.path.join(registry.ovpn_dir, filename),
+            size_kb=file_size / 1024
+        ))
+    return users
+
+
+def measure_memory(build: Callable[[], object]) -> int:
+    """Память, которую занимает результат build, байты"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = build()
+        current, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return current
+
+
+def run_size(size: int, runs: int) -> List[Dict]:
+    """Выполняет замеры для реестра с size пользователями"""
+    root = tempfile.mkdtemp(prefix="ovpn-records-")
+    try:
+        print(f"== {size} пользователей", file=sys.stderr)
+        registry = UserRegistry(os.path.join(root, "users.sqlite3"), "/root/ovpns")
+        now = time.time()
+        registry.apply_changes(((f"user{number:07d}", 4980, now, None) for number in range(size)), [], full=True)
+
+        file_service = FileService()
+        per_page = file_service.files_per_page
+        page_number = size // per_page // 2
+
+        results = []
+
+        def build_records() -> List[UserRecord]:
+            # Сбрасываем кэш реестра, чтобы записи создавались внутри замера
+            registry._all_users = None
+            return registry.get_all()
+
+        for name, build in (("legacy_dict", lambda: make_legacy_users(registry)), ("user_record", build_records)):
+            memory = measure_memory(build)
+            results.append({'name': f"{name}_list_memory", 'size': size, 'bytes': memory,
+                            'bytes_per_user': memory / size})
+
+        # Прежний путь запроса: полный список на каждое нажатие, затем страница из него
+        def legacy_page():
+            users = make_legacy_users(registry)
+            file_service.create_files_list_text(users, page_number)
+            file_service.create_pagination_keyboard(users, page_number)
+
+        def record_page():
+            users = registry.get_all()
+            file_service.create_files_list_text(users, page_number)
+            file_service.create_pagination_keyboard(users, page_number)
+
+        # То же после изменения реестра, когда полный список создается заново
+        def record_page_cold():
+            build_records()
+            record_page()
+
+        # Текущий путь: только записи страницы из реестра
+        def registry_page():
+            page = registry.get_snapshot_page(per_page, position=page_number * per_page)
+            file_service._page_cache.clear()
+            file_service.render_page(page)
+
+        results.append(measure("legacy_dict_page", size, legacy_page, runs))
+        results.append(measure("user_record_page_cold", size, record_page_cold, runs))
+        results.append(measure("user_record_page", size, record_page, runs))
+        results.append(measure("registry_page", size, registry_page, runs))
+        registry.close()
+        return results
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк компактных записей пользователей")
+    parser.add_argument("--sizes", default="10000,100000", help="Количество пользователей через запятую")
+    parser.add_argument("--runs", type=int, default=20, help="Повторов замера времени")
+    parser.add_argument("--output", help="Файл для сохранения результатов в JSON")
+    args = parser.parse_args()
+
+    results = []
+    for size in (int(value) for value in args.sizes.split(",")):
+        results.extend(run_size(size, args.runs))
+
+    print(f"{'замер':<28} {'профилей':>9} {'значение':>14}")
+    for item in results:
+        if 'bytes' in item:
+            value = f"{item['bytes'] / 1024 / 1024:.1f} МБ ({item['bytes_per_user']:.0f} Б/польз.)"
+        else:
+            value = f"{item['mean_ms']:.3f} мс (p95 {item['p95_ms']:.3f})"
+        print(f"{item['name']:<28} {item['size']:>9} {value:>14}")
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, ensure_ascii=False, indent=2)
+        print(f"\nРезультаты сохранены в {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
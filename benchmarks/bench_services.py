@@ -0,0 +1,228 @@
+"""
+Бенчмарк сервисного слоя на синтетическом PKI
+
+Создает временную директорию с N профилями и фейковым easyrsa,
+замеряет основные операции UserService, FileService и SystemService
+и сохраняет результаты в JSON для сравнения между коммитами.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_services --sizes 1000,10000,100000
+    python -m benchmarks.bench_services --compare benchmarks/results/<commit>.json
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+from benchmarks.fake_pki import create_environment
+from services.file_service import FileService
+from services.job_service import JobService
+from services.system_service import SystemService
+from services.user_service import UserService
+
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def summarize(name: str, size: int, durations: List[float]) -> Dict:
+    """Сводит замеры одной операции в запись результата (время в миллисекундах)"""
+    ordered = sorted(durations)
+    return {
+        'name': name,
+        'size': size,
+        'runs': len(ordered),
+        'mean_ms': statistics.fmean(ordered) * 1000,
+        'p50_ms': ordered[len(ordered) // 2] * 1000,
+        'p95_ms': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+        'min_ms': ordered[0] * 1000,
+        'max_ms': ordered[-1] * 1000,
+    }
+
+
+def measure(name: str, size: int, func: Callable[[], object], runs: int,
+            setup: Optional[Callable[[], None]] = None) -> Dict:
+    """Замеряет синхронную операцию runs раз"""
+    durations = []
+    for _ in range(runs):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - started)
+    return summarize(name, size, durations)
+
+
+async def measure_async_creates(user_service: UserService, size: int, count: int, workers: int) -> List[Dict]:
+    """Замеряет создание пользователей через очередь задач: задержку одной задачи и общую пропускную способность"""
+    job_service = JobService(user_service, workers=workers)
+    latencies = []
+
+    async def create(username: str):
+        started = time.perf_counter()
+        success, job, error_message = job_service.submit(username)
+        if not success:
+            raise RuntimeError(error_message)
+        success, message = await job.done
+        if not success:
+            raise RuntimeError(message)
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(create(f"bench-async-{number}") for number in range(count)))
+    elapsed = time.perf_counter() - started
+    await job_service.stop()
+
+    return [
+        summarize("create_user_async", size, latencies),
+        summarize("create_user_async_batch", size, [elapsed]),
+    ]
+
+
+def run_size(size: int, args: argparse.Namespace) -> List[Dict]:
+    """Выполняет все замеры для окружения с size профилями"""
+    root = tempfile.mkdtemp(prefix="ovpn-bench-")
+    try:
+        print(f"== {size} профилей: подготовка окружения в {root}", file=sys.stderr)
+        paths = create_environment(root, size)
+        os.environ['FAKE_EASYRSA_LATENCY'] = str(args.latency)
+
+        def new_user_service() -> UserService:
+            return UserService(paths['ovpn_dir'], paths['easy_rsa_dir'], paths['client_common_path'],
+                               data_dir=os.path.join(root, "data"))
+
+        results = []
+        runs = args.runs
+        file_service = FileService()
+        per_page = file_service.files_per_page
+
+        # Первый запрос после старта бота: полное сканирование директории
+        results.append(measure("get_all_users_cold", size, lambda: new_user_service().get_all_users(), max(1, runs // 10)))
+
+        user_service = new_user_service()
+        # Профили только что созданы, поэтому защита от "свежего" mtime заставила бы
+        # пересканировать директорию на каждом вызове, чего не бывает на реальном сервере
+        user_service.user_index.RACY_MTIME_SECONDS = 0
+        user_service.get_all_users()
+        results.append(measure("get_all_users_warm", size, user_service.get_all_users, runs))
+
+        # Внешнее изменение директории (например, add_user.sh) с последующим запросом
+        counter = iter(range(10 ** 9))
+
+        def add_external_profile():
+            with open(os.path.join(paths['ovpn_dir'], f"external{next(counter):06d}.ovpn"), 'w') as profile:
+                profile.write("client\n")
+
+        results.append(measure("get_all_users_after_change", size, user_service.get_all_users, runs,
+                               setup=add_external_profile))
+
+        middle = size // 2
+        results.append(measure("get_users_page_first", size, lambda: user_service.get_users_page(per_page), runs))
+        results.append(measure("get_users_page_middle", size,
+                               lambda: user_service.get_users_page(per_page, position=middle), runs))
+
+        _, users, _ = user_service.get_all_users()
+        _, page, _ = user_service.get_users_page(per_page, position=middle)
+        page_number = middle // per_page
+
+        results.append(measure("page_text_render", size,
+                               lambda: file_service.create_files_list_text(users, page_number), runs))
+        results.append(measure("page_keyboard_render", size,
+                               lambda: file_service.create_pagination_keyboard(users, page_number), runs))
+
+        def render_uncached():
+            file_service._page_cache.clear()
+            file_service.render_page(page)
+
+        results.append(measure("render_page_cold", size, render_uncached, runs))
+        results.append(measure("render_page_cached", size, lambda: file_service.render_page(page), runs))
+
+        results.append(measure("get_user_file", size, lambda: user_service.get_user_file(f"user{middle:06d}"), runs))
+
+        create_counter = iter(range(10 ** 9))
+        results.append(measure("create_user_sync", size,
+                               lambda: user_service.create_user(f"bench-sync-{next(create_counter)}"), args.creates))
+
+        results.extend(asyncio.run(measure_async_creates(user_service, size, args.creates, args.workers)))
+
+        system_service = SystemService()
+        results.append(measure("system_info", size, system_service.format_system_info, runs))
+
+        return results
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def git_commit() -> Optional[str]:
+    """Получает текущий коммит, если бенчмарк запущен из git репозитория"""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results: List[Dict], baseline: Optional[List[Dict]] = None):
+    """Печатает таблицу результатов и, если задано, сравнение с базовыми"""
+    baseline_by_key = {(item['name'], item['size']): item for item in baseline or []}
+    print(f"{'операция':<28} {'профилей':>9} {'mean, мс':>11} {'p95, мс':>11}" + ("  сравнение" if baseline else ""))
+    for item in results:
+        line = f"{item['name']:<28} {item['size']:>9} {item['mean_ms']:>11.3f} {item['p95_ms']:>11.3f}"
+        previous = baseline_by_key.get((item['name'], item['size']))
+        if previous and previous['mean_ms']:
+            line += f"  x{item['mean_ms'] / previous['mean_ms']:.2f}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк сервисного слоя OpenVPN бота")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="Количество профилей через запятую")
+    parser.add_argument("--runs", type=int, default=50, help="Повторов для быстрых операций")
+    parser.add_argument("--creates", type=int, default=5, help="Количество создаваемых пользователей")
+    parser.add_argument("--workers", type=int, default=2, help="Воркеры очереди выпуска сертификатов")
+    parser.add_argument("--latency", type=float, default=0.05, help="Задержка фейкового easyrsa, секунды")
+    parser.add_argument("--output", help="Файл для сохранения результатов (по умолчанию results/<коммит>.json)")
+    parser.add_argument("--compare", help="Файл с результатами для сравнения")
+    args = parser.parse_args()
+
+    results = []
+    for size in (int(value) for value in args.sizes.split(",")):
+        results.extend(run_size(size, args))
+
+    commit = git_commit()
+    report = {
+        'meta': {
+            'commit': commit,
+            'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': f"{platform.system()} {platform.release()}",
+            'easyrsa_latency': args.latency,
+            'workers': args.workers,
+        },
+        'results': results,
+    }
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{commit or 'local'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as output_file:
+        json.dump(report, output_file, ensure_ascii=False, indent=2)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r') as baseline_file:
+            baseline = json.load(baseline_file)['results']
+
+    print_results(results, baseline)
+    print(f"\nРезультаты сохранены в {output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""Синтетическое окружение OpenVPN для бенчмарков: фейковый easy-rsa и профили"""
+import os
+import stat
+import time
+
+
+# Заглушка easyrsa: создает те же файлы, что и настоящий easy-rsa, после задержки FAKE_EASYRSA_LATENCY
+FAKE_EASYRSA = r"""#!/bin/bash
+sleep "${FAKE_EASYRSA_LATENCY:-0}"
+command=""
+names=()
+for arg in "$@"; do
+    case "$arg" in
+        --*) ;;
+        *) if [ -z "$command" ]; then command="$arg"; else names+=("$arg"); fi ;;
+    esac
+done
+
+# Строка базы сертификатов в формате OpenSSL, как ее дописывает настоящий easy-rsa
+append_index() {
+    expiry="$(date -u -d "+3650 days" +%y%m%d%H%M%SZ)"
+    serial="$(od -An -N16 -tx1 /dev/urandom | tr -d ' \n' | tr a-f A-F)"
+    printf 'V\t%s\t\t%s\tunknown\t/CN=%s\n' "$expiry" "$serial" "$1" >> pki/index.txt
+}
+
+write_cert() {
+    printf 'Certificate:\n-----BEGIN CERTIFICATE-----\nFAKE-%s\n-----END CERTIFICATE-----\n' "$1" > "pki/issued/$1.crt"
+    printf '<ca>\nFAKE-CA\n</ca>\n<cert>\nFAKE-%s\n</cert>\n<key>\nFAKE-KEY\n</key>\n' "$1" > "pki/inline/private/$1.inline"
+}
+
+case "$command" in
+    gen-req)
+        name="${names[0]}"
+        [ -e "pki/private/$name.key" ] && { echo "key exists" >&2; exit 1; }
+        echo "FAKE-KEY" > "pki/private/$name.key"
+        echo "FAKE-REQ" > "pki/reqs/$name.req"
+        ;;
+    sign-req)
+        name="${names[1]}"
+        [ -e "pki/reqs/$name.req" ] || { echo "request not found" >&2; exit 1; }
+        write_cert "$name"
+        append_index "$name"
+        ;;
+    build-client-full)
+        name="${names[0]}"
+        echo "FAKE-KEY" > "pki/private/$name.key"
+        echo "FAKE-REQ" > "pki/reqs/$name.req"
+        write_cert "$name"
+        append_index "$name"
+        ;;
+    revoke)
+        name="${names[0]}"
+        [ -e "pki/issued/$name.crt" ] || { echo "certificate not found" >&2; exit 1; }
+        mkdir -p pki/revoked/certs_by_serial
+        mv "pki/issued/$name.crt" "pki/revoked/certs_by_serial/$name.crt"
+        # Как и openssl ca, переписываем базу целиком через новый файл
+        revoked_at="$(date -u +%y%m%d%H%M%SZ)"
+        awk -F '\t' -v OFS='\t' -v cn="/CN=$name" -v at="$revoked_at" \
+            '$1 == "V" && $6 == cn { $1 = "R"; $3 = at } { print }' pki/index.txt > pki/index.txt.new
+        mv pki/index.txt.new pki/index.txt
+        ;;
+    gen-crl)
+        printf -- '-----BEGIN X509 CRL-----\nFAKE-CRL %s\n-----END X509 CRL-----\n' "$(ls pki/revoked/certs_by_serial 2>/dev/null | wc -l)" > pki/crl.pem
+        ;;
+    *)
+        echo "unsupported command: $command" >&2
+        exit 1
+        ;;
+esac
+"""
+
+CLIENT_COMMON = (
+    "client\n"
+    "dev tun\n"
+    "proto udp\n"
+    "# Комментарии отбрасываются при сборке профиля\n"
+    "remote 203.0.113.1 1194\n"
+    "resolv-retry infinite\n"
+    "nobind\n"
+    "persist-key\n"
+    "persist-tun\n"
+    "remote-cert-tls server\n"
+    "cipher AES-256-CBC\n"
+    "verb 3\n"
+)
+
+# Размер синтетического профиля близок к реальному .ovpn с inline ключами
+PROFILE_BODY = CLIENT_COMMON + "<ca>\n" + "A" * 1200 + "\n</ca>\n<cert>\n" + "B" * 1800 + "\n</cert>\n<key>\n" + "C" * 1700 + "\n</key>\n"
+
+
+def _write_executable(path: str, content: str):
+    """Записывает исполняемый скрипт"""
+    with open(path, 'w') as script:
+        script.write(content)
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+
+def create_environment(root: str, profiles: int) -> dict:
+    """
+    Создает синтетический PKI и директорию с профилями
+
+    Args:
+        root: Корневая директория окружения
+        profiles: Количество .ovpn профилей
+
+    Returns:
+        dict: Пути ovpn_dir, easy_rsa_dir, client_common_path
+    """
+    easy_rsa_dir = os.path.join(root, "easy-rsa")
+    ovpn_dir = os.path.join(root, "ovpns")
+    client_common_path = os.path.join(root, "client-common.txt")
+
+    for directory in ("issued", "private", "reqs", os.path.join("inline", "private")):
+        os.makedirs(os.path.join(easy_rsa_dir, "pki", directory), exist_ok=True)
+    os.makedirs(ovpn_dir, exist_ok=True)
+
+    with open(os.path.join(easy_rsa_dir, "pki", "ca.crt"), 'w') as ca_file:
+        ca_file.write("-----BEGIN CERTIFICATE-----\nFAKE-CA\n-----END CERTIFICATE-----\n")
+    with open(os.path.join(easy_rsa_dir, "pki", "index.txt"), 'w'):
+        pass
+    with open(client_common_path, 'w') as common_file:
+        common_file.write(CLIENT_COMMON)
+
+    _write_executable(os.path.join(easy_rsa_dir, "easyrsa"), FAKE_EASYRSA)
+
+    body = PROFILE_BODY.encode()
+    for number in range(profiles):
+        with open(os.path.join(ovpn_dir, f"user{number:06d}.ovpn"), 'wb') as profile:
+            profile.write(body)
+
+    # На реальном сервере профили созданы давно, поэтому mtime директории сдвигается в прошлое
+    an_hour_ago = time.time() - 3600
+    os.utime(ovpn_dir, (an_hour_ago, an_hour_ago))
+
+    return {
+        'ovpn_dir': ovpn_dir,
+        'easy_rsa_dir': easy_rsa_dir,
+        'client_common_path': client_common_path,
+    }
@@ -0,0 +1,273 @@
+"""
+Нагрузочный тест диспетчера aiogram из main.py
+
+Подает в dp синтетические или записанные Update через фейковую сессию
+Bot, которая вместо Telegram API записывает исходящие вызовы и отвечает
+правдоподобными объектами. Показывает пропускную способность и
+p50/p95/p99 задержки обработчиков при заданной конкурентности.
+
+Запуск из корня репозитория:
+    python -m benchmarks.load_dispatcher --updates 5000 --concurrency 50
+    python -m benchmarks.load_dispatcher --replay updates.jsonl --concurrency 10
+"""
+import argparse
+import asyncio
+import collections
+import datetime
+import itertools
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from typing import Any, AsyncGenerator, Dict, List, Optional
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import Message, Update
+
+from benchmarks.fake_pki import create_environment
+
+
+# Доли типов синтетических обновлений
+DEFAULT_MIX = {
+    'get_all_users': 0.2,
+    'page': 0.4,
+    'download': 0.2,
+    'echo': 0.2,
+}
+
+
+class FakeTelegramSession(BaseSession):
+    """Сессия Bot, подменяющая Telegram API и записывающая исходящие вызовы"""
+
+    def __init__(self, api_latency: float = 0.0):
+        super().__init__()
+        self.api_latency = api_latency
+        self.calls: "collections.Counter[str]" = collections.Counter()
+        self._message_ids = itertools.count(1)
+
+    async def close(self) -> None:
+        pass
+
+    async def make_request(self, bot: Bot, method: TelegramMethod[TelegramType],
+                           timeout: Optional[int] = None) -> TelegramType:
+        method_name = type(method).__name__
+        self.calls[method_name] += 1
+        if self.api_latency:
+            await asyncio.sleep(self.api_latency)
+
+        result = self._fake_result(method_name, method)
+        if isinstance(result, dict):
+            return Message.model_validate(result, context={"bot": bot})
+        return result
+
+    async def stream_content(self, url: str, headers: Optional[Dict[str, Any]] = None, timeout: int = 30,
+                             chunk_size: int = 65536, raise_for_status: bool = True) -> AsyncGenerator[bytes, None]:
+        yield b""
+
+    def _fake_result(self, method_name: str, method: TelegramMethod) -> Any:
+        """Формирует ответ, который вернул бы Telegram"""
+        if method_name in ("SendMessage", "EditMessageText", "SendDocument"):
+            message = {
+                'message_id': next(self._message_ids),
+                'date': int(time.time()),
+                'chat': {'id': getattr(method, 'chat_id', None) or 1, 'type': 'private'},
+                'text': getattr(method, 'text', None),
+            }
+            if method_name == "SendDocument":
+                file_id = f"fake-file-{message['message_id']}"
+                message['document'] = {'file_id': file_id, 'file_unique_id': file_id}
+            return message
+        return True
+
+
+class UpdateFactory:
+    """Генератор синтетических обновлений для обработчиков main.py"""
+
+    def __init__(self, bot: Bot, usernames: List[str], chats: int, mix: Dict[str, float], seed: int):
+        self.bot = bot
+        self.usernames = usernames
+        self.chats = chats
+        self.kinds = list(mix)
+        self.weights = [mix[kind] for kind in self.kinds]
+        self.random = random.Random(seed)
+        self._ids = itertools.count(1)
+
+    def create(self, file_service) -> Update:
+        """Создает случайное обновление согласно заданному распределению"""
+        kind = self.random.choices(self.kinds, self.weights)[0]
+        chat_id = self.random.randint(1, self.chats)
+        update_id = next(self._ids)
+
+        if kind == 'get_all_users':
+            payload = {'message': self._message(update_id, chat_id, "/get_all_users")}
+        elif kind == 'echo':
+            payload = {'message': self._message(update_id, chat_id, "привет")}
+        else:
+            username = self.random.choice(self.usernames)
+            if kind == 'download':
+                data = f"download_{username}"
+            else:
+                data = file_service.encode_cursor(0, username, 0)
+            payload = {'callback_query': {
+                'id': str(update_id),
+                'from': self._user(chat_id),
+                'chat_instance': str(chat_id),
+                'data': data,
+                'message': self._message(update_id, chat_id, "список"),
+            }}
+
+        return Update.model_validate({'update_id': update_id, **payload}, context={"bot": self.bot})
+
+    def _user(self, chat_id: int) -> Dict:
+        return {'id': chat_id, 'is_bot': False, 'first_name': f"user{chat_id}"}
+
+    def _message(self, message_id: int, chat_id: int, text: str) -> Dict:
+        return {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': self._user(chat_id),
+            'text': text,
+        }
+
+
+def update_kind(update: Update) -> str:
+    """Определяет тип обновления для группировки задержек"""
+    if update.message:
+        text = update.message.text or ""
+        return text.split()[0] if text.startswith("/") else "echo"
+    if update.callback_query:
+        return (update.callback_query.data or "").split("_")[0].split(":")[0]
+    return update.event_type
+
+
+def percentile(ordered: List[float], fraction: float) -> float:
+    """Получает перцентиль уже отсортированного списка"""
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+
+
+async def run_load(dp, bot: Bot, updates: List[Update], concurrency: int) -> Dict:
+    """Подает обновления в диспетчер с заданной конкурентностью и собирает задержки"""
+    latencies: Dict[str, List[float]] = collections.defaultdict(list)
+    errors = 0
+    queue: asyncio.Queue = asyncio.Queue()
+    for update in updates:
+        queue.put_nowait(update)
+
+    async def worker():
+        nonlocal errors
+        while not queue.empty():
+            update = queue.get_nowait()
+            started = time.perf_counter()
+            try:
+                await dp.feed_update(bot, update)
+            except Exception:
+                errors += 1
+            latencies[update_kind(update)].append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    all_latencies = sorted(itertools.chain.from_iterable(latencies.values()))
+    report = {
+        'updates': len(updates),
+        'concurrency': concurrency,
+        'errors': errors,
+        'elapsed_s': elapsed,
+        'throughput_ups': len(updates) / elapsed if elapsed else 0.0,
+        'handlers': {},
+    }
+    for kind, values in sorted(latencies.items()) + [("all", all_latencies)]:
+        ordered = sorted(values)
+        report['handlers'][kind] = {
+            'count': len(ordered),
+            'p50_ms': percentile(ordered, 0.50) * 1000,
+            'p95_ms': percentile(ordered, 0.95) * 1000,
+            'p99_ms': percentile(ordered, 0.99) * 1000,
+        }
+    return report
+
+
+def print_report(report: Dict, calls: Dict[str, int]):
+    """Печатает результаты нагрузочного теста"""
+    print(f"Обновлений: {report['updates']}, конкурентность: {report['concurrency']}, ошибок: {report['errors']}")
+    print(f"Время: {report['elapsed_s']:.2f} с, пропускная способность: {report['throughput_ups']:.1f} обновлений/с\n")
+    print(f"{'обработчик':<16} {'кол-во':>8} {'p50, мс':>10} {'p95, мс':>10} {'p99, мс':>10}")
+    for kind, stats in report['handlers'].items():
+        print(f"{kind:<16} {stats['count']:>8} {stats['p50_ms']:>10.2f} {stats['p95_ms']:>10.2f} {stats['p99_ms']:>10.2f}")
+    print("\nВызовы Telegram API: " + ", ".join(f"{name}={count}" for name, count in sorted(calls.items())))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест диспетчера бота")
+    parser.add_argument("--updates", type=int, default=2000, help="Количество синтетических обновлений")
+    parser.add_argument("--replay", help="Файл с записанными Update в формате JSON lines")
+    parser.add_argument("--concurrency", type=int, default=20, help="Одновременно обрабатываемых обновлений")
+    parser.add_argument("--profiles", type=int, default=10000, help="Количество синтетических профилей")
+    parser.add_argument("--chats", type=int, default=50, help="Количество разных чатов")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="Имитация задержки Telegram API, секунды")
+    parser.add_argument("--seed", type=int, default=1, help="Seed генератора обновлений")
+    parser.add_argument("--throttle", action="store_true",
+                        help="Не отключать ограничение частоты запросов (настройки THROTTLE_* из окружения)")
+    parser.add_argument("--output", help="Файл для сохранения результатов в JSON")
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="ovpn-load-")
+    try:
+        paths = create_environment(root, args.profiles)
+        os.environ.update({
+            'BOT_TOKEN': "123456:LOAD-TEST-TOKEN-000000000000000000",
+            'OVPN_DIR': paths['ovpn_dir'],
+            'EASY_RSA_DIR': paths['easy_rsa_dir'],
+            'CLIENT_COMMON_PATH': paths['client_common_path'],
+            'BOT_DATA_DIR': os.path.join(root, "data"),
+        })
+        if not args.throttle:
+            # Синтетическая нагрузка от нескольких чатов сразу исчерпала бы бюджеты ограничителя
+            for command_class in ("EXPENSIVE", "CHEAP"):
+                os.environ[f'THROTTLE_{command_class}_PER_MINUTE'] = "1000000"
+                os.environ[f'THROTTLE_{command_class}_BURST'] = "1000000"
+                os.environ[f'THROTTLE_{command_class}_MAX_IN_FLIGHT'] = "1000000"
+
+        # main.py читает окружение при импорте, поэтому импортируется после его подготовки
+        import main as bot_main
+        logging.getLogger().setLevel(logging.WARNING)
+
+        session = FakeTelegramSession(args.api_latency)
+        bot = Bot(token=os.environ['BOT_TOKEN'], session=session)
+        file_service = bot_main.service_manager.get_file_service()
+
+        if args.replay:
+            with open(args.replay, 'r') as replay_file:
+                updates = [Update.model_validate(json.loads(line), context={"bot": bot})
+                           for line in replay_file if line.strip()]
+        else:
+            usernames = [f"user{number:06d}" for number in range(args.profiles)]
+            factory = UpdateFactory(bot, usernames, args.chats, DEFAULT_MIX, args.seed)
+            updates = [factory.create(file_service) for _ in range(args.updates)]
+
+        report = asyncio.run(run_load(bot_main.dp, bot, updates, args.concurrency))
+        report['timestamp'] = datetime.datetime.now().isoformat(timespec='seconds')
+        report['api_latency_s'] = args.api_latency
+        report['profiles'] = args.profiles
+        report['api_calls'] = dict(session.calls)
+
+        print_report(report, session.calls)
+        if args.output:
+            with open(args.output, 'w') as output_file:
+                json.dump(report, output_file, ensure_ascii=False, indent=2)
+            print(f"\nРезультаты сохранены в {args.output}", file=sys.stderr)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
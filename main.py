@@ -1,11 +1,26 @@
 import asyncio
 import logging
+from typing import Optional
 from aiogram import Bot, Dispatcher, types
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import Command
-from aiogram.types import Message, FSInputFile, CallbackQuery
+from aiogram.types import (
+    Message, FSInputFile, CallbackQuery, BufferedInputFile, InlineQuery,
+    InlineQueryResultArticle, InlineQueryResultCachedDocument, InputTextMessageContent
+)
 from dotenv import load_dotenv
 from services.service_manager import ServiceManager
+from services.file_service import FileService
+from services.instance_service import VpnInstance
+from services.job_service import CertificateJob, STAGE_DONE, STAGE_FAILED
+from services.webhook_server import WebhookServer
+from middlewares.metrics_middleware import MetricsMiddleware
+from middlewares.throttling_middleware import ThrottlingMiddleware, ThrottleBudget, CLASS_EXPENSIVE, CLASS_CHEAP
 import os
+import secrets
+import signal
+import time
+import hashlib
 
 # Загружаем переменные окружения
 load_dotenv()
@@ -19,6 +34,24 @@ BOT_TOKEN = os.getenv('BOT_TOKEN')
 if not BOT_TOKEN:
     raise ValueError("BOT_TOKEN не найден в переменных окружения!")
 
+# Количество потоков для пересборки профилей
+PROFILE_REGEN_WORKERS = int(os.getenv('PROFILE_REGEN_WORKERS', '4'))
+
+# Telegram ID администраторов через запятую; если не заданы, администраторами считаются все
+ADMIN_IDS = {int(admin_id) for admin_id in os.getenv('ADMIN_IDS', '').replace(' ', '').split(',') if admin_id}
+
+# Ограничение Telegram на размер отправляемого ботом файла
+TELEGRAM_UPLOAD_LIMIT = 50 * 1024 * 1024
+
+# Максимальное количество результатов inline-поиска
+INLINE_QUERY_LIMIT = 20
+
+# Параметры пакетного создания пользователей
+BULK_CREATE_PARALLELISM = int(os.getenv('BULK_CREATE_PARALLELISM', '2'))
+BULK_CREATE_MAX_USERS = int(os.getenv('BULK_CREATE_MAX_USERS', '200'))
+BULK_CREATE_MAX_FILE_SIZE = 1024 * 1024
+BULK_PROGRESS_INTERVAL = 2.0
+
 # Создаем экземпляры бота и диспетчера
 bot = Bot(token=BOT_TOKEN)
 dp = Dispatcher()
@@ -26,6 +59,42 @@ dp = Dispatcher()
 # Создаем менеджер сервисов
 service_manager = ServiceManager()
 
+# Подключаем сбор метрик обработчиков
+metrics_middleware = MetricsMiddleware(service_manager.get_metrics_service())
+dp.message.middleware(metrics_middleware)
+dp.callback_query.middleware(metrics_middleware)
+dp.inline_query.middleware(metrics_middleware)
+
+# Ограничиваем частоту запросов каждого чата; дорогие команды (выпуск, экспорт, списки) имеют отдельный бюджет
+throttling_middleware = ThrottlingMiddleware(
+    {
+        CLASS_EXPENSIVE: ThrottleBudget(
+            per_minute=float(os.getenv('THROTTLE_EXPENSIVE_PER_MINUTE', '10')),
+            burst=int(os.getenv('THROTTLE_EXPENSIVE_BURST', '5')),
+            max_in_flight=int(os.getenv('THROTTLE_EXPENSIVE_MAX_IN_FLIGHT', '8'))
+        ),
+        CLASS_CHEAP: ThrottleBudget(
+            per_minute=float(os.getenv('THROTTLE_CHEAP_PER_MINUTE', '60')),
+            burst=int(os.getenv('THROTTLE_CHEAP_BURST', '20')),
+            max_in_flight=int(os.getenv('THROTTLE_CHEAP_MAX_IN_FLIGHT', '64'))
+        ),
+    },
+    service_manager.get_metrics_service()
+)
+dp.message.middleware(throttling_middleware)
+dp.callback_query.middleware(throttling_middleware)
+dp.inline_query.middleware(throttling_middleware)
+
+# Проверка прав администратора
+def is_admin(user_id: int) -> bool:
+    return not ADMIN_IDS or user_id in ADMIN_IDS
+
+# Запись события в журнал аудита (без ожидания диска)
+def audit(actor: Optional[types.User], action: str, username: str = "", success: bool = True, **details):
+    if actor and actor.username:
+        details['actor_name'] = actor.username
+    service_manager.get_audit_service().log(action, actor.id if actor else None, username, success, **details)
+
 # Обработчик команды /start
 @dp.message(Command("start"))
 async def cmd_start(message: Message):
@@ -43,7 +112,26 @@ async def cmd_help(message: Message):
         "/help - Показать это сообщение\n"
         "/info - Информация о сервере\n"
         "/create_user имя - Создать нового пользователя OpenVPN\n"
+        "/create_users имена - Создать нескольких пользователей (или приложите .txt/.csv файл)\n"
         "/get_all_users - Получить список всех пользователей и их .ovpn файлы\n"
+        "/export [префикс] - Скачать ZIP архив всех (или найденных по префиксу) конфигураций\n"
+        "/find префикс - Найти пользователя по началу имени\n"
+        "/regenerate_profiles [force] - Пересобрать .ovpn файлы после изменения client-common.txt\n"
+        "/revoke_user имя - Отозвать сертификат пользователя (для администраторов)\n"
+        "/revoke_users имя1 имя2 ... - Отозвать сертификаты нескольких пользователей\n"
+        "/expiring [дни] - Сертификаты, истекающие в ближайшие дни (по умолчанию 30)\n"
+        "/jobs - Состояние очереди создания пользователей\n"
+        "/online - Подключенные сейчас клиенты\n"
+        "/top [период] - Пользователи с наибольшим трафиком (например, /top 7d)\n"
+        "/traffic имя [период] - История трафика пользователя\n"
+        "/stats - Статистика работы бота (для администраторов)\n"
+        "/audit [имя] - Журнал действий с профилями (для администраторов)\n"
+        "/pool - Состояние пула заранее сгенерированных ключей\n"
+        + (
+            "\nСервер указывается перед именем пользователя: сервер:имя (без него - первый сервер).\n"
+            f"Серверы: {', '.join(instance.name for instance in service_manager.get_instance_service().instances)}\n"
+            if service_manager.get_instance_service().multiple else ""
+        )
     )
 
 # Обработчик команды /info
@@ -54,7 +142,7 @@ async def cmd_info(message: Message):
     await message.answer(server_info, parse_mode="Markdown")
 
 # Обработчик команды /create_user
-@dp.message(Command("create_user"))
+@dp.message(Command("create_user"), flags={"throttling": CLASS_EXPENSIVE})
 async def cmd_create_user(message: Message):
     # Извлекаем имя пользователя из команды
     command_parts = message.text.split()
@@ -67,28 +155,226 @@ async def cmd_create_user(message: Message):
         )
         return
     
-    username = command_parts[1].strip()
+    instance, username = service_manager.get_instance_service().resolve(command_parts[1].strip())
+    if instance is None:
+        await message.answer("❌ **Ошибка:** Сервер не настроен", parse_mode="Markdown")
+        return
     
     try:
         # Отправляем сообщение о начале процесса
         status_msg = await message.answer("⏳ Создаю пользователя...")
         
-        # Используем сервис для создания пользователя
-        user_service = service_manager.get_user_service()
-        success, message_text = user_service.create_user(username)
+        # Ставим выпуск сертификата в очередь сервера, чтобы не блокировать бота
+        success, job, error_message = instance.job_service.submit(
+            username,
+            on_progress=lambda job: update_job_status(status_msg, job),
+            created_by=message.from_user.id
+        )
+        
+        if not success:
+            audit(message.from_user, "create", instance.qualify(username), False, error=error_message)
+            await status_msg.edit_text(
+                f"❌ **Ошибка при создании пользователя:**\n\n"
+                f"**Детали:** `{error_message}`",
+                parse_mode="Markdown"
+            )
+            return
+        
+        # Задача, прерванная остановкой бота, тоже завершается результатом (с ошибкой)
+        job.done.add_done_callback(
+            lambda done: audit(message.from_user, "create", instance.qualify(username), done.result()[0], job=job.job_id)
+        )
+        await update_job_status(status_msg, job)
+            
+    except Exception as e:
+        await message.answer(
+            f"❌ **Ошибка выполнения команды:**\n\n`{str(e)}`",
+            parse_mode="Markdown"
+        )
+
+# Функция для отображения хода выполнения задачи создания пользователя
+async def update_job_status(status_msg: Message, job: CertificateJob):
+    if job.stage == STAGE_DONE:
+        await status_msg.edit_text(
+            f"✅ **{job.message}**\n\n"
+            f"👤 **Имя пользователя:** `{job.username}`\n"
+            f"📁 **Файл конфигурации:** `{job.username}.ovpn`\n"
+            f"🆔 **Задача:** `{job.job_id}`\n\n"
+            f"Файл конфигурации сохранен в рабочей директории сервера.",
+            parse_mode="Markdown"
+        )
+    elif job.stage == STAGE_FAILED:
+        await status_msg.edit_text(
+            f"❌ **Ошибка при создании пользователя:**\n\n"
+            f"**Детали:** `{job.message}`",
+            parse_mode="Markdown"
+        )
+    else:
+        await status_msg.edit_text(
+            f"⏳ **Создаю пользователя** `{job.username}`\n\n"
+            f"🆔 **Задача:** `{job.job_id}`\n"
+            f"🔄 **Этап:** {job.stage_title}",
+            parse_mode="Markdown"
+        )
+
+# Обработчик команды /create_users
+@dp.message(Command("create_users"), flags={"throttling": CLASS_EXPENSIVE})
+async def cmd_create_users(message: Message):
+    instance_service = service_manager.get_instance_service()
+    
+    try:
+        # Имена берутся из приложенного (или процитированного) файла либо из текста команды
+        document = message.document
+        if not document and message.reply_to_message:
+            document = message.reply_to_message.document
+        
+        if document:
+            if document.file_size and document.file_size > BULK_CREATE_MAX_FILE_SIZE:
+                await message.answer("❌ **Ошибка:** Файл со списком пользователей слишком большой", parse_mode="Markdown")
+                return
+            buffer = await bot.download(document)
+            text = buffer.read().decode('utf-8-sig', errors='replace')
+            csv_format = (document.file_name or '').lower().endswith('.csv')
+        else:
+            command_parts = (message.text or message.caption or '').split(maxsplit=1)
+            text = command_parts[1] if len(command_parts) > 1 else ''
+            csv_format = False
+        
+        groups, invalid_usernames = instance_service.parse_usernames(text, csv_format)
+        total = sum(len(usernames) for _, usernames in groups)
+        
+        if invalid_usernames:
+            await message.answer(
+                "❌ **Ошибка:** Некорректные имена пользователей:\n"
+                + "\n".join(f"• `{name}`" for name in invalid_usernames[:50])
+                + "\n\nИмя может содержать только буквы, цифры, дефисы и подчеркивания "
+                "(и сервер перед двоеточием).",
+                parse_mode="Markdown"
+            )
+            return
+        
+        if not total:
+            await message.answer(
+                "❌ **Ошибка:** Укажите имена пользователей!\n\n"
+                "**Использование:** `/create_users имя1 имя2 имя3`\n"
+                "или отправьте .txt/.csv файл с подписью `/create_users`",
+                parse_mode="Markdown"
+            )
+            return
+        
+        if total > BULK_CREATE_MAX_USERS:
+            await message.answer(
+                f"❌ **Ошибка:** За один раз можно создать не более {BULK_CREATE_MAX_USERS} пользователей",
+                parse_mode="Markdown"
+            )
+            return
+        
+        status_msg = await message.answer(f"⏳ Создаю пользователей: 0/{total}")
+        last_update = time.monotonic()
+        
+        # Обновляем общее сообщение о прогрессе не чаще раза в BULK_PROGRESS_INTERVAL секунд
+        async def on_progress(completed: int, failed: int, total: int):
+            nonlocal last_update
+            now = time.monotonic()
+            if completed < total and now - last_update < BULK_PROGRESS_INTERVAL:
+                return
+            last_update = now
+            await status_msg.edit_text(
+                f"⏳ Создаю пользователей: {completed}/{total}\n"
+                f"❌ Ошибок: {failed}"
+            )
+        
+        # Серверы выпускают сертификаты одновременно, каждый своим пулом воркеров
+        results = await instance_service.run_bulk(groups, BULK_CREATE_PARALLELISM, on_progress,
+                                                  created_by=message.from_user.id)
+        for username, success, _ in results:
+            audit(message.from_user, "create", username, success, bulk=True)
+        await send_bulk_create_results(message, results)
+        
+    except Exception as e:
+        await message.answer(
+            f"❌ **Ошибка выполнения команды:**\n\n`{str(e)}`",
+            parse_mode="Markdown"
+        )
+
+# Функция для отправки итогов пакетного создания пользователей
+async def send_bulk_create_results(message: Message, results: list):
+    instance_service = service_manager.get_instance_service()
+    file_service = service_manager.get_file_service()
+    
+    created = [username for username, success, _ in results if success]
+    summary = (
+        f"📋 **Итоги создания пользователей**\n\n"
+        f"✅ **Создано:** {len(created)}\n"
+        f"❌ **С ошибкой:** {len(results) - len(created)}\n\n"
+    )
+    details = "\n".join(
+        f"✅ {username}" if success else f"❌ {username}: {message_text}"
+        for username, success, message_text in results
+    )
+    
+    # Подробности в Markdown не экранируются, поэтому длинный отчет отправляется файлом
+    if len(summary) + len(details) < 3500:
+        await message.answer(summary + f"```\n{details}\n```", parse_mode="Markdown")
+    else:
+        await message.answer(summary, parse_mode="Markdown")
+        await message.answer_document(
+            document=BufferedInputFile(details.encode(), filename="create_users_report.txt")
+        )
+    
+    file_paths, arcnames = [], []
+    for qualified_name in created:
+        instance, username = instance_service.resolve(qualified_name)
+        success, file_path, _ = instance.user_service.get_user_file(username)
+        if success:
+            file_paths.append(file_path)
+            arcnames.append(instance.archive_name(username))
+    
+    if file_paths:
+        bundle = await asyncio.to_thread(file_service.create_zip_bundle, file_paths, arcnames)
+        await message.answer_document(
+            document=BufferedInputFile(bundle, filename="ovpn_profiles.zip"),
+            caption=f"📦 Конфигурации OpenVPN: {len(file_paths)} шт."
+        )
+
+# Обработчик команды /revoke_user
+@dp.message(Command("revoke_user"), flags={"throttling": CLASS_EXPENSIVE})
+async def cmd_revoke_user(message: Message):
+    if not message.from_user or not is_admin(message.from_user.id):
+        await message.answer("❌ Команда доступна только администраторам")
+        return
+    
+    command_parts = message.text.split()
+    if len(command_parts) < 2:
+        await message.answer(
+            "❌ **Ошибка:** Укажите имя пользователя!\n\n"
+            "**Использование:** `/revoke_user имя_пользователя`",
+            parse_mode="Markdown"
+        )
+        return
+    
+    instance, username = service_manager.get_instance_service().resolve(command_parts[1].strip())
+    if instance is None:
+        await message.answer("❌ **Ошибка:** Сервер не настроен", parse_mode="Markdown")
+        return
+    
+    try:
+        status_msg = await message.answer("⏳ Отзываю сертификат...")
+        
+        success, result_message = await instance.user_service.revoke_user_async(username)
+        await instance.file_id_cache.invalidate(username)
+        audit(message.from_user, "revoke", instance.qualify(username), success)
         
         if success:
             await status_msg.edit_text(
-                f"✅ **{message_text}**\n\n"
-                f"👤 **Имя пользователя:** `{username}`\n"
-                f"📁 **Файл конфигурации:** `{username}.ovpn`\n\n"
-                f"Файл конфигурации сохранен в рабочей директории сервера.",
+                f"✅ **{result_message}**\n\n"
+                f"Сертификат добавлен в CRL, файл `{username}.ovpn` удален.",
                 parse_mode="Markdown"
             )
         else:
             await status_msg.edit_text(
-                f"❌ **Ошибка при создании пользователя:**\n\n"
-                f"**Детали:** `{message_text}`",
+                f"❌ **Ошибка при отзыве пользователя:**\n\n"
+                f"**Детали:** `{result_message}`",
                 parse_mode="Markdown"
             )
             
@@ -98,24 +384,327 @@ async def cmd_create_user(message: Message):
             parse_mode="Markdown"
         )
 
+# Обработчик команды /revoke_users
+@dp.message(Command("revoke_users"), flags={"throttling": CLASS_EXPENSIVE})
+async def cmd_revoke_users(message: Message):
+    if not message.from_user or not is_admin(message.from_user.id):
+        await message.answer("❌ Команда доступна только администраторам")
+        return
+    
+    instance_service = service_manager.get_instance_service()
+    command_parts = message.text.split(maxsplit=1)
+    groups, invalid_usernames = instance_service.parse_usernames(command_parts[1] if len(command_parts) > 1 else '')
+    total = sum(len(usernames) for _, usernames in groups)
+    
+    if invalid_usernames or not total:
+        await message.answer(
+            "❌ **Ошибка:** Укажите корректные имена пользователей!\n\n"
+            "**Использование:** `/revoke_users имя1 имя2 имя3`",
+            parse_mode="Markdown"
+        )
+        return
+    
+    try:
+        status_msg = await message.answer(f"⏳ Отзываю сертификаты: {total} шт.")
+        
+        results, crl_success, crl_message = await instance_service.revoke_users(groups)
+        for qualified_name, success, _ in results:
+            instance, username = instance_service.resolve(qualified_name)
+            await instance.file_id_cache.invalidate(username)
+            audit(message.from_user, "revoke", qualified_name, success, bulk=True)
+        
+        revoked = sum(1 for _, success, _ in results if success)
+        details = "\n".join(
+            f"✅ {username}" if success else f"❌ {username}: {message_text}"
+            for username, success, message_text in results
+        )
+        summary = (
+            f"📋 **Итоги отзыва сертификатов**\n\n"
+            f"✅ **Отозвано:** {revoked}\n"
+            f"❌ **С ошибкой:** {len(results) - revoked}\n"
+            + ("" if crl_success else f"⚠️ **CRL не обновлен:** `{crl_message}`\n")
+        )
+        await status_msg.edit_text(summary + f"\n```\n{details[:3000]}\n```", parse_mode="Markdown")
+        
+    except Exception as e:
+        await message.answer(
+            f"❌ **Ошибка выполнения команды:**\n\n`{str(e)}`",
+            parse_mode="Markdown"
+        )
+
+# Обработчик команды /export
+@dp.message(Command("export"), flags={"throttling": CLASS_EXPENSIVE})
+async def cmd_export(message: Message):
+    # Архив содержит приватные ключи всех пользователей
+    if not message.from_user or not is_admin(message.from_user.id):
+        await message.answer("❌ Команда доступна только администраторам")
+        return
+    
+    command_parts = message.text.split()
+    prefix = command_parts[1] if len(command_parts) > 1 else ""
+    
+    instance_service = service_manager.get_instance_service()
+    file_service = service_manager.get_file_service()
+    file_id_cache = service_manager.get_file_id_cache()
+    
+    try:
+        # Без сервера в префиксе (udp:al) архив собирается со всех серверов
+        if prefix:
+            success, users, _, _, error_message = await instance_service.find_users(
+                prefix, await instance_service.count_users()
+            )
+        else:
+            success, users, error_message = await instance_service.get_all_users()
+        
+        if not success:
+            await message.answer(f"❌ **Ошибка:** {error_message}", parse_mode="Markdown")
+            return
+        
+        if not users:
+            await message.answer("📭 Нет конфигураций для экспорта")
+            return
+        
+        status_msg = await message.answer(f"⏳ Собираю архив: {len(users)} конфигураций...")
+        zip_path, archive_key, _ = await asyncio.to_thread(
+            file_service.export_zip, [user.file_path for user in users], [user.archive_name for user in users]
+        )
+        
+        try:
+            if os.path.getsize(zip_path) > TELEGRAM_UPLOAD_LIMIT:
+                await status_msg.edit_text("❌ Архив больше 50 МБ, уточните префикс")
+                return
+            
+            caption = f"📦 Конфигурации OpenVPN: {len(users)} шт."
+            cache_key = f"export:{archive_key}"
+            
+            # Неизменившийся архив отправляется без повторной загрузки
+            file_id = file_id_cache.get(cache_key, zip_path)
+            if file_id:
+                try:
+                    await message.answer_document(document=file_id, caption=caption)
+                    audit(message.from_user, "export", count=len(users), prefix=prefix)
+                    await status_msg.delete()
+                    return
+                except TelegramBadRequest:
+                    await file_id_cache.invalidate(cache_key)
+            
+            filename = f"ovpn_profiles_{prefix.replace(':', '_')}.zip" if prefix else "ovpn_profiles.zip"
+            sent_message = await message.answer_document(document=FSInputFile(zip_path, filename=filename), caption=caption)
+            if sent_message.document:
+                await file_id_cache.put(cache_key, zip_path, sent_message.document.file_id)
+            audit(message.from_user, "export", count=len(users), prefix=prefix)
+            await status_msg.delete()
+        finally:
+            file_service.release_export(zip_path)
+        
+    except Exception as e:
+        await message.answer(
+            f"❌ **Ошибка выполнения команды:**\n\n`{str(e)}`",
+            parse_mode="Markdown"
+        )
+
+# Обработчик команды /expiring
+@dp.message(Command("expiring"))
+async def cmd_expiring(message: Message):
+    command_parts = message.text.split()
+    days = int(command_parts[1]) if len(command_parts) > 1 and command_parts[1].isdigit() else 30
+    
+    success, records, error_message = await service_manager.get_instance_service().get_expiring_certificates(days)
+    if not success:
+        await message.answer(f"❌ **Ошибка:** {error_message}", parse_mode="Markdown")
+        return
+    
+    if not records:
+        await message.answer(f"✅ В ближайшие {days} дн. сертификаты не истекают")
+        return
+    
+    now = time.time()
+    text = f"⏳ **Сертификаты, истекающие в ближайшие {days} дн.:** {len(records)}\n\n"
+    for instance, record in records[:50]:
+        expires = time.strftime('%d.%m.%Y', time.localtime(record.expires_at))
+        days_left = int((record.expires_at - now) // 86400)
+        state = f"осталось {days_left} дн." if days_left >= 0 else "истек"
+        text += f"• `{instance.qualify(record.common_name)}` — {expires} ({state})\n"
+    if len(records) > 50:
+        text += f"\n... и еще {len(records) - 50}"
+    await message.answer(text, parse_mode="Markdown")
+
+# Обработчик команды /regenerate_profiles
+@dp.message(Command("regenerate_profiles"), flags={"throttling": CLASS_EXPENSIVE})
+async def cmd_regenerate_profiles(message: Message):
+    force = message.text.split()[1:2] == ["force"]
+    
+    try:
+        status_msg = await message.answer("⏳ Пересобираю профили...")
+        
+        # Профили всех серверов пересобираются одновременно
+        instance_service = service_manager.get_instance_service()
+        results = await instance_service.gather(
+            lambda instance: instance.user_service.regenerate_profiles(force, PROFILE_REGEN_WORKERS)
+        )
+        results_by_instance = dict(zip((instance.name for instance in instance_service.instances), results))
+        
+        await status_msg.edit_text(
+            instance_service.format_per_instance(
+                lambda instance: format_regeneration_result(*results_by_instance[instance.name], force)
+            ),
+            parse_mode="Markdown"
+        )
+        
+    except Exception as e:
+        await message.answer(
+            f"❌ **Ошибка выполнения команды:**\n\n`{str(e)}`",
+            parse_mode="Markdown"
+        )
+
+# Функция для форматирования итогов пересборки профилей одного сервера
+def format_regeneration_result(success: bool, stats: dict, error_message: str, force: bool) -> str:
+    if not success:
+        return f"❌ **Ошибка:** {error_message}"
+    
+    if not stats['template_changed'] and not force:
+        return (
+            "ℹ️ **client-common.txt не изменился**\n\n"
+            "Профили актуальны. Используйте `/regenerate_profiles force` для принудительной пересборки."
+        )
+    
+    text = (
+        "✅ **Пересборка профилей завершена**\n\n"
+        f"📁 **Всего профилей:** {stats['total']}\n"
+        f"🔄 **Пересобрано:** {stats['rebuilt']}\n"
+        f"⏭ **Без изменений:** {stats['unchanged']}\n"
+        f"❌ **С ошибкой:** {stats['failed']}\n"
+        f"⏱ **Время:** {stats['elapsed']:.2f} с ({stats['throughput']:.0f} профилей/с)"
+    )
+    if stats['errors']:
+        text += "\n\n**Ошибки:**\n```\n" + "\n".join(
+            f"{username}: {error}" for username, error in stats['errors'][:10]
+        ) + "\n```"
+    return text
+
+# Обработчик команды /jobs
+@dp.message(Command("jobs"))
+async def cmd_jobs(message: Message):
+    instance_service = service_manager.get_instance_service()
+    await message.answer(
+        instance_service.format_per_instance(lambda instance: instance.job_service.format_stats()),
+        parse_mode="Markdown"
+    )
+
+# Обработчик команды /pool
+@dp.message(Command("pool"))
+async def cmd_pool(message: Message):
+    instance_service = service_manager.get_instance_service()
+    await message.answer(
+        instance_service.format_per_instance(lambda instance: instance.key_pool_service.format_stats()),
+        parse_mode="Markdown"
+    )
+
+# Обработчик команды /online
+@dp.message(Command("online"))
+async def cmd_online(message: Message):
+    instance_service = service_manager.get_instance_service()
+    await message.answer(
+        instance_service.format_per_instance(lambda instance: instance.status_service.format_online()),
+        parse_mode="Markdown"
+    )
+
+# Обработчик команды /top
+@dp.message(Command("top"))
+async def cmd_top(message: Message):
+    command_parts = message.text.split()
+    traffic_service = service_manager.get_traffic_service()
+    period = traffic_service.parse_period(command_parts[1] if len(command_parts) > 1 else "")
+    if period is None:
+        await message.answer("❌ Укажите период в формате 30m, 24h или 7d (не больше 90d)")
+        return
+    
+    seconds, period_title = period
+    instance_service = service_manager.get_instance_service()
+    await message.answer(
+        instance_service.format_per_instance(lambda instance: instance.traffic_service.format_top(seconds, period_title)),
+        parse_mode="Markdown"
+    )
+
+# Обработчик команды /traffic
+@dp.message(Command("traffic"))
+async def cmd_traffic(message: Message):
+    command_parts = message.text.split()
+    if len(command_parts) < 2:
+        await message.answer("❌ Укажите имя пользователя: /traffic имя [период]")
+        return
+    
+    traffic_service = service_manager.get_traffic_service()
+    period = traffic_service.parse_period(command_parts[2] if len(command_parts) > 2 else "")
+    if period is None:
+        await message.answer("❌ Укажите период в формате 30m, 24h или 7d (не больше 90d)")
+        return
+    
+    instance, username = service_manager.get_instance_service().resolve(command_parts[1])
+    if instance is None:
+        await message.answer("❌ **Ошибка:** Сервер не настроен", parse_mode="Markdown")
+        return
+    
+    seconds, period_title = period
+    await message.answer(
+        instance.traffic_service.format_traffic(username, seconds, period_title),
+        parse_mode="Markdown"
+    )
+
+# Обработчик команды /stats
+@dp.message(Command("stats"))
+async def cmd_stats(message: Message):
+    if not message.from_user or not is_admin(message.from_user.id):
+        await message.answer("❌ Команда доступна только администраторам")
+        return
+    
+    metrics_service = service_manager.get_metrics_service()
+    instance_service = service_manager.get_instance_service()
+    await message.answer(
+        metrics_service.format_stats() + "\n\n"
+        + instance_service.format_per_instance(lambda instance: instance.job_service.format_stats()),
+        parse_mode="Markdown"
+    )
+
+# Обработчик команды /audit
+@dp.message(Command("audit"))
+async def cmd_audit(message: Message):
+    if not message.from_user or not is_admin(message.from_user.id):
+        await message.answer("❌ Команда доступна только администраторам")
+        return
+    
+    command_parts = message.text.split()
+    username = command_parts[1] if len(command_parts) > 1 else None
+    
+    audit_service = service_manager.get_audit_service()
+    try:
+        events = await audit_service.get_events(username)
+        await message.answer(audit_service.format_events(events, username), parse_mode="Markdown")
+    except Exception as e:
+        await message.answer(
+            f"❌ **Ошибка выполнения команды:**\n\n`{str(e)}`",
+            parse_mode="Markdown"
+        )
+
 # Обработчик команды /get_all_users
-@dp.message(Command("get_all_users"))
+@dp.message(Command("get_all_users"), flags={"throttling": CLASS_EXPENSIVE})
 async def cmd_get_all_users(message: Message):
     try:
-        # Используем сервис для получения списка пользователей
-        user_service = service_manager.get_user_service()
-        success, users, error_message = user_service.get_all_users()
+        # Первая страница общего списка всех серверов
+        instance_service = service_manager.get_instance_service()
+        file_service = service_manager.get_file_service()
+        success, page, error_message = await instance_service.get_users_page(file_service.files_per_page)
         
         if not success:
             await message.answer(f"❌ **Ошибка:** {error_message}")
             return
         
-        if not users:
+        if not page['total']:
             await message.answer("📁 **Список пользователей пуст**\n\nПока нет созданных .ovpn файлов.")
             return
         
         # Показываем первую страницу
-        await show_users_page(message, users, 0)
+        await show_users_page(message, page)
                 
     except Exception as e:
         await message.answer(
@@ -123,17 +712,101 @@ async def cmd_get_all_users(message: Message):
             parse_mode="Markdown"
         )
 
+# Обработчик команды /find
+@dp.message(Command("find"), flags={"throttling": CLASS_EXPENSIVE})
+async def cmd_find(message: Message):
+    command_parts = message.text.split()
+    if len(command_parts) < 2:
+        await message.answer(
+            "❌ **Ошибка:** Укажите начало имени пользователя!\n\n"
+            "**Использование:** `/find префикс`",
+            parse_mode="Markdown"
+        )
+        return
+    
+    prefix = command_parts[1].strip()
+    
+    try:
+        instance_service = service_manager.get_instance_service()
+        file_service = service_manager.get_file_service()
+        success, matches, total_matches, position, error_message = await instance_service.find_users(
+            prefix, file_service.files_per_page
+        )
+        
+        if not success:
+            await message.answer(f"❌ **Ошибка:** {error_message}")
+            return
+        
+        if not total_matches:
+            await message.answer(f"🔍 Пользователи, начинающиеся с `{prefix}`, не найдены", parse_mode="Markdown")
+            return
+        
+        # Единственное совпадение показываем в списке, начиная с него
+        success, page, error_message = await instance_service.get_users_page(
+            file_service.files_per_page, cursor=matches[0].key
+        )
+        if total_matches == 1 and success:
+            await show_users_page(message, page)
+            return
+        
+        await message.answer(
+            file_service.create_search_text(prefix, matches, total_matches),
+            parse_mode="Markdown",
+            reply_markup=file_service.create_search_keyboard(matches, position, page.get('version', 0))
+        )
+        
+    except Exception as e:
+        await message.answer(
+            f"❌ **Ошибка при поиске пользователей:**\n\n`{str(e)}`",
+            parse_mode="Markdown"
+        )
+
+# Обработчик inline-запросов для поиска пользователей
+@dp.inline_query(flags={"throttling": CLASS_EXPENSIVE})
+async def process_inline_query(inline_query: InlineQuery):
+    # Результаты inline-запроса можно отправить в любой чат, поэтому профили выдаются только администраторам
+    if not is_admin(inline_query.from_user.id):
+        await inline_query.answer([], cache_time=5, is_personal=True)
+        return
+    
+    instance_service = service_manager.get_instance_service()
+    
+    prefix = inline_query.query.strip()
+    success, matches, _, _, _ = await instance_service.find_users(prefix, INLINE_QUERY_LIMIT)
+    
+    results = []
+    for file_info in matches if success else []:
+        username = file_info.key
+        result_id = hashlib.md5(username.encode()).hexdigest()
+        
+        # Уже загруженные файлы отдаем сразу документом, остальные - командой поиска
+        file_id_cache = instance_service.get(file_info.instance).file_id_cache
+        file_id = file_id_cache.get(file_info.username, file_info.file_path)
+        if file_id:
+            results.append(InlineQueryResultCachedDocument(
+                id=result_id,
+                title=f"{username}.ovpn",
+                document_file_id=file_id,
+                caption=f"📁 {username} - Конфигурация OpenVPN"
+            ))
+        else:
+            results.append(InlineQueryResultArticle(
+                id=result_id,
+                title=username,
+                description=f"{file_info.size_kb:.1f} KB",
+                input_message_content=InputTextMessageContent(message_text=f"/find {username}")
+            ))
+    
+    await inline_query.answer(results, cache_time=5, is_personal=True)
+
 # Функция для отображения страницы пользователей
-async def show_users_page(message: Message, users: list, page: int = 0, edit_message: bool = False):
+async def show_users_page(message: Message, page: dict, edit_message: bool = False):
     try:
         # Используем сервис для работы с файлами
         file_service = service_manager.get_file_service()
         
-        # Создаем текст списка пользователей
-        users_list = file_service.create_files_list_text(users, page)
-        
-        # Создаем клавиатуру с пагинацией
-        keyboard = file_service.create_pagination_keyboard(users, page)
+        # Создаем текст списка пользователей и клавиатуру с пагинацией (из кэша, если страница уже отрисована)
+        users_list, keyboard = file_service.render_page(page)
         
         if edit_message:
             await message.edit_text(users_list, parse_mode="Markdown", reply_markup=keyboard)
@@ -147,28 +820,25 @@ async def show_users_page(message: Message, users: list, page: int = 0, edit_mes
         )
 
 # Обработчик нажатий на кнопки скачивания
-@dp.callback_query(lambda c: c.data.startswith('download_'))
+@dp.callback_query(lambda c: c.data.startswith('download_'), flags={"throttling": CLASS_EXPENSIVE})
 async def process_download_callback(callback_query: CallbackQuery):
     try:
-        # Извлекаем имя пользователя из callback_data
-        username = callback_query.data.replace('download_', '')
+        # Извлекаем полное имя пользователя из callback_data и находим его сервер
+        qualified_name = callback_query.data[len('download_'):]
+        instance, username = service_manager.get_instance_service().resolve(qualified_name)
+        if instance is None:
+            await callback_query.answer("❌ Сервер не настроен", show_alert=True)
+            return
         
-        # Используем сервис для получения файла пользователя
-        user_service = service_manager.get_user_service()
-        success, file_path, error_message = user_service.get_user_file(username)
+        success, file_path, error_message = instance.user_service.get_user_file(username)
         
         if not success:
             await callback_query.answer(f"❌ {error_message}", show_alert=True)
             return
         
-        # Создаем объект файла для отправки
-        file_to_send = FSInputFile(file_path, filename=f"{username}.ovpn")
-        
-        # Отправляем файл
-        await callback_query.message.answer_document(
-            document=file_to_send,
-            caption=f"📁 **{username}** - Конфигурация OpenVPN"
-        )
+        # Отправляем файл, по возможности без повторной загрузки
+        await send_user_file(callback_query.message, instance, username, file_path)
+        audit(callback_query.from_user, "download", qualified_name)
         
         # Подтверждаем нажатие кнопки
         await callback_query.answer(f"✅ Файл {username}.ovpn отправлен!")
@@ -176,8 +846,29 @@ async def process_download_callback(callback_query: CallbackQuery):
     except Exception as e:
         await callback_query.answer(f"❌ Ошибка: {str(e)}", show_alert=True)
 
+# Функция для отправки .ovpn файла с использованием кэша file_id
+async def send_user_file(message: Message, instance: VpnInstance, username: str, file_path: str):
+    file_id_cache = instance.file_id_cache
+    caption = f"📁 **{instance.qualify(username)}** - Конфигурация OpenVPN"
+    
+    file_id = file_id_cache.get(username, file_path)
+    if file_id:
+        try:
+            await message.answer_document(document=file_id, caption=caption)
+            return
+        except TelegramBadRequest:
+            # file_id мог стать недействительным, загружаем файл заново
+            await file_id_cache.invalidate(username)
+    
+    # Создаем объект файла для отправки
+    file_to_send = FSInputFile(file_path, filename=f"{username}.ovpn")
+    sent_message = await message.answer_document(document=file_to_send, caption=caption)
+    
+    if sent_message.document:
+        await file_id_cache.put(username, file_path, sent_message.document.file_id)
+
 # Обработчик нажатий на кнопки пагинации
-@dp.callback_query(lambda c: c.data.startswith('page_'))
+@dp.callback_query(lambda c: c.data.startswith('page_'), flags={"throttling": CLASS_EXPENSIVE})
 async def process_page_callback(callback_query: CallbackQuery):
     try:
         # Извлекаем номер страницы из callback_data
@@ -187,37 +878,110 @@ async def process_page_callback(callback_query: CallbackQuery):
             await callback_query.answer("ℹ️ Информация о текущей странице", show_alert=False)
             return
         
-        page = int(page_data)
-        
-        # Получаем список всех пользователей через сервис
-        user_service = service_manager.get_user_service()
-        success, users, error_message = user_service.get_all_users()
-        
-        if not success:
-            await callback_query.answer(f"❌ {error_message}", show_alert=True)
-            return
+        page_number = int(page_data)
         
-        # Показываем нужную страницу
-        await show_users_page(callback_query.message, users, page, edit_message=True)
+        # Старые кнопки с номером страницы переводим в позицию в текущем снимке
+        await show_cursor_page(callback_query, position=page_number * service_manager.get_file_service().files_per_page)
         
-        # Подтверждаем нажатие кнопки
-        await callback_query.answer(f"📄 Страница {page + 1}")
+    except Exception as e:
+        await callback_query.answer(f"❌ Ошибка: {str(e)}", show_alert=True)
+
+# Обработчик нажатий на кнопки курсорной пагинации
+@dp.callback_query(lambda c: c.data.startswith(FileService.CURSOR_PREFIX), flags={"throttling": CLASS_EXPENSIVE})
+async def process_cursor_callback(callback_query: CallbackQuery):
+    try:
+        # Извлекаем версию снимка и курсор из callback_data
+        file_service = service_manager.get_file_service()
+        version, cursor, position = file_service.decode_cursor(callback_query.data)
+        await show_cursor_page(callback_query, cursor=cursor, position=position, version=version)
         
     except Exception as e:
         await callback_query.answer(f"❌ Ошибка: {str(e)}", show_alert=True)
 
+# Функция для отображения страницы по курсору в ответ на нажатие кнопки
+async def show_cursor_page(callback_query: CallbackQuery, cursor: str = None, position: int = 0, version: int = None):
+    # Получаем нужную страницу общего списка всех серверов
+    instance_service = service_manager.get_instance_service()
+    file_service = service_manager.get_file_service()
+    success, page, error_message = await instance_service.get_users_page(file_service.files_per_page, cursor, position)
+    
+    if not success:
+        await callback_query.answer(f"❌ {error_message}", show_alert=True)
+        return
+    
+    # Показываем нужную страницу
+    await show_users_page(callback_query.message, page, edit_message=True)
+    
+    # Подтверждаем нажатие кнопки
+    current_page = page['position'] // file_service.files_per_page + 1
+    if version is not None and version != page['version']:
+        await callback_query.answer(f"📄 Страница {current_page} (список обновлен)")
+    else:
+        await callback_query.answer(f"📄 Страница {current_page}")
+
 # Обработчик всех остальных сообщений
 @dp.message()
 async def echo_message(message: Message):
     await message.answer(f"Вы написали: {message.text}")
 
 # Основная функция
+async def run_webhook():
+    public_url = os.getenv('WEBHOOK_URL') or None
+    secret_token = os.getenv('WEBHOOK_SECRET')
+    if not secret_token:
+        if public_url:
+            # Webhook регистрируется при каждом запуске, поэтому случайный секрет сразу известен Telegram
+            secret_token = secrets.token_urlsafe(32)
+        elif os.getenv('WEBHOOK_LOCAL') == '1':
+            # Явный локальный режим: обновления принимаются без проверки секрета
+            secret_token = None
+            logging.warning("WEBHOOK_LOCAL=1: секрет webhook не проверяется")
+        else:
+            raise ValueError("Без WEBHOOK_URL задайте WEBHOOK_SECRET (или WEBHOOK_LOCAL=1 для локальной проверки)")
+    
+    webhook_server = WebhookServer(
+        dp, bot,
+        path=os.getenv('WEBHOOK_PATH', '/webhook'),
+        secret_token=secret_token,
+        max_concurrent_updates=int(os.getenv('WEBHOOK_MAX_CONCURRENCY', '32'))
+    )
+    
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signal_number, stop_event.set)
+    
+    await webhook_server.start(
+        os.getenv('WEBHOOK_HOST', '127.0.0.1'),
+        int(os.getenv('WEBHOOK_PORT', '8080')),
+        public_url=public_url
+    )
+    try:
+        await stop_event.wait()
+    finally:
+        await webhook_server.stop(float(os.getenv('WEBHOOK_DRAIN_TIMEOUT', '30')))
+        # Polling закрывает сессию сам, здесь это нужно сделать явно
+        await bot.session.close()
+
 async def main():
-    # Удаляем webhook (если был установлен)
-    await bot.delete_webhook(drop_pending_updates=True)
+    bot_mode = os.getenv('BOT_MODE', 'polling')
     
-    # Запускаем polling
-    await dp.start_polling(bot)
+    # Запускаем фоновые задачи сервисов
+    await service_manager.start()
+    
+    try:
+        if bot_mode == 'webhook':
+            await run_webhook()
+        else:
+            # Удаляем webhook (если был установлен)
+            await bot.delete_webhook(drop_pending_updates=True)
+            
+            # Запускаем polling
+            await dp.start_polling(bot)
+    finally:
+        await service_manager.stop()
+        # Ответы на задачи, прерванные остановкой, заново открывают уже закрытую сессию бота
+        await bot.session.close()
 
 if __name__ == "__main__":
     try:
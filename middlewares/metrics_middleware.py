@@ -0,0 +1,33 @@
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from services.metrics_service import MetricsService
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """Middleware, замеряющий время выполнения и ошибки обработчиков"""
+
+    def __init__(self, metrics: MetricsService):
+        self.metrics = metrics
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        # Внутренний middleware вызывается после фильтров, поэтому обработчик уже известен
+        handler_object = data.get("handler")
+        handler_name = getattr(getattr(handler_object, "callback", None), "__name__", "unknown")
+
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            self.metrics.inc("bot_handler_errors_total", handler=handler_name)
+            raise
+        finally:
+            self.metrics.observe("bot_handler_duration_seconds", time.perf_counter() - started, handler=handler_name)
@@ -0,0 +1,158 @@
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import CallbackQuery, InlineQuery, Message, TelegramObject
+
+from services.metrics_service import MetricsService
+
+
+# Классы команд; класс обработчика задается флагом throttling, по умолчанию - дешевый
+CLASS_EXPENSIVE = "expensive"
+CLASS_CHEAP = "cheap"
+
+
+class ThrottleBudget:
+    """Бюджет класса команд: пополнение и емкость корзины токенов на чат, лимит одновременных запросов"""
+
+    __slots__ = ("rate", "burst", "max_in_flight")
+
+    def __init__(self, per_minute: float, burst: int, max_in_flight: int):
+        self.rate = per_minute / 60
+        self.burst = max(1, burst)
+        self.max_in_flight = max(1, max_in_flight)
+
+
+class _TokenBucket:
+    """Корзина токенов одного чата для одного класса команд"""
+
+    __slots__ = ("tokens", "updated", "warned")
+
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
+        # Предупреждение об ограничении уже отправлено, повторно не отправляем до пополнения
+        self.warned = False
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Middleware, ограничивающий частоту запросов каждого чата и общую нагрузку
+
+    Запрос, совпадающий с еще выполняющимся запросом того же чата,
+    не выполняется повторно и не расходует токены: в ответ отправляется
+    уведомление, что запрос еще выполняется. Когда класс команд исчерпал
+    лимит одновременных запросов, новые сразу отклоняются, а не ждут.
+    """
+
+    # Количество корзин, после которого из памяти удаляются полностью пополненные
+    PRUNE_THRESHOLD = 10000
+
+    def __init__(self, budgets: Dict[str, ThrottleBudget], metrics: Optional[MetricsService] = None):
+        self.budgets = budgets
+        self.metrics = metrics
+        self._buckets: Dict[Tuple[int, str], _TokenBucket] = {}
+        self._prune_threshold = self.PRUNE_THRESHOLD
+        self._in_flight: Dict[str, int] = {name: 0 for name in budgets}
+        self._in_flight_keys: Set[Tuple[int, str, str]] = set()
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        chat = data.get("event_chat") or data.get("event_from_user")
+        command_class = get_flag(data, "throttling", default=CLASS_CHEAP)
+        budget = self.budgets.get(command_class)
+        if chat is None or budget is None:
+            return await handler(event, data)
+
+        # Внутренний middleware вызывается после фильтров, поэтому обработчик уже известен
+        handler_object = data.get("handler")
+        handler_name = getattr(getattr(handler_object, "callback", None), "__name__", "unknown")
+        request_key = (chat.id, handler_name, self._get_payload(event))
+        if request_key in self._in_flight_keys:
+            await self._reject(event, command_class, "duplicate", "⏳ Этот запрос уже выполняется")
+            return None
+
+        if self._in_flight[command_class] >= budget.max_in_flight:
+            await self._reject(event, command_class, "overload", "🚦 Бот перегружен, повторите запрос позже")
+            return None
+
+        bucket = self._take_token((chat.id, command_class), budget)
+        if bucket is not None:
+            retry_after = (1 - bucket.tokens) / budget.rate if budget.rate else 0
+            text = f"⏳ Слишком много запросов, повторите через {retry_after:.0f} с"
+            # В чат предупреждение отправляется один раз, ответ на кнопку нужен всегда
+            if bucket.warned and isinstance(event, Message):
+                self._count(command_class, "rate_limited")
+                return None
+            bucket.warned = True
+            await self._reject(event, command_class, "rate_limited", text)
+            return None
+
+        self._in_flight_keys.add(request_key)
+        self._in_flight[command_class] += 1
+        try:
+            return await handler(event, data)
+        finally:
+            self._in_flight[command_class] -= 1
+            self._in_flight_keys.discard(request_key)
+
+    def _take_token(self, key: Tuple[int, str], budget: ThrottleBudget) -> Optional[_TokenBucket]:
+        """
+        Списывает токен из корзины чата
+
+        Returns:
+            Optional[_TokenBucket]: None, если токен списан, иначе пустая корзина
+        """
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self._prune_threshold:
+                self._prune(now)
+            bucket = self._buckets[key] = _TokenBucket(budget.burst, now)
+        else:
+            bucket.tokens = min(budget.burst, bucket.tokens + (now - bucket.updated) * budget.rate)
+            bucket.updated = now
+
+        if bucket.tokens < 1:
+            return bucket
+        bucket.tokens -= 1
+        bucket.warned = False
+        return None
+
+    def _prune(self, now: float):
+        """Удаляет корзины, которые уже пополнились бы до емкости: новая корзина ничем от них не отличается"""
+        self._buckets = {
+            key: bucket for key, bucket in self._buckets.items()
+            if bucket.tokens + (now - bucket.updated) * self.budgets[key[1]].rate < self.budgets[key[1]].burst
+        }
+        self._prune_threshold = max(self.PRUNE_THRESHOLD, len(self._buckets) * 2)
+
+    @staticmethod
+    def _get_payload(event: TelegramObject) -> str:
+        """Содержимое запроса, по которому определяются одинаковые запросы"""
+        if isinstance(event, Message):
+            return event.text or event.caption or ""
+        if isinstance(event, CallbackQuery):
+            return event.data or ""
+        if isinstance(event, InlineQuery):
+            return event.query
+        return ""
+
+    async def _reject(self, event: TelegramObject, command_class: str, reason: str, text: str):
+        """Отвечает на отклоненный запрос без выполнения обработчика"""
+        self._count(command_class, reason)
+        if isinstance(event, CallbackQuery):
+            await event.answer(text)
+        elif isinstance(event, InlineQuery):
+            await event.answer([], cache_time=1, is_personal=True)
+        elif isinstance(event, Message):
+            await event.answer(text)
+
+    def _count(self, command_class: str, reason: str):
+        if self.metrics:
+            self.metrics.inc("bot_throttled_total", command_class=command_class, reason=reason)
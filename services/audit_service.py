@@ -0,0 +1,364 @@
+import asyncio
+import collections
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+# Количество событий в ответе /audit
+AUDIT_QUERY_LIMIT = 20
+
+# Сколько последних событий каждого пользователя помнит индекс смещений
+INDEX_ENTRIES_PER_USER = 100
+
+# Названия действий для ответа /audit
+ACTION_TITLES = {
+    'create': "создание",
+    'download': "скачивание",
+    'revoke': "отзыв",
+    'export': "экспорт",
+    'audit_overflow': "потеря событий",
+}
+
+
+class AuditService:
+    """
+    Журнал аудита действий с профилями в JSON строках
+
+    События складываются в очередь в памяти и записываются пачками
+    фоновой задачей, поэтому обработчики не ждут диска; fsync выполняется
+    не чаще раза в fsync_interval. Журнал разбит на сегменты
+    audit-<номер>.jsonl не больше max_bytes, рядом с каждым лежит индекс
+    смещений строк по пользователям, по которому /audit читает только
+    нужные строки.
+    """
+
+    def __init__(self, audit_dir: str, max_bytes: int = 10 * 1024 * 1024, backups: int = 5,
+                 flush_interval: float = 1.0, fsync_interval: float = 5.0, max_queue: int = 10000):
+        self.audit_dir = audit_dir
+        self.max_bytes = max_bytes
+        self.backups = max(0, backups)
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        self.max_queue = max_queue
+        self._queue: "collections.deque[Dict]" = collections.deque()
+        # Пачка, которая сейчас записывается: ее события уже не в очереди, но еще не в индексе
+        self._writing: List[Dict] = []
+        self._dropped = 0
+        # Порядковые номера событий: сколько событий поставлено в очередь и сколько из них записано в журнал
+        self._enqueued = 0
+        self._written = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._segment = 0
+        self._size = 0
+        self._log_file = None
+        self._index_file = None
+        self._last_fsync = 0.0
+        self._unsynced = False
+        # Смещения событий: (сегмент, смещение строки) по пользователям и по всему журналу
+        self._by_user: Dict[str, "collections.deque[tuple[int, int]]"] = {}
+        self._recent: "collections.deque[tuple[int, int]]" = collections.deque(maxlen=INDEX_ENTRIES_PER_USER)
+        # Запись пачки и чтение для /audit выполняются в разных потоках
+        self._io_lock = threading.Lock()
+
+    def log(self, action: str, actor_id: Optional[int], username: str = "", success: bool = True, **details):
+        """
+        Добавляет событие в очередь записи, не обращаясь к диску
+
+        Args:
+            action: Действие (create, download, revoke, export)
+            actor_id: Telegram ID того, кто выполнил действие
+            username: Имя пользователя OpenVPN, к которому относится действие
+            success: Успешно ли выполнено действие
+            **details: Дополнительные поля события
+        """
+        if len(self._queue) >= self.max_queue:
+            # Очередь ограничена; о потерянных событиях будет записано отдельное событие
+            self._dropped += 1
+            return
+        event = {'ts': round(time.time(), 3), 'action': action, 'actor': actor_id, 'user': username, 'ok': success}
+        event.update(details)
+        self._queue.append(event)
+        self._enqueued += 1
+        if self._wakeup and len(self._queue) >= self.max_queue // 2:
+            self._wakeup.set()
+
+    async def start(self):
+        """Открывает журнал и запускает фоновую запись"""
+        if self._task:
+            return
+        await asyncio.to_thread(self._open)
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._flush_loop(), name="audit-flush")
+
+    async def stop(self):
+        """Записывает оставшиеся события и закрывает журнал"""
+        if not self._task:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        try:
+            await asyncio.to_thread(self._write_batch, self._take_batch(), True)
+        except Exception:
+            logger.exception("Не удалось записать журнал аудита при остановке")
+        await asyncio.to_thread(self._close)
+
+    async def get_events(self, username: Optional[str] = None, limit: int = AUDIT_QUERY_LIMIT) -> List[Dict]:
+        """
+        Получает последние события, в том числе еще не записанные на диск
+
+        Args:
+            username: Имя пользователя OpenVPN или None для всех событий
+            limit: Максимальное количество событий
+
+        Returns:
+            List[Dict]: События от новых к старым
+        """
+        # Незаписанные события - последние по порядку номера, начиная с first_seq
+        unwritten = [*self._writing, *self._queue]
+        first_seq = self._enqueued - len(unwritten)
+        pending = self._filter_events(unwritten, username, limit)
+        if len(pending) >= limit:
+            return pending
+        return await asyncio.to_thread(self._read_events, username, limit, unwritten, first_seq)
+
+    def format_events(self, events: List[Dict], username: Optional[str] = None) -> str:
+        """
+        Форматирует события для отправки в Telegram
+
+        Returns:
+            str: Отформатированная строка с событиями
+        """
+        target = f" для `{username}`" if username else ""
+        if not events:
+            return f"🧾 Событий{target} не найдено"
+
+        text = f"🧾 **Журнал аудита{target}:**\n\n"
+        for event in events:
+            moment = time.strftime('%d.%m %H:%M:%S', time.localtime(event.get('ts', 0)))
+            # Все значения из события - внутри `...`, чтобы _ и * в них не ломали разметку Markdown
+            title = ACTION_TITLES.get(event.get('action')) or f"`{event.get('action')}`"
+            text += f"`{moment}` {'✅' if event.get('ok') else '❌'} {title}"
+            if event.get('user'):
+                text += f" `{event['user']}`"
+            if event.get('count'):
+                text += f" ({event['count']} шт.)"
+            if event.get('actor') is not None:
+                text += f" — `{event['actor']}`"
+            if event.get('actor_name'):
+                text += f" (`@{event['actor_name']}`)"
+            text += "\n"
+        return text
+
+    async def _flush_loop(self):
+        """Периодически записывает накопившиеся события"""
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if not self._queue and not self._dropped and not self._unsynced:
+                continue
+            batch = self._take_batch()
+            try:
+                await asyncio.to_thread(self._write_batch, batch)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Ошибка записи журнала аудита")
+                # События возвращаются в очередь и будут записаны следующей пачкой
+                self._queue.extendleft(reversed(batch))
+            finally:
+                self._writing = []
+
+    def _take_batch(self) -> List[Dict]:
+        """Забирает события из очереди для записи"""
+        batch = list(self._queue)
+        self._queue.clear()
+        if self._dropped:
+            batch.append({'ts': round(time.time(), 3), 'action': 'audit_overflow', 'actor': None,
+                          'user': "", 'ok': False, 'count': self._dropped})
+            self._dropped = 0
+            self._enqueued += 1
+        self._writing = batch
+        return batch
+
+    def _write_batch(self, batch: List[Dict], force_sync: bool = False):
+        """Дописывает пачку событий в журнал и индекс"""
+        with self._io_lock:
+            if self._log_file is None:
+                return
+            if batch:
+                if self._size >= self.max_bytes:
+                    self._rotate()
+
+                lines = []
+                index_lines = []
+                offsets = []
+                offset = self._size
+                for event in batch:
+                    line = (json.dumps(event, ensure_ascii=False, separators=(",", ":")) + "\n").encode()
+                    lines.append(line)
+                    index_lines.append(f"{offset}\t{event['user']}\n")
+                    offsets.append((event['user'], offset))
+                    offset += len(line)
+
+                # Сначала журнал, затем индекс: индекс без строки журнала невозможен, обратное восстанавливается
+                self._log_file.write(b"".join(lines))
+                self._log_file.flush()
+                self._index_file.write("".join(index_lines))
+                self._index_file.flush()
+                self._size = offset
+                self._unsynced = True
+                for username, line_offset in offsets:
+                    self._remember(username, self._segment, line_offset)
+                self._written += len(batch)
+
+            if self._unsynced and (force_sync or time.monotonic() - self._last_fsync >= self.fsync_interval):
+                os.fsync(self._log_file.fileno())
+                os.fsync(self._index_file.fileno())
+                self._last_fsync = time.monotonic()
+                self._unsynced = False
+
+    @staticmethod
+    def _filter_events(events: List[Dict], username: Optional[str], limit: int) -> List[Dict]:
+        """Выбирает последние события пользователя, от новых к старым"""
+        return [event for event in reversed(events) if username is None or event['user'] == username][:limit]
+
+    def _read_events(self, username: Optional[str], limit: int, unwritten: List[Dict], first_seq: int) -> List[Dict]:
+        """Дополняет незаписанные события прочитанными по смещениям из индекса, от новых к старым"""
+        with self._io_lock:
+            locations = list(self._by_user.get(username, ()) if username is not None else self._recent)
+            # Пачка могла записаться после снимка очереди: ее события читаются из журнала, а не из снимка
+            events = self._filter_events(unwritten[max(0, self._written - first_seq):], username, limit)
+        files = {}
+        try:
+            for segment, offset in reversed(locations):
+                if len(events) >= limit:
+                    break
+                if segment not in files:
+                    try:
+                        files[segment] = open(self._segment_path(segment), 'rb')
+                    except FileNotFoundError:
+                        files[segment] = None
+                segment_file = files[segment]
+                if segment_file is None:
+                    continue
+                segment_file.seek(offset)
+                try:
+                    events.append(json.loads(segment_file.readline()))
+                except ValueError:
+                    continue
+        finally:
+            for segment_file in files.values():
+                if segment_file:
+                    segment_file.close()
+        return events
+
+    def _open(self):
+        """Загружает индексы сохраненных сегментов и открывает текущий сегмент для записи"""
+        os.makedirs(self.audit_dir, exist_ok=True)
+        segments = sorted(
+            int(name[len("audit-"):-len(".jsonl")]) for name in os.listdir(self.audit_dir)
+            if name.startswith("audit-") and name.endswith(".jsonl") and name[len("audit-"):-len(".jsonl")].isdigit()
+        )
+        with self._io_lock:
+            for segment in segments:
+                self._load_segment(segment)
+            self._segment = segments[-1] if segments else 1
+            self._open_segment()
+
+    def _load_segment(self, segment: int):
+        """Загружает индекс сегмента, дописывая в него строки журнала, не попавшие в индекс"""
+        log_path = self._segment_path(segment)
+        index_path = self._index_path(segment)
+
+        last_offset = -1
+        if os.path.exists(index_path):
+            with open(index_path, 'r') as index_file:
+                for line in index_file:
+                    offset, separator, username = line.rstrip("\n").partition("\t")
+                    if separator and offset.isdigit():
+                        self._remember(username, segment, int(offset))
+                        last_offset = max(last_offset, int(offset))
+
+        # Читается только хвост журнала после последней проиндексированной строки
+        missing = []
+        with open(log_path, 'rb+') as log_file:
+            offset = max(last_offset, 0)
+            log_file.seek(offset)
+            tail = log_file.read()
+            end = tail.rfind(b"\n") + 1
+            if end < len(tail):
+                # Строка, записанная не до конца при аварийной остановке, отбрасывается
+                log_file.truncate(offset + end)
+            for line in tail[:end].splitlines(keepends=True):
+                if offset > last_offset:
+                    try:
+                        missing.append((json.loads(line).get('user', ""), offset))
+                    except ValueError:
+                        pass
+                offset += len(line)
+
+        if missing:
+            with open(index_path, 'a') as index_file:
+                index_file.write("".join(f"{line_offset}\t{username}\n" for username, line_offset in missing))
+            for username, line_offset in missing:
+                self._remember(username, segment, line_offset)
+
+    def _open_segment(self):
+        self._log_file = open(self._segment_path(self._segment), 'ab')
+        self._index_file = open(self._index_path(self._segment), 'a')
+        self._size = self._log_file.tell()
+
+    def _close(self):
+        with self._io_lock:
+            if self._log_file:
+                self._log_file.close()
+                self._index_file.close()
+                self._log_file = None
+                self._index_file = None
+
+    def _rotate(self):
+        """Начинает новый сегмент и удаляет сегменты сверх backups"""
+        os.fsync(self._log_file.fileno())
+        os.fsync(self._index_file.fileno())
+        self._log_file.close()
+        self._index_file.close()
+        self._segment += 1
+        self._open_segment()
+        self._unsynced = False
+
+        oldest = self._segment - self.backups
+        for segment in range(oldest - 1, 0, -1):
+            if not os.path.exists(self._segment_path(segment)):
+                break
+            os.remove(self._segment_path(segment))
+            if os.path.exists(self._index_path(segment)):
+                os.remove(self._index_path(segment))
+        for locations in (*self._by_user.values(), self._recent):
+            while locations and locations[0][0] < oldest:
+                locations.popleft()
+        self._by_user = {username: locations for username, locations in self._by_user.items() if locations}
+
+    def _remember(self, username: str, segment: int, offset: int):
+        self._recent.append((segment, offset))
+        if username:
+            locations = self._by_user.get(username)
+            if locations is None:
+                locations = self._by_user[username] = collections.deque(maxlen=INDEX_ENTRIES_PER_USER)
+            locations.append((segment, offset))
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.audit_dir, f"audit-{segment:06d}.jsonl")
+
+    def _index_path(self, segment: int) -> str:
+        return os.path.join(self.audit_dir, f"audit-{segment:06d}.idx")
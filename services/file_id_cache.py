@@ -0,0 +1,134 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+
+class FileIdCache:
+    """Постоянный кэш file_id Telegram для уже отправленных файлов"""
+
+    def __init__(self, path: str):
+        self.path = path
+        # Запись привязана к версии файла (inode, mtime, размер) и хранится в журнале JSON строк,
+        # который сжимается при загрузке
+        self._entries: Dict[str, Tuple[Tuple[int, int, int], str]] = {}
+        self._log_lines = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    def get(self, key: str, file_path: str) -> Optional[str]:
+        """
+        Получает file_id, если файл не изменился с момента отправки
+
+        Args:
+            key: Ключ записи (например, имя пользователя)
+            file_path: Путь к файлу
+
+        Returns:
+            Optional[str]: file_id или None
+        """
+        entry = self._entries.get(key)
+        if not entry:
+            return None
+
+        version, file_id = entry
+        if version != self._file_version(file_path):
+            # Журнал не трогаем: устаревшая запись отбрасывается так же после перезапуска
+            with self._lock:
+                if self._entries.get(key) == entry:
+                    del self._entries[key]
+            return None
+        return file_id
+
+    async def put(self, key: str, file_path: str, file_id: str):
+        """
+        Сохраняет file_id для текущей версии файла
+
+        Args:
+            key: Ключ записи
+            file_path: Путь к отправленному файлу
+            file_id: file_id, полученный от Telegram
+        """
+        await asyncio.to_thread(self._store, key, file_path, file_id)
+
+    async def invalidate(self, key: str):
+        """
+        Удаляет запись из кэша
+
+        Args:
+            key: Ключ записи
+        """
+        await asyncio.to_thread(self._drop, key)
+
+    def _store(self, key: str, file_path: str, file_id: str):
+        """Сохраняет запись и дописывает ее в журнал (выполняется в потоке)"""
+        version = self._file_version(file_path)
+        if version is None:
+            return
+        with self._lock:
+            self._entries[key] = (version, file_id)
+            self._append({'key': key, 'version': list(version), 'file_id': file_id})
+
+    def _drop(self, key: str):
+        """Удаляет запись и дописывает удаление в журнал (выполняется в потоке)"""
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._append({'key': key, 'file_id': None})
+
+    def _file_version(self, file_path: str) -> Optional[Tuple[int, int, int]]:
+        """Получает версию файла для сравнения с кэшем"""
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _append(self, record: Dict):
+        """Дописывает запись в журнал кэша"""
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, 'a') as cache_file:
+                cache_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._log_lines += 1
+        except OSError:
+            logger.exception("Не удалось сохранить кэш file_id")
+
+    def _load(self):
+        """Загружает кэш из журнала и при необходимости сжимает его"""
+        if not os.path.exists(self.path):
+            return
+
+        try:
+            with open(self.path, 'r') as cache_file:
+                for line in cache_file:
+                    self._log_lines += 1
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if record.get('file_id'):
+                        self._entries[record['key']] = (tuple(record['version']), record['file_id'])
+                    else:
+                        self._entries.pop(record.get('key'), None)
+        except OSError:
+            logger.exception("Не удалось загрузить кэш file_id")
+            return
+
+        if self._log_lines > 2 * len(self._entries) + 100:
+            self._compact()
+
+    def _compact(self):
+        """Перезаписывает журнал, оставляя только актуальные записи"""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as cache_file:
+            for key, (version, file_id) in self._entries.items():
+                cache_file.write(json.dumps(
+                    {'key': key, 'version': list(version), 'file_id': file_id}, ensure_ascii=False
+                ) + "\n")
+        os.replace(tmp_path, self.path)
+        self._log_lines = len(self._entries)
@@ -1,15 +1,44 @@
+import hashlib
+import io
 import os
-from typing import List, Dict, Tuple
+import threading
+import uuid
+import zipfile
+from collections import OrderedDict
+import time
+from typing import List, Dict, Optional, Tuple
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from .user_registry import UserRecord
 
 
 class FileService:
     """Сервис для работы с файлами и пагинацией"""
     
-    def __init__(self, files_per_page: int = 10):
+    # Префикс callback_data курсорной пагинации
+    CURSOR_PREFIX = "pg:"
+    # Ограничение Telegram на длину callback_data в байтах
+    CALLBACK_DATA_LIMIT = 64
+    # Значки статусов сертификатов в списке пользователей
+    STATUS_ICONS = {
+        'valid': "✅",
+        'expiring': "⚠️",
+        'expired': "⌛",
+        'revoked': "⛔",
+        'unknown': "❔",
+    }
+    
+    def __init__(self, files_per_page: int = 10, page_cache_size: int = 256,
+                 export_dir: str = os.path.join("data", "exports"), export_cache_size: int = 5):
         self.files_per_page = files_per_page
+        self.page_cache_size = page_cache_size
+        self.export_dir = export_dir
+        self.export_cache_size = export_cache_size
+        self._page_cache: "OrderedDict[Tuple, Tuple[str, InlineKeyboardMarkup]]" = OrderedDict()
+        # Выданные export_zip архивы, которые еще отправляются, и число их получателей
+        self._exports_in_use: Dict[str, int] = {}
+        self._export_lock = threading.Lock()
     
-    def create_pagination_keyboard(self, files: List[Dict], current_page: int = 0) -> InlineKeyboardMarkup:
+    def create_pagination_keyboard(self, files: List[UserRecord], current_page: int = 0) -> InlineKeyboardMarkup:
         """
         Создает клавиатуру с пагинацией для списка файлов
         
@@ -20,22 +49,31 @@ class FileService:
         Returns:
             InlineKeyboardMarkup: Клавиатура с кнопками файлов и навигации
         """
-        total_files = len(files)
-        total_pages = (total_files + self.files_per_page - 1) // self.files_per_page
-        
-        # Вычисляем индексы для текущей страницы
-        start_idx = current_page * self.files_per_page
-        end_idx = min(start_idx + self.files_per_page, total_files)
+        page_files = self.get_page_files(files, current_page)
+        return self.create_page_keyboard(page_files, current_page, len(files))
+    
+    def create_page_keyboard(self, page_files: List[UserRecord], current_page: int, total_files: int,
+                             navigation_buttons: Optional[List[List[InlineKeyboardButton]]] = None) -> InlineKeyboardMarkup:
+        """
+        Создает клавиатуру для уже выбранной страницы файлов
         
-        # Получаем файлы для текущей страницы
-        page_files = files[start_idx:end_idx]
+        Args:
+            page_files: Файлы текущей страницы
+            current_page: Текущая страница (начиная с 0)
+            total_files: Общее количество файлов
+            navigation_buttons: Готовые кнопки навигации вместо постраничных
+            
+        Returns:
+            InlineKeyboardMarkup: Клавиатура с кнопками файлов и навигации
+        """
+        total_pages = (total_files + self.files_per_page - 1) // self.files_per_page
         
         # Создаем кнопки для файлов текущей страницы
         keyboard_buttons = []
         
-        for i, file_info in enumerate(page_files, start_idx + 1):
-            username = file_info['username']
-            size_kb = file_info['size_kb']
+        for file_info in page_files:
+            username = file_info.key
+            size_kb = file_info.size_kb
             
             # Создаем кнопку для скачивания файла
             keyboard_buttons.append([
@@ -46,13 +84,14 @@ class FileService:
             ])
         
         # Добавляем кнопки навигации
-        if total_pages > 1:
-            navigation_buttons = self._create_navigation_buttons(current_page, total_pages)
+        if navigation_buttons is not None:
             keyboard_buttons.extend(navigation_buttons)
+        elif total_pages > 1:
+            keyboard_buttons.extend(self._create_navigation_buttons(current_page, total_pages))
         
         return InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
     
-    def create_files_list_text(self, files: List[Dict], current_page: int = 0) -> str:
+    def create_files_list_text(self, files: List[UserRecord], current_page: int = 0) -> str:
         """
         Создает текст списка файлов с пагинацией
         
@@ -63,30 +102,163 @@ class FileService:
         Returns:
             str: Текст списка файлов
         """
-        total_files = len(files)
-        total_pages = (total_files + self.files_per_page - 1) // self.files_per_page
-        
-        # Вычисляем индексы для текущей страницы
-        start_idx = current_page * self.files_per_page
-        end_idx = min(start_idx + self.files_per_page, total_files)
+        page_files = self.get_page_files(files, current_page)
+        return self.create_page_text(page_files, current_page, len(files))
+    
+    def create_page_text(self, page_files: List[UserRecord], current_page: int, total_files: int,
+                         start_idx: Optional[int] = None) -> str:
+        """
+        Создает текст для уже выбранной страницы файлов
         
-        # Получаем файлы для текущей страницы
-        page_files = files[start_idx:end_idx]
+        Args:
+            page_files: Файлы текущей страницы
+            current_page: Текущая страница (начиная с 0)
+            total_files: Общее количество файлов
+            start_idx: Позиция первого файла страницы, если страница не выровнена
+            
+        Returns:
+            str: Текст списка файлов
+        """
+        total_pages = (total_files + self.files_per_page - 1) // self.files_per_page
+        if start_idx is None:
+            start_idx = current_page * self.files_per_page
         
         # Формируем список пользователей для текущей страницы
         users_list = f"👥 **Список пользователей OpenVPN** (стр. {current_page + 1}/{total_pages}):\n\n"
         
         for i, file_info in enumerate(page_files, start_idx + 1):
-            username = file_info['username']
-            size_kb = file_info['size_kb']
-            users_list += f"{i}. **{username}** ({size_kb:.1f} KB)\n"
+            username = file_info.key
+            size_kb = file_info.size_kb
+            users_list += f"{i}. **{username}** ({size_kb:.1f} KB){self._format_status(file_info)}\n"
         
         users_list += f"\n📊 **Всего пользователей:** {total_files}\n"
         users_list += "💡 **Нажмите на кнопку ниже для скачивания файла:**"
         
         return users_list
     
-    def get_page_files(self, files: List[Dict], page: int) -> List[Dict]:
+    def render_page(self, page: Dict) -> Tuple[str, InlineKeyboardMarkup]:
+        """
+        Создает текст и клавиатуру страницы снимка индекса с кэшированием
+        
+        Страница однозначно определяется версией снимка и позицией,
+        поэтому повторные нажатия на те же кнопки не перерисовываются.
+        
+        Args:
+            page: Страница, полученная из UserService.get_users_page
+            
+        Returns:
+            Tuple[str, InlineKeyboardMarkup]: Текст и клавиатура страницы
+        """
+        cache_key = (page['version'], page.get('status_version'), page['position'], self.files_per_page)
+        cached = self._page_cache.get(cache_key)
+        if cached:
+            self._page_cache.move_to_end(cache_key)
+            return cached
+        
+        current_page = page['position'] // self.files_per_page
+        total_pages = (page['total'] + self.files_per_page - 1) // self.files_per_page
+        
+        rendered = (
+            self.create_page_text(page['users'], current_page, page['total'], start_idx=page['position']),
+            self.create_page_keyboard(
+                page['users'], current_page, page['total'],
+                navigation_buttons=self._create_cursor_navigation_buttons(page, current_page, total_pages)
+            )
+        )
+        
+        self._page_cache[cache_key] = rendered
+        while len(self._page_cache) > self.page_cache_size:
+            self._page_cache.popitem(last=False)
+        return rendered
+    
+    def encode_cursor(self, version: int, username: str, position: int) -> str:
+        """
+        Кодирует курсор страницы в callback_data
+        
+        Формат: pg:<версия в base36>:<имя>. Если имя не помещается
+        в 64 байта, вместо него передается позиция: pg:<версия>:#<позиция>.
+        
+        Args:
+            version: Версия снимка индекса
+            username: Имя первого пользователя страницы
+            position: Позиция первого пользователя страницы
+            
+        Returns:
+            str: callback_data
+        """
+        prefix = f"{self.CURSOR_PREFIX}{self._to_base36(version)}:"
+        callback_data = prefix + username
+        if len(callback_data.encode()) > self.CALLBACK_DATA_LIMIT:
+            callback_data = f"{prefix}#{position}"
+        return callback_data
+    
+    def decode_cursor(self, callback_data: str) -> Tuple[int, Optional[str], int]:
+        """
+        Декодирует курсор страницы из callback_data
+        
+        Args:
+            callback_data: Данные кнопки в формате encode_cursor
+            
+        Returns:
+            Tuple[int, Optional[str], int]: (версия снимка, имя-курсор или None, позиция)
+        """
+        version, _, cursor = callback_data[len(self.CURSOR_PREFIX):].partition(":")
+        if cursor.startswith("#"):
+            return int(version, 36), None, int(cursor[1:])
+        return int(version, 36), cursor, 0
+    
+    def create_search_text(self, prefix: str, matches: List[UserRecord], total_matches: int) -> str:
+        """
+        Создает текст с результатами поиска по префиксу
+        
+        Args:
+            prefix: Искомый префикс
+            matches: Найденные файлы (первые из совпадений)
+            total_matches: Общее количество совпадений
+            
+        Returns:
+            str: Текст результатов поиска
+        """
+        text = f"🔍 **Поиск:** `{prefix}`\n\n"
+        
+        for file_info in matches:
+            text += f"• `{file_info.key}` ({file_info.size_kb:.1f} KB)\n"
+        
+        if total_matches > len(matches):
+            text += f"\n... и еще {total_matches - len(matches)}\n"
+        
+        text += f"\n📊 **Найдено пользователей:** {total_matches}"
+        return text
+    
+    def create_search_keyboard(self, matches: List[UserRecord], first_position: int, version: int) -> InlineKeyboardMarkup:
+        """
+        Создает клавиатуру с найденными файлами и переходом к странице списка
+        
+        Args:
+            matches: Найденные файлы
+            first_position: Позиция первого совпадения в общем списке
+            version: Версия снимка индекса
+            
+        Returns:
+            InlineKeyboardMarkup: Клавиатура с кнопками скачивания и перехода
+        """
+        keyboard_buttons = [
+            [InlineKeyboardButton(
+                text=f"📁 {file_info.key} ({file_info.size_kb:.1f} KB)",
+                callback_data=f"download_{file_info.key}"
+            )]
+            for file_info in matches[:self.files_per_page]
+        ]
+        
+        page = first_position // self.files_per_page
+        keyboard_buttons.append([InlineKeyboardButton(
+            text=f"📄 Перейти к странице {page + 1}",
+            callback_data=self.encode_cursor(version, matches[0].key, first_position)
+        )])
+        
+        return InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
+    
+    def get_page_files(self, files: List[UserRecord], page: int) -> List[UserRecord]:
         """
         Получает файлы для указанной страницы
         
@@ -95,13 +267,13 @@ class FileService:
             page: Номер страницы (начиная с 0)
             
         Returns:
-            List[Dict]: Файлы для указанной страницы
+            List[UserRecord]: Файлы для указанной страницы
         """
         start_idx = page * self.files_per_page
         end_idx = min(start_idx + self.files_per_page, len(files))
         return files[start_idx:end_idx]
     
-    def get_total_pages(self, files: List[Dict]) -> int:
+    def get_total_pages(self, files: List[UserRecord]) -> int:
         """
         Получает общее количество страниц
         
@@ -113,6 +285,158 @@ class FileService:
         """
         return (len(files) + self.files_per_page - 1) // self.files_per_page
     
+    def create_zip_bundle(self, file_paths: List[str], arcnames: Optional[List[str]] = None) -> bytes:
+        """
+        Упаковывает файлы в ZIP архив
+        
+        Args:
+            file_paths: Пути к файлам
+            arcnames: Пути файлов в архиве (по умолчанию - имена файлов)
+            
+        Returns:
+            bytes: Содержимое ZIP архива
+        """
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            for file_path, arcname in self._with_arcnames(file_paths, arcnames):
+                archive.write(file_path, arcname=arcname)
+        return buffer.getvalue()
+    
+    def export_zip(self, file_paths: List[str], arcnames: Optional[List[str]] = None) -> Tuple[str, str, bool]:
+        """
+        Получает ZIP архив с файлами, собирая его только при изменении файлов
+        
+        Архив пишется на диск потоково, файл за файлом, поэтому память
+        не зависит от количества профилей. Готовые архивы хранятся под
+        хэшем списка файлов с их размерами и временем изменения, содержимое
+        файлов не читается. Архив не удаляется до вызова release_export.
+        
+        Args:
+            file_paths: Пути к файлам
+            arcnames: Пути файлов в архиве (по умолчанию - имена файлов)
+            
+        Returns:
+            Tuple[str, str, bool]: (путь к архиву, ключ архива, собран ли архив заново)
+        """
+        entries = sorted(self._with_arcnames(file_paths, arcnames), key=lambda entry: entry[1])
+        digest = hashlib.sha256()
+        for file_path, arcname in entries:
+            file_stat = os.stat(file_path)
+            digest.update(f"{arcname}\0{file_stat.st_size}\0{file_stat.st_mtime_ns}\n".encode())
+        archive_key = digest.hexdigest()
+        
+        zip_path = os.path.join(self.export_dir, f"{archive_key}.zip")
+        with self._export_lock:
+            if os.path.exists(zip_path):
+                # Обновляем время, чтобы архив не был удален как самый старый
+                os.utime(zip_path)
+                self._exports_in_use[zip_path] = self._exports_in_use.get(zip_path, 0) + 1
+                return zip_path, archive_key, False
+        
+        os.makedirs(self.export_dir, exist_ok=True)
+        tmp_path = os.path.join(self.export_dir, f".{archive_key}.{uuid.uuid4().hex}.tmp")
+        try:
+            with zipfile.ZipFile(tmp_path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+                for file_path, arcname in entries:
+                    archive.write(file_path, arcname=arcname)
+            with self._export_lock:
+                os.replace(tmp_path, zip_path)
+                self._exports_in_use[zip_path] = self._exports_in_use.get(zip_path, 0) + 1
+                self._prune_exports()
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        
+        return zip_path, archive_key, True
+    
+    def release_export(self, zip_path: str):
+        """Отмечает, что архив из export_zip больше не используется"""
+        with self._export_lock:
+            users = self._exports_in_use.get(zip_path, 0) - 1
+            if users > 0:
+                self._exports_in_use[zip_path] = users
+            else:
+                self._exports_in_use.pop(zip_path, None)
+    
+    @staticmethod
+    def _with_arcnames(file_paths: List[str], arcnames: Optional[List[str]]) -> List[Tuple[str, str]]:
+        """Сопоставляет файлам их пути в архиве"""
+        if arcnames is None:
+            arcnames = [os.path.basename(file_path) for file_path in file_paths]
+        return list(zip(file_paths, arcnames))
+    
+    def _prune_exports(self):
+        """Удаляет самые старые архивы сверх export_cache_size, кроме используемых (вызывается под _export_lock)"""
+        archives = []
+        with os.scandir(self.export_dir) as entries:
+            for entry in entries:
+                if entry.name.endswith(".zip"):
+                    archives.append((entry.stat().st_mtime, entry.path))
+        archives.sort(reverse=True)
+        for _, path in archives[self.export_cache_size:]:
+            if path not in self._exports_in_use:
+                os.remove(path)
+    
+    def _format_status(self, file_info: UserRecord) -> str:
+        """Форматирует статус сертификата для строки списка"""
+        status = file_info.status
+        if status is None:
+            return ""
+        text = f" {self.STATUS_ICONS.get(status, '')}"
+        if status in ('expiring', 'expired') and file_info.expires_at:
+            text += f" до {time.strftime('%d.%m.%Y', time.localtime(file_info.expires_at))}"
+        return text
+    
+    def _create_cursor_navigation_buttons(self, page: Dict, current_page: int,
+                                          total_pages: int) -> List[List[InlineKeyboardButton]]:
+        """
+        Создает кнопки навигации с курсорами соседних страниц
+        
+        Args:
+            page: Страница снимка индекса
+            current_page: Номер текущей страницы
+            total_pages: Общее количество страниц
+            
+        Returns:
+            List[List[InlineKeyboardButton]]: Кнопки навигации
+        """
+        if not page['prev_cursor'] and not page['next_cursor']:
+            return []
+        
+        nav_row = []
+        
+        # Кнопка "Назад"
+        if page['prev_cursor']:
+            nav_row.append(InlineKeyboardButton(
+                text="⬅️ Назад",
+                callback_data=self.encode_cursor(page['version'], *page['prev_cursor'])
+            ))
+        
+        # Информация о странице
+        nav_row.append(InlineKeyboardButton(
+            text=f"{current_page + 1}/{total_pages}",
+            callback_data="page_info"
+        ))
+        
+        # Кнопка "Вперед"
+        if page['next_cursor']:
+            nav_row.append(InlineKeyboardButton(
+                text="Вперед ➡️",
+                callback_data=self.encode_cursor(page['version'], *page['next_cursor'])
+            ))
+        
+        return [nav_row]
+    
+    def _to_base36(self, number: int) -> str:
+        """Переводит неотрицательное число в base36"""
+        digits = "0123456789abcdefghijklmnopqrstuvwxyz"
+        result = ""
+        while True:
+            number, remainder = divmod(number, 36)
+            result = digits[remainder] + result
+            if not number:
+                return result
+    
     def _create_navigation_buttons(self, current_page: int, total_pages: int) -> List[List[InlineKeyboardButton]]:
         """
         Создает кнопки навигации
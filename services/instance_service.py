@@ -0,0 +1,370 @@
+import asyncio
+import heapq
+import itertools
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+
+from .file_id_cache import FileIdCache
+from .job_service import JobService
+from .key_pool_service import KeyPoolService
+from .openvpn_status_service import OpenVPNStatusService
+from .pki_index import CertificateRecord
+from .traffic_service import TrafficService
+from .user_registry import INSTANCE_SEPARATOR, UserRecord
+from .user_service import UserService
+
+
+T = TypeVar("T")
+
+
+class VpnInstance:
+    """
+    Сервер OpenVPN со своей PKI, директорией профилей, кэшами и пулом воркеров выпуска,
+    а также своим источником статуса подключенных клиентов и историей трафика
+    """
+
+    def __init__(self, name: str, user_service: UserService, job_service: JobService,
+                 key_pool_service: KeyPoolService, file_id_cache: FileIdCache,
+                 status_service: OpenVPNStatusService, traffic_service: TrafficService):
+        # Пустое имя - единственный сервер из прежней конфигурации, имена пользователей не уточняются
+        self.name = name
+        self.user_service = user_service
+        self.job_service = job_service
+        self.key_pool_service = key_pool_service
+        self.file_id_cache = file_id_cache
+        self.status_service = status_service
+        self.traffic_service = traffic_service
+
+    def qualify(self, username: str) -> str:
+        """Полное имя пользователя этого сервера"""
+        if self.name:
+            return self.name + INSTANCE_SEPARATOR + username
+        return username
+
+    def archive_name(self, username: str) -> str:
+        """Путь .ovpn файла пользователя в ZIP архиве"""
+        if self.name:
+            return f"{self.name}/{username}.ovpn"
+        return f"{username}.ovpn"
+
+    async def start(self):
+        """Запускает фоновые задачи сервера"""
+        await self.key_pool_service.start()
+        await self.status_service.start()
+
+    async def stop(self):
+        """Останавливает фоновые задачи сервера"""
+        await self.status_service.stop()
+        await self.key_pool_service.stop()
+        await self.job_service.stop()
+
+
+def _sort_key(user: UserRecord) -> Tuple[str, str]:
+    """Порядок общего списка: по имени, одинаковые имена - по серверу"""
+    return user.username, user.instance
+
+
+class InstanceService:
+    """
+    Сервис серверов OpenVPN, которыми управляет бот
+
+    Команда направляется одному серверу по полному имени пользователя
+    (сервер:имя; без сервера - первый сервер). Списки, поиск и экспорт
+    опрашивают реестры всех серверов одновременно в пуле потоков и сливают
+    уже отсортированные результаты в один список по (имя, сервер).
+    """
+
+    def __init__(self, instances: List[VpnInstance]):
+        if not instances:
+            raise ValueError("Не задан ни один сервер OpenVPN")
+        self.instances = instances
+        self.default = instances[0]
+        self._by_name: Dict[str, VpnInstance] = {instance.name: instance for instance in instances}
+
+    @property
+    def multiple(self) -> bool:
+        """Управляет ли бот несколькими серверами"""
+        return len(self.instances) > 1
+
+    def get(self, name: str) -> Optional[VpnInstance]:
+        """Получает сервер по имени"""
+        return self._by_name.get(name)
+
+    def resolve(self, qualified_name: str) -> Tuple[Optional[VpnInstance], str]:
+        """
+        Находит сервер, которому адресовано полное имя пользователя
+
+        Args:
+            qualified_name: Имя пользователя, возможно с сервером: udp:alice
+
+        Returns:
+            Tuple[Optional[VpnInstance], str]: (сервер или None, если такой сервер не настроен;
+                имя пользователя без сервера)
+        """
+        name, separator, username = qualified_name.partition(INSTANCE_SEPARATOR)
+        if not separator:
+            return self.default, qualified_name
+        return self._by_name.get(name), username
+
+    def parse_usernames(self, text: str, csv_format: bool = False
+                        ) -> Tuple[List[Tuple[VpnInstance, List[str]]], List[str]]:
+        """
+        Разбирает список полных имен пользователей и группирует их по серверам
+
+        Returns:
+            Tuple[List[Tuple[VpnInstance, List[str]]], List[str]]: (имена без повторов по серверам,
+                некорректные имена и имена с ненастроенным сервером)
+        """
+        groups: Dict[str, Dict[str, None]] = {}
+        invalid = []
+        for name in UserService.split_usernames(text, csv_format):
+            instance, username = self.resolve(name)
+            if instance is None or not instance.user_service.is_valid_username(username):
+                invalid.append(name)
+                continue
+            groups.setdefault(instance.name, {})[username] = None
+        return [(self._by_name[name], list(usernames)) for name, usernames in groups.items()], invalid
+
+    async def gather(self, call: Callable[[VpnInstance], T],
+                     instances: Optional[List[VpnInstance]] = None) -> List[T]:
+        """
+        Выполняет блокирующий вызов для каждого сервера одновременно в пуле потоков
+
+        Returns:
+            List[T]: Результаты в порядке серверов
+        """
+        return await asyncio.gather(*(asyncio.to_thread(call, instance) for instance in instances or self.instances))
+
+    def format_per_instance(self, format_instance: Callable[[VpnInstance], str]) -> str:
+        """Собирает текст из разделов по серверам; при одном сервере заголовков нет"""
+        if not self.multiple:
+            return format_instance(self.default)
+        return "\n\n".join(
+            f"🖥 **Сервер {instance.name}**\n{format_instance(instance)}" for instance in self.instances
+        )
+
+    async def count_users(self) -> int:
+        """Получает количество активных пользователей всех серверов"""
+        return sum(await self.gather(lambda instance: instance.user_service.count_users()))
+
+    async def get_all_users(self) -> Tuple[bool, List[UserRecord], str]:
+        """
+        Получает пользователей всех серверов одним отсортированным списком
+
+        Returns:
+            Tuple[bool, List[UserRecord], str]: (успех, список пользователей, сообщение об ошибке)
+        """
+        results = await self.gather(lambda instance: instance.user_service.get_all_users())
+        lists = []
+        for instance, (success, users, error_message) in zip(self.instances, results):
+            if not success:
+                return False, [], self._with_instance(instance, error_message)
+            lists.append(users)
+        if len(lists) == 1:
+            return True, lists[0], ""
+        return True, list(heapq.merge(*lists, key=_sort_key)), ""
+
+    async def find_users(self, prefix: str, limit: int) -> Tuple[bool, List[UserRecord], int, int, str]:
+        """
+        Ищет пользователей по префиксу имени на всех серверах или на указанном (udp:al)
+
+        Returns:
+            Tuple[bool, List[UserRecord], int, int, str]: (успех, найденные пользователи, всего совпадений,
+                позиция первого совпадения в общем списке, сообщение об ошибке)
+        """
+        instance, name_prefix = self.resolve(prefix)
+        if instance is None:
+            return False, [], 0, 0, f"Сервер {prefix.partition(INSTANCE_SEPARATOR)[0]} не настроен"
+        searched = [instance] if INSTANCE_SEPARATOR in prefix else self.instances
+
+        results = await self.gather(lambda item: item.user_service.find_users(name_prefix, limit), searched)
+        lists, total, position = [], 0, 0
+        for item, (success, matches, item_total, item_position, error_message) in zip(searched, results):
+            if not success:
+                return False, [], 0, 0, self._with_instance(item, error_message)
+            lists.append(matches)
+            total += item_total
+            position += item_position
+
+        matches = list(itertools.islice(heapq.merge(*lists, key=_sort_key), limit))
+        if len(searched) < len(self.instances) and matches:
+            position = sum(await self.gather(
+                lambda item: self._count_before(item, matches[0].username, matches[0].instance)
+            ))
+        return True, matches, total, position, ""
+
+    async def get_users_page(self, per_page: int, cursor: Optional[str] = None,
+                             position: int = 0) -> Tuple[bool, Dict, str]:
+        """
+        Получает страницу общего списка пользователей всех серверов
+
+        Каждый сервер отдает только пользователей вокруг курсора
+        диапазонными запросами к своему реестру, без полного списка.
+
+        Args:
+            per_page: Количество пользователей на странице
+            cursor: Полное имя первого пользователя страницы
+            position: Позиция начала страницы, если курсор не задан
+
+        Returns:
+            Tuple[bool, Dict, str]: (успех, страница в формате UserRegistry.get_snapshot_page,
+                сообщение об ошибке)
+        """
+        cursor_key = None
+        if cursor is not None:
+            instance, username = self.resolve(cursor)
+            # Курсор сервера, убранного из настроек, заменяется позицией
+            if instance is not None:
+                cursor_key = (username, instance.name)
+
+        if not self.multiple:
+            return await asyncio.to_thread(
+                self.default.user_service.get_users_page, per_page, cursor_key[0] if cursor_key else None, position
+            )
+
+        results = await self.gather(lambda instance: self._read_page_part(instance, per_page, cursor_key))
+        for instance, (success, _, error_message) in zip(self.instances, results):
+            if not success:
+                return False, {}, self._with_instance(instance, error_message)
+        parts = [part for _, part, _ in results]
+
+        total = sum(part['total'] for part in parts)
+        if cursor_key:
+            position = sum(part['before'] for part in parts)
+        position = max(0, min(position, max(total - 1, 0)))
+
+        if cursor_key:
+            following = list(itertools.islice(
+                heapq.merge(*(part['following'] for part in parts), key=_sort_key), per_page + 1
+            ))
+            preceding = list(itertools.islice(
+                heapq.merge(*(part['preceding'] for part in parts), key=_sort_key, reverse=True), per_page + 1
+            ))
+            if not following and preceding:
+                # Пользователи с курсора и дальше удалены: показываем последнего, как реестр при пустом диапазоне
+                following, preceding = preceding[:1], preceding[1:]
+            users = following[:per_page]
+            next_user = following[per_page] if len(following) > per_page else None
+            previous_index = min(per_page, position) - 1
+            prev_user = preceding[previous_index] if position > 0 and previous_index < len(preceding) else None
+        else:
+            start = max(position - per_page, 0)
+            window = list(itertools.islice(
+                heapq.merge(*(part['all'] for part in parts), key=_sort_key), start, position + per_page + 1
+            ))
+            users = window[position - start:position - start + per_page]
+            next_user = window[position - start + per_page] if len(window) > position - start + per_page else None
+            prev_user = window[0] if position > 0 and window else None
+
+        on_page = [instance for instance in self.instances if any(user.instance == instance.name for user in users)]
+        status_versions = await self.gather(
+            lambda instance: instance.user_service.fill_certificate_status(
+                [user for user in users if user.instance == instance.name]
+            ),
+            on_page
+        ) if on_page else []
+
+        return True, {
+            'version': sum(part['version'] for part in parts),
+            'status_version': tuple(zip((instance.name for instance in on_page), status_versions)),
+            'position': position,
+            'total': total,
+            'users': users,
+            'prev_cursor': (prev_user.key, max(position - per_page, 0)) if prev_user else None,
+            'next_cursor': (next_user.key, position + per_page) if next_user else None,
+        }, ""
+
+    async def get_expiring_certificates(self, days: int
+                                        ) -> Tuple[bool, List[Tuple[VpnInstance, CertificateRecord]], str]:
+        """
+        Получает сертификаты всех серверов, истекающие в ближайшие дни
+
+        Returns:
+            Tuple[bool, List[Tuple[VpnInstance, CertificateRecord]], str]: (успех, пары (сервер, сертификат)
+                в порядке истечения, сообщение об ошибке)
+        """
+        results = await self.gather(lambda instance: instance.user_service.get_expiring_certificates(days))
+        lists = []
+        for instance, (success, records, error_message) in zip(self.instances, results):
+            if not success:
+                return False, [], self._with_instance(instance, error_message)
+            lists.append([(instance, record) for record in records])
+        return True, list(heapq.merge(*lists, key=lambda item: item[1].expires_at)), ""
+
+    async def run_bulk(self, groups: List[Tuple[VpnInstance, List[str]]], parallelism: int,
+                       on_progress: Optional[Callable[[int, int, int], Awaitable[None]]] = None,
+                       created_by: Optional[int] = None) -> List[Tuple[str, bool, str]]:
+        """
+        Создает пользователей на их серверах; серверы работают одновременно, каждый своим пулом воркеров
+
+        Returns:
+            List[Tuple[str, bool, str]]: (полное имя, успех, сообщение)
+        """
+        total = sum(len(usernames) for _, usernames in groups)
+        progress: Dict[str, Tuple[int, int]] = {}
+
+        async def run_group(instance: VpnInstance, usernames: List[str]) -> List[Tuple[str, bool, str]]:
+            async def on_group_progress(completed: int, failed: int, _: int):
+                progress[instance.name] = (completed, failed)
+                if on_progress:
+                    await on_progress(sum(item[0] for item in progress.values()),
+                                      sum(item[1] for item in progress.values()), total)
+
+            results = await instance.job_service.run_bulk(usernames, parallelism, on_group_progress, created_by)
+            return [(instance.qualify(username), success, message) for username, success, message in results]
+
+        grouped = await asyncio.gather(*(run_group(instance, usernames) for instance, usernames in groups))
+        return [result for results in grouped for result in results]
+
+    async def revoke_users(self, groups: List[Tuple[VpnInstance, List[str]]]
+                           ) -> Tuple[List[Tuple[str, bool, str]], bool, str]:
+        """
+        Отзывает сертификаты пользователей на их серверах одновременно
+
+        Returns:
+            Tuple[List[Tuple[str, bool, str]], bool, str]: (результаты по полным именам,
+                обновлены ли CRL всех серверов, ошибки обновления CRL)
+        """
+        grouped = await asyncio.gather(
+            *(instance.user_service.revoke_users_async(usernames) for instance, usernames in groups)
+        )
+        results, crl_errors = [], []
+        for (instance, _), (group_results, crl_success, crl_message) in zip(groups, grouped):
+            results.extend((instance.qualify(username), success, message)
+                           for username, success, message in group_results)
+            if not crl_success:
+                crl_errors.append(self._with_instance(instance, crl_message))
+        return results, not crl_errors, "; ".join(crl_errors)
+
+    @staticmethod
+    def _read_page_part(instance: VpnInstance, per_page: int,
+                        cursor_key: Optional[Tuple[str, str]]) -> Tuple[bool, Dict, str]:
+        """Читает из реестра сервера все, что нужно для общей страницы вокруг курсора"""
+        user_service = instance.user_service
+        if not user_service.user_index.refresh():
+            return False, {}, "Директория с .ovpn файлами не найдена!"
+
+        registry = user_service.registry
+        part = {'version': registry.version, 'total': registry.count()}
+        if cursor_key is None:
+            part['all'] = registry.get_all()
+            return True, part, ""
+
+        # Пользователь с тем же именем на сервере с меньшим именем стоит перед курсором
+        username, instance_name = cursor_key
+        before_inclusive = instance.name < instance_name
+        part['before'] = registry.count_before(username, inclusive=before_inclusive)
+        part['following'] = registry.get_range(username, per_page + 1, inclusive=not before_inclusive)
+        part['preceding'] = registry.get_range(username, per_page + 1, inclusive=before_inclusive,
+                                               descending=True)
+        return True, part, ""
+
+    @staticmethod
+    def _count_before(instance: VpnInstance, username: str, instance_name: str) -> int:
+        """Количество пользователей сервера, стоящих в общем списке перед (имя, сервер)"""
+        return instance.user_service.registry.count_before(username, inclusive=instance.name < instance_name)
+
+    @staticmethod
+    def _with_instance(instance: VpnInstance, message: str) -> str:
+        if instance.name:
+            return f"{instance.name}: {message}"
+        return message
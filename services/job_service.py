@@ -0,0 +1,303 @@
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+# Этапы выпуска сертификата в порядке выполнения
+STAGE_QUEUED = "queued"
+STAGE_GENERATING_KEY = "generating_key"
+STAGE_SIGNING = "signing"
+STAGE_WRITING_OVPN = "writing_ovpn"
+STAGE_DONE = "done"
+STAGE_FAILED = "failed"
+
+STAGE_TITLES = {
+    STAGE_QUEUED: "в очереди",
+    STAGE_GENERATING_KEY: "генерация ключа",
+    STAGE_SIGNING: "подпись сертификата",
+    STAGE_WRITING_OVPN: "запись .ovpn файла",
+    STAGE_DONE: "готово",
+    STAGE_FAILED: "ошибка",
+}
+
+# Этапы, для которых собирается статистика времени выполнения
+TIMED_STAGES = (STAGE_QUEUED, STAGE_GENERATING_KEY, STAGE_SIGNING, STAGE_WRITING_OVPN)
+
+
+class CertificateJob:
+    """Задача на выпуск сертификата и .ovpn файла для одного пользователя"""
+
+    def __init__(self, job_id: str, username: str,
+                 on_progress: Optional[Callable[["CertificateJob"], Awaitable[None]]] = None,
+                 created_by: Optional[int] = None):
+        self.job_id = job_id
+        self.username = username
+        self.on_progress = on_progress
+        self.created_by = created_by
+        self.stage = STAGE_QUEUED
+        self.created_at = time.monotonic()
+        self.stage_started_at = self.created_at
+        self.stage_timings: Dict[str, float] = {}
+        self.success: Optional[bool] = None
+        self.message = ""
+        self.done: asyncio.Future = asyncio.get_running_loop().create_future()
+
+    @property
+    def stage_title(self) -> str:
+        """Человекочитаемое название текущего этапа"""
+        return STAGE_TITLES.get(self.stage, self.stage)
+
+    @property
+    def finished(self) -> bool:
+        """Завершена ли задача (успешно или с ошибкой)"""
+        return self.stage in (STAGE_DONE, STAGE_FAILED)
+
+
+class JobService:
+    """Сервис асинхронной очереди выпуска сертификатов с ограниченным пулом воркеров"""
+
+    def __init__(self, user_service, workers: int = 2, max_queue: int = 100, history_size: int = 200):
+        self.user_service = user_service
+        self.workers = max(1, workers)
+        self.max_queue = max_queue
+        self.history_size = history_size
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker_tasks: List[asyncio.Task] = []
+        self._jobs: "OrderedDict[str, CertificateJob]" = OrderedDict()
+        self._pending_usernames: Dict[str, str] = {}
+        # Задачи, которые сейчас выполняют воркеры
+        self._running: Dict[str, CertificateJob] = {}
+        self._stopped = False
+        self._active = 0
+        self._completed = 0
+        self._failed = 0
+        self._stage_totals: Dict[str, float] = {stage: 0.0 for stage in TIMED_STAGES}
+        self._stage_counts: Dict[str, int] = {stage: 0 for stage in TIMED_STAGES}
+
+    def submit(self, username: str,
+               on_progress: Optional[Callable[[CertificateJob], Awaitable[None]]] = None,
+               created_by: Optional[int] = None
+               ) -> Tuple[bool, Optional[CertificateJob], str]:
+        """
+        Ставит выпуск сертификата в очередь и сразу возвращает задачу
+
+        Args:
+            username: Имя пользователя
+            on_progress: Корутина, вызываемая при каждой смене этапа
+            created_by: Telegram ID администратора, создающего пользователя
+
+        Returns:
+            Tuple[bool, Optional[CertificateJob], str]: (успех, задача, сообщение об ошибке)
+        """
+        if self._stopped:
+            return False, None, "Бот останавливается, повторите запрос после перезапуска"
+
+        if username in self._pending_usernames:
+            return False, None, (
+                f"Пользователь {username} уже создается "
+                f"(задача {self._pending_usernames[username]})"
+            )
+
+        self._ensure_workers()
+
+        if self._queue.full():
+            return False, None, "Очередь выпуска сертификатов переполнена, попробуйте позже"
+
+        job = CertificateJob(uuid.uuid4().hex[:8], username, on_progress, created_by)
+        self._queue.put_nowait(job)
+        self._pending_usernames[username] = job.job_id
+        self._remember(job)
+        return True, job, ""
+
+    async def run_bulk(self, usernames: List[str], parallelism: int,
+                       on_progress: Optional[Callable[[int, int, int], Awaitable[None]]] = None,
+                       created_by: Optional[int] = None
+                       ) -> List[Tuple[str, bool, str]]:
+        """
+        Создает нескольких пользователей, ограничивая число одновременных задач
+
+        Args:
+            usernames: Имена пользователей
+            parallelism: Максимальное число одновременно выполняемых задач
+            on_progress: Корутина, вызываемая с (завершено, ошибок, всего) после каждого пользователя
+            created_by: Telegram ID администратора, создающего пользователей
+
+        Returns:
+            List[Tuple[str, bool, str]]: (имя, успех, сообщение) в исходном порядке
+        """
+        semaphore = asyncio.Semaphore(max(1, parallelism))
+        results: Dict[str, Tuple[bool, str]] = {}
+        failed = 0
+
+        async def create(username: str):
+            nonlocal failed
+            async with semaphore:
+                success, job, error_message = self.submit(username, created_by=created_by)
+                if success:
+                    success, message = await job.done
+                else:
+                    message = error_message
+            results[username] = (success, message)
+            if not success:
+                failed += 1
+
+            if on_progress:
+                try:
+                    await on_progress(len(results), failed, len(usernames))
+                except Exception:
+                    logger.exception("Ошибка при обновлении прогресса пакетного создания")
+
+        await asyncio.gather(*(create(username) for username in usernames))
+        return [(username, *results[username]) for username in usernames]
+
+    def is_busy(self) -> bool:
+        """Выполняются ли или ожидают выполнения задачи"""
+        return self._active > 0 or bool(self._queue and not self._queue.empty())
+
+    def get_job(self, job_id: str) -> Optional[CertificateJob]:
+        """Получает задачу по идентификатору"""
+        return self._jobs.get(job_id)
+
+    async def stop(self):
+        """Останавливает воркеры и завершает с ошибкой прерванные и ожидающие задачи"""
+        self._stopped = True
+        interrupted = list(self._running.values())
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+
+        while self._queue and not self._queue.empty():
+            interrupted.append(self._queue.get_nowait())
+        if not interrupted:
+            return
+
+        logger.warning("Остановка прервала задачи выпуска сертификатов: %s",
+                       ", ".join(f"{job.job_id} ({job.username})" for job in interrupted))
+        for job in interrupted:
+            self._pending_usernames.pop(job.username, None)
+            # Подписчик получит ошибку, а ожидающие результат - ответ вместо вечного ожидания
+            await self._finish(job, False, "Бот остановлен до завершения задачи, повторите создание после перезапуска")
+
+    def get_stats(self) -> Dict:
+        """
+        Получает статистику очереди
+
+        Returns:
+            Dict: Глубина очереди, активные задачи, счетчики и среднее время этапов
+        """
+        average_timings = {}
+        for stage in TIMED_STAGES:
+            count = self._stage_counts[stage]
+            average_timings[stage] = self._stage_totals[stage] / count if count else 0.0
+
+        return {
+            'workers': self.workers,
+            'queue_depth': self._queue.qsize() if self._queue else 0,
+            'max_queue': self.max_queue,
+            'active': self._active,
+            'completed': self._completed,
+            'failed': self._failed,
+            'average_timings': average_timings,
+        }
+
+    def format_stats(self) -> str:
+        """
+        Форматирует статистику очереди для отправки в Telegram
+
+        Returns:
+            str: Отформатированная строка со статистикой
+        """
+        stats = self.get_stats()
+        text = (
+            "⚙️ **Очередь выпуска сертификатов:**\n\n"
+            f"👷 **Воркеры:** {stats['workers']}\n"
+            f"📥 **В очереди:** {stats['queue_depth']}/{stats['max_queue']}\n"
+            f"🔄 **Выполняется:** {stats['active']}\n"
+            f"✅ **Успешно:** {stats['completed']}\n"
+            f"❌ **С ошибкой:** {stats['failed']}\n\n"
+            "⏱ **Среднее время этапов:**\n"
+        )
+        for stage, seconds in stats['average_timings'].items():
+            text += f"• {STAGE_TITLES[stage]}: {seconds:.2f} с\n"
+        return text
+
+    def _ensure_workers(self):
+        """Лениво создает очередь и воркеры в текущем event loop"""
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+        if not self._worker_tasks:
+            self._worker_tasks = [
+                asyncio.create_task(self._worker(), name=f"cert-worker-{i}")
+                for i in range(self.workers)
+            ]
+
+    def _remember(self, job: CertificateJob):
+        """Сохраняет задачу в ограниченной истории"""
+        self._jobs[job.job_id] = job
+        while len(self._jobs) > self.history_size:
+            self._jobs.popitem(last=False)
+
+    async def _worker(self):
+        """Воркер, последовательно выполняющий задачи из очереди"""
+        while True:
+            job = await self._queue.get()
+            self._active += 1
+            self._running[job.job_id] = job
+            try:
+                await self._run_job(job)
+            finally:
+                self._active -= 1
+                self._running.pop(job.job_id, None)
+                self._pending_usernames.pop(job.username, None)
+                self._queue.task_done()
+
+    async def _run_job(self, job: CertificateJob):
+        """Выполняет задачу, обновляя этапы и статистику"""
+        async def on_stage(stage: str):
+            await self._set_stage(job, stage)
+
+        try:
+            success, message = await self.user_service.create_user_async(job.username, on_stage, job.created_by)
+        except Exception as e:
+            logger.exception("Ошибка задачи %s", job.job_id)
+            success, message = False, f"Ошибка при создании пользователя: {str(e)}"
+
+        await self._finish(job, success, message)
+
+    async def _finish(self, job: CertificateJob, success: bool, message: str):
+        """Завершает задачу с результатом и уведомляет подписчика"""
+        job.success = success
+        job.message = message
+        if success:
+            self._completed += 1
+        else:
+            self._failed += 1
+        await self._set_stage(job, STAGE_DONE if success else STAGE_FAILED)
+
+        # Ожидание результата могло быть отменено вместе с обработчиком, который его ждал
+        if not job.done.done():
+            job.done.set_result((success, message))
+
+    async def _set_stage(self, job: CertificateJob, stage: str):
+        """Переводит задачу на новый этап и уведомляет подписчика"""
+        now = time.monotonic()
+        elapsed = now - job.stage_started_at
+        job.stage_timings[job.stage] = job.stage_timings.get(job.stage, 0.0) + elapsed
+        if job.stage in self._stage_totals:
+            self._stage_totals[job.stage] += elapsed
+            self._stage_counts[job.stage] += 1
+
+        job.stage = stage
+        job.stage_started_at = now
+
+        if job.on_progress:
+            try:
+                await job.on_progress(job)
+            except Exception:
+                logger.exception("Ошибка при обновлении прогресса задачи %s", job.job_id)
@@ -0,0 +1,181 @@
+import asyncio
+import collections
+import logging
+import os
+import time
+import uuid
+from typing import Callable, Dict, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+class KeyPoolService:
+    """Сервис фоновой генерации запаса приватных ключей клиентов"""
+
+    def __init__(self, pool_dir: str, size: int = 0, refill_interval: float = 5.0,
+                 algorithm: str = "rsa:2048"):
+        self.pool_dir = pool_dir
+        self.size = size
+        self.refill_interval = refill_interval
+        self.algorithm = algorithm
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+        self._generation_time = 0.0
+        self._keys: "collections.deque[str]" = collections.deque()
+        self._task: Optional[asyncio.Task] = None
+        self._is_busy: Callable[[], bool] = lambda: False
+
+    @property
+    def enabled(self) -> bool:
+        """Включен ли пул ключей"""
+        return self.size > 0
+
+    def set_busy_check(self, is_busy: Callable[[], bool]):
+        """
+        Задает проверку занятости, при которой пополнение пула откладывается
+
+        Args:
+            is_busy: Функция, возвращающая True, пока выполняются задачи выпуска
+        """
+        self._is_busy = is_busy
+
+    async def start(self):
+        """Загружает готовые ключи и запускает фоновое пополнение пула"""
+        if not self.enabled or self._task:
+            return
+
+        os.makedirs(self.pool_dir, mode=0o700, exist_ok=True)
+        for filename in sorted(os.listdir(self.pool_dir)):
+            if filename.endswith(".key"):
+                self._keys.append(os.path.join(self.pool_dir, filename))
+            elif filename.endswith(".tmp"):
+                # Остатки прерванной генерации
+                os.remove(os.path.join(self.pool_dir, filename))
+
+        self._task = asyncio.create_task(self._refill_loop(), name="key-pool-refill")
+
+    async def stop(self):
+        """Останавливает фоновое пополнение пула"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def take(self) -> Optional[str]:
+        """
+        Забирает готовый ключ из пула
+
+        Попадание засчитывается вызывающим через record_hit, когда запрос
+        для ключа уже создан; пустой пул сразу считается промахом.
+
+        Returns:
+            Optional[str]: Путь к файлу ключа или None, если пул пуст
+        """
+        if not self.enabled:
+            return None
+
+        while self._keys:
+            key_path = self._keys.popleft()
+            if os.path.exists(key_path):
+                return key_path
+
+        self.record_miss()
+        return None
+
+    def record_hit(self):
+        """Засчитывает попадание: ключ из пула использован для запроса"""
+        self.hits += 1
+
+    def record_miss(self):
+        """Засчитывает промах: ключа не было или его не удалось использовать"""
+        if self.enabled:
+            self.misses += 1
+
+    def get_stats(self) -> Dict:
+        """
+        Получает статистику пула
+
+        Returns:
+            Dict: Размер пула, параметры пополнения и счетчики попаданий
+        """
+        return {
+            'enabled': self.enabled,
+            'ready': len(self._keys),
+            'size': self.size,
+            'refill_interval': self.refill_interval,
+            'algorithm': self.algorithm,
+            'hits': self.hits,
+            'misses': self.misses,
+            'generated': self.generated,
+            'average_generation_time': self._generation_time / self.generated if self.generated else 0.0,
+        }
+
+    def format_stats(self) -> str:
+        """
+        Форматирует статистику пула для отправки в Telegram
+
+        Returns:
+            str: Отформатированная строка со статистикой
+        """
+        stats = self.get_stats()
+        if not stats['enabled']:
+            return "🔑 **Пул ключей отключен**\n\nЗадайте KEY_POOL_SIZE, чтобы включить его."
+
+        requests_total = stats['hits'] + stats['misses']
+        hit_rate = stats['hits'] / requests_total * 100 if requests_total else 0.0
+        return (
+            "🔑 **Пул ключей:**\n\n"
+            f"📦 **Готово:** {stats['ready']}/{stats['size']}\n"
+            f"🔐 **Алгоритм:** `{stats['algorithm']}`\n"
+            f"⏱ **Интервал пополнения:** {stats['refill_interval']:.1f} с\n"
+            f"⚡ **Среднее время генерации:** {stats['average_generation_time']:.2f} с\n"
+            f"🏭 **Сгенерировано:** {stats['generated']}\n"
+            f"🎯 **Попадания:** {stats['hits']}\n"
+            f"💨 **Промахи:** {stats['misses']}\n"
+            f"📈 **Доля попаданий:** {hit_rate:.0f}%"
+        )
+
+    async def _refill_loop(self):
+        """Пополняет пул по одному ключу, пока не идет выпуск сертификатов"""
+        while True:
+            try:
+                if len(self._keys) < self.size and not self._is_busy():
+                    await self._generate_key()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Ошибка при пополнении пула ключей")
+            await asyncio.sleep(self.refill_interval)
+
+    async def _generate_key(self):
+        """Генерирует один приватный ключ и атомарно добавляет его в пул"""
+        key_name = uuid.uuid4().hex
+        tmp_path = os.path.join(self.pool_dir, f"{key_name}.tmp")
+        key_path = os.path.join(self.pool_dir, f"{key_name}.key")
+
+        algorithm, _, parameter = self.algorithm.partition(":")
+        if algorithm.lower() == "ec":
+            key_args = ["-algorithm", "EC", "-pkeyopt", f"ec_paramgen_curve:{parameter or 'secp384r1'}"]
+        else:
+            key_args = ["-algorithm", "RSA", "-pkeyopt", f"rsa_keygen_bits:{parameter or '2048'}"]
+
+        started = time.monotonic()
+        # umask 077: ключ создается сразу с правами 0600, а не открывается на чтение до chmod
+        process = await asyncio.create_subprocess_exec(
+            "openssl", "genpkey", *key_args, "-out", tmp_path,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+            umask=0o077
+        )
+        _, stderr = await process.communicate()
+        if process.returncode != 0:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise RuntimeError(stderr.decode(errors="replace"))
+
+        os.replace(tmp_path, key_path)
+        self._keys.append(key_path)
+        self.generated += 1
+        self._generation_time += time.monotonic() - started
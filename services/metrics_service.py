@@ -0,0 +1,245 @@
+import bisect
+import contextlib
+import logging
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм по умолчанию, секунды
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelsKey = Tuple[Tuple[str, str], ...]
+
+
+class _Histogram:
+    """Гистограмма с фиксированными корзинами"""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, fraction: float) -> float:
+        """Оценивает квантиль по верхней границе корзины"""
+        if not self.count:
+            return 0.0
+        target = fraction * self.count
+        cumulative = 0
+        for idx, bucket_count in enumerate(self.counts):
+            cumulative += bucket_count
+            if cumulative >= target:
+                return self.buckets[idx] if idx < len(self.buckets) else float("inf")
+        return float("inf")
+
+
+class MetricsService:
+    """Сервис сбора метрик в формате Prometheus"""
+
+    def __init__(self):
+        self._descriptions: Dict[str, Tuple[str, str]] = {}
+        self._counters: Dict[str, Dict[LabelsKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelsKey, _Histogram]] = {}
+        self._buckets: Dict[str, Tuple[float, ...]] = {}
+        self._lock = threading.Lock()
+        self._runner = None
+
+    def describe(self, name: str, metric_type: str, help_text: str,
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        """
+        Регистрирует метрику
+
+        Args:
+            name: Имя метрики
+            metric_type: counter или histogram
+            help_text: Описание метрики
+            buckets: Границы корзин для гистограммы
+        """
+        self._descriptions[name] = (metric_type, help_text)
+        if metric_type == "histogram":
+            self._buckets[name] = tuple(sorted(buckets))
+            self._histograms.setdefault(name, {})
+        else:
+            self._counters.setdefault(name, {})
+
+    def inc(self, name: str, value: float = 1.0, **labels: str):
+        """Увеличивает счетчик"""
+        key = self._labels_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels: str):
+        """Добавляет значение в гистограмму"""
+        key = self._labels_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = _Histogram(self._buckets.get(name, DEFAULT_BUCKETS))
+            histogram.observe(value)
+
+    @contextlib.contextmanager
+    def time(self, name: str, **labels: str) -> Iterator[None]:
+        """Замеряет длительность блока кода и добавляет ее в гистограмму"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def render(self) -> str:
+        """
+        Формирует текстовое представление метрик для Prometheus
+
+        Returns:
+            str: Метрики в формате text exposition 0.0.4
+        """
+        lines: List[str] = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                self._render_header(lines, name, "counter")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{name}{self._format_labels(key)} {value:g}")
+
+            for name, series in sorted(self._histograms.items()):
+                self._render_header(lines, name, "histogram")
+                for key, histogram in sorted(series.items()):
+                    cumulative = 0
+                    for bucket, bucket_count in zip(histogram.buckets, histogram.counts):
+                        cumulative += bucket_count
+                        lines.append(f"{name}_bucket{self._format_labels(key, le=f'{bucket:g}')} {cumulative}")
+                    lines.append(f"{name}_bucket{self._format_labels(key, le='+Inf')} {histogram.count}")
+                    lines.append(f"{name}_sum{self._format_labels(key)} {histogram.sum:.6f}")
+                    lines.append(f"{name}_count{self._format_labels(key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def get_histogram_summary(self, name: str, label: str) -> List[Dict]:
+        """
+        Сводка гистограммы по значениям одной метки
+
+        Args:
+            name: Имя гистограммы
+            label: Метка, по которой группируются ряды
+
+        Returns:
+            List[Dict]: Значение метки (и остальных меток ряда), количество, среднее и p95 в секундах
+        """
+        summary = []
+        with self._lock:
+            for key, histogram in sorted(self._histograms.get(name, {}).items()):
+                labels = dict(key)
+                summary.append({
+                    **labels,
+                    label: labels.get(label, ""),
+                    'count': histogram.count,
+                    'mean': histogram.sum / histogram.count if histogram.count else 0.0,
+                    'p95': histogram.quantile(0.95),
+                })
+        return summary
+
+    def get_counter_total(self, name: str, **labels: str) -> float:
+        """Суммирует ряды счетчика, совпадающие с заданными метками"""
+        with self._lock:
+            return sum(
+                value for key, value in self._counters.get(name, {}).items()
+                if all(dict(key).get(label) == expected for label, expected in labels.items())
+            )
+
+    def format_stats(self) -> str:
+        """
+        Форматирует сводку метрик бота для отправки в Telegram
+
+        Returns:
+            str: Отформатированная строка со статистикой
+        """
+        text = "📊 **Статистика бота:**\n\n⚡ **Обработчики** (кол-во / среднее / p95):\n"
+        handlers = self.get_histogram_summary("bot_handler_duration_seconds", "handler")
+        for item in sorted(handlers, key=lambda item: -item['count']):
+            errors = self.get_counter_total("bot_handler_errors_total", handler=item['handler'])
+            text += (
+                f"• `{item['handler']}`: {item['count']} / {item['mean'] * 1000:.0f} мс / "
+                f"≤{item['p95'] * 1000:.0f} мс" + (f", ошибок: {errors:g}" if errors else "") + "\n"
+            )
+        if not handlers:
+            text += "нет данных\n"
+
+        text += "\n🔐 **Этапы выпуска сертификатов:**\n"
+        stages = self.get_histogram_summary("ovpn_subprocess_duration_seconds", "stage")
+        for item in stages:
+            stage = f"{item['instance']}:{item['stage']}" if item.get('instance') else item['stage']
+            text += f"• `{stage}`: {item['count']} / {item['mean']:.2f} с / ≤{item['p95']:.2f} с\n"
+        if not stages:
+            text += "нет данных\n"
+
+        scans = self.get_histogram_summary("ovpn_directory_scan_seconds", "")
+        if scans:
+            text += (
+                f"\n📁 **Сканирования директории:** {scans[0]['count']}, "
+                f"среднее {scans[0]['mean'] * 1000:.1f} мс"
+            )
+        return text
+
+    async def start_http_server(self, host: str, port: int):
+        """
+        Запускает локальный HTTP сервер с эндпоинтом /metrics
+
+        Ошибка привязки к порту только записывается в лог: бот продолжает работать без /metrics.
+
+        Args:
+            host: Адрес для прослушивания
+            port: Порт
+        """
+        from aiohttp import web
+
+        async def handle_metrics(request: web.Request) -> web.Response:
+            return web.Response(text=self.render(), content_type="text/plain", charset="utf-8",
+                                headers={"X-Content-Type-Options": "nosniff"})
+
+        app = web.Application()
+        app.router.add_get("/metrics", handle_metrics)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        try:
+            await web.TCPSite(self._runner, host, port).start()
+        except OSError as e:
+            logger.error("Не удалось запустить сервер метрик на %s:%s: %s", host, port, e)
+            await self._runner.cleanup()
+            self._runner = None
+            return
+        logger.info("Метрики доступны на http://%s:%s/metrics", host, port)
+
+    async def stop_http_server(self):
+        """Останавливает HTTP сервер метрик"""
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def _render_header(self, lines: List[str], name: str, default_type: str):
+        metric_type, help_text = self._descriptions.get(name, (default_type, ""))
+        if help_text:
+            lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+
+    def _labels_key(self, labels: Dict[str, str]) -> LabelsKey:
+        return tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+    def _format_labels(self, key: LabelsKey, le: Optional[str] = None) -> str:
+        pairs = list(key) + ([("le", le)] if le is not None else [])
+        if not pairs:
+            return ""
+        escaped = (
+            f'{label}="' + value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') + '"'
+            for label, value in pairs
+        )
+        return "{" + ",".join(escaped) + "}"
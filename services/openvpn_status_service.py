@@ -0,0 +1,305 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+# Формат времени в status-version 1 и в текстовых колонках версий 2/3
+STATUS_TIME_FORMAT = "%a %b %d %H:%M:%S %Y"
+
+# Максимальное количество клиентов в ответе /online, чтобы не превысить лимит сообщения
+ONLINE_LIST_LIMIT = 50
+
+
+class ConnectedClient:
+    """Подключенный клиент OpenVPN"""
+
+    __slots__ = ("common_name", "real_address", "virtual_address",
+                 "bytes_received", "bytes_sent", "connected_since")
+
+    def __init__(self, common_name: str, real_address: str, virtual_address: str,
+                 bytes_received: int, bytes_sent: int, connected_since: int):
+        self.common_name = common_name
+        self.real_address = real_address
+        self.virtual_address = virtual_address
+        self.bytes_received = bytes_received
+        self.bytes_sent = bytes_sent
+        self.connected_since = connected_since
+
+
+class OpenVPNStatusService:
+    """Сервис фонового сбора списка подключенных клиентов OpenVPN"""
+
+    def __init__(self, status_path: str, management_address: str = "",
+                 management_password: str = "", interval: float = 10.0, timeout: float = 5.0):
+        self.status_path = status_path
+        self.management_address = management_address
+        self.management_password = management_password
+        self.interval = interval
+        self.timeout = timeout
+        self.clients: Tuple[ConnectedClient, ...] = ()
+        self.updated_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self._status_signature: Optional[Tuple[int, int]] = None
+        self._listeners: List[Callable[[Tuple[ConnectedClient, ...], float], None]] = []
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def source(self) -> str:
+        """Источник данных: интерфейс управления или status файл"""
+        return f"management {self.management_address}" if self.management_address else self.status_path
+
+    def add_listener(self, listener: Callable[[Tuple[ConnectedClient, ...], float], None]):
+        """
+        Подписывает функцию на каждый новый снимок подключенных клиентов
+
+        Args:
+            listener: Функция, получающая клиентов и время снимка
+        """
+        self._listeners.append(listener)
+
+    async def start(self):
+        """Запускает фоновый сбор"""
+        if self._task:
+            return
+        self._task = asyncio.create_task(self._collect_loop(), name="openvpn-status")
+
+    async def stop(self):
+        """Останавливает фоновый сбор"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def refresh(self) -> bool:
+        """
+        Обновляет снимок подключенных клиентов
+
+        Returns:
+            bool: True, если снимок обновлен
+        """
+        try:
+            if self.management_address:
+                clients = self.parse_status(await self._query_management())
+            else:
+                clients = await asyncio.to_thread(self._read_status_file)
+                if clients is None:
+                    # Файл не менялся с прошлого чтения
+                    self.updated_at = time.time()
+                    return False
+        except (OSError, ValueError, asyncio.TimeoutError) as e:
+            self.last_error = str(e) or type(e).__name__
+            self._status_signature = None
+            return False
+
+        self.clients = tuple(sorted(clients, key=lambda client: client.common_name))
+        self.updated_at = time.time()
+        self.last_error = None
+        for listener in self._listeners:
+            try:
+                listener(self.clients, self.updated_at)
+            except Exception:
+                logger.exception("Ошибка обработчика снимка клиентов")
+        return True
+
+    def get_snapshot(self) -> Tuple[Tuple[ConnectedClient, ...], Optional[float]]:
+        """
+        Получает последний снимок без обращения к OpenVPN
+
+        Returns:
+            Tuple[Tuple[ConnectedClient, ...], Optional[float]]: (клиенты, время снимка)
+        """
+        return self.clients, self.updated_at
+
+    def format_online(self) -> str:
+        """
+        Форматирует список подключенных клиентов для отправки в Telegram
+
+        Returns:
+            str: Отформатированная строка со списком клиентов
+        """
+        clients, updated_at = self.get_snapshot()
+        if updated_at is None:
+            if self.last_error:
+                return f"❌ Не удалось получить статус OpenVPN ({self.source}): {self.last_error}"
+            return "⏳ Статус OpenVPN еще не получен, попробуйте через несколько секунд"
+
+        now = time.time()
+        text = f"🟢 **Подключено клиентов:** {len(clients)}\n\n"
+        for client in clients[:ONLINE_LIST_LIMIT]:
+            text += (
+                f"👤 **{client.common_name}** `{client.virtual_address or '-'}`\n"
+                # Трафик с точки зрения клиента: полученное сервером - исходящий трафик клиента
+                f"    🌐 {client.real_address} · ⬆️ {self.format_bytes(client.bytes_received)}"
+                f" · ⬇️ {self.format_bytes(client.bytes_sent)}"
+                f" · ⏱ {self._format_duration(now - client.connected_since)}\n"
+            )
+        if len(clients) > ONLINE_LIST_LIMIT:
+            text += f"\n... и еще {len(clients) - ONLINE_LIST_LIMIT}\n"
+
+        text += f"\n🕐 Обновлено {max(now - updated_at, 0):.0f} с назад"
+        if self.last_error:
+            text += f"\n⚠️ Последняя ошибка: {self.last_error}"
+        return text
+
+    @staticmethod
+    def parse_status(content: str) -> List[ConnectedClient]:
+        """
+        Разбирает вывод status OpenVPN версий 1, 2 и 3
+
+        Args:
+            content: Содержимое status файла или ответа на команду status
+
+        Returns:
+            List[ConnectedClient]: Подключенные клиенты
+        """
+        clients: Dict[str, ConnectedClient] = {}
+        virtual_addresses: Dict[str, str] = {}
+        headers: Dict[str, List[str]] = {}
+        section = ""
+
+        for line in content.splitlines():
+            if not line or line.startswith(">"):
+                continue
+            separator = "\t" if "\t" in line else ","
+            fields = line.split(separator)
+            tag = fields[0]
+
+            # Версии 2 и 3: строки помечены типом, колонки описаны в HEADER
+            if tag == "HEADER" and len(fields) > 1:
+                headers[fields[1]] = fields[2:]
+                continue
+            if tag == "CLIENT_LIST" and tag in headers:
+                row = dict(zip(headers[tag], fields[1:]))
+                connected_since = row.get("Connected Since (time_t)", "")
+                client = ConnectedClient(
+                    common_name=row.get("Common Name", ""),
+                    real_address=row.get("Real Address", ""),
+                    virtual_address=row.get("Virtual Address", ""),
+                    bytes_received=int(row.get("Bytes Received") or 0),
+                    bytes_sent=int(row.get("Bytes Sent") or 0),
+                    connected_since=int(connected_since) if connected_since.isdigit()
+                    else OpenVPNStatusService._parse_time(row.get("Connected Since", "")),
+                )
+                clients[client.real_address] = client
+                continue
+            if tag in ("TITLE", "TIME", "ROUTING_TABLE", "GLOBAL_STATS", "END"):
+                continue
+
+            # Версия 1: секции с заголовками-строками
+            if tag in ("OpenVPN CLIENT LIST", "ROUTING TABLE", "GLOBAL STATS"):
+                section = tag
+                continue
+            if tag in ("Updated", "Common Name", "Virtual Address"):
+                continue
+            if section == "OpenVPN CLIENT LIST" and len(fields) >= 5:
+                client = ConnectedClient(
+                    common_name=fields[0],
+                    real_address=fields[1],
+                    virtual_address="",
+                    bytes_received=int(fields[2]),
+                    bytes_sent=int(fields[3]),
+                    connected_since=OpenVPNStatusService._parse_time(fields[4]),
+                )
+                clients[client.real_address] = client
+            elif section == "ROUTING TABLE" and len(fields) >= 3:
+                # Адрес с суффиксом C - внутренний маршрут (iroute), а не адрес клиента
+                if not fields[0].endswith("C"):
+                    virtual_addresses.setdefault(fields[2], fields[0])
+
+        for real_address, virtual_address in virtual_addresses.items():
+            if real_address in clients and not clients[real_address].virtual_address:
+                clients[real_address].virtual_address = virtual_address
+        return list(clients.values())
+
+    @staticmethod
+    def _parse_time(value: str) -> int:
+        """Переводит время из status файла (локальное время сервера) в unix time"""
+        try:
+            return int(time.mktime(time.strptime(value.strip(), STATUS_TIME_FORMAT)))
+        except ValueError:
+            return 0
+
+    def _read_status_file(self) -> Optional[List[ConnectedClient]]:
+        """Читает status файл, если он изменился с прошлого чтения"""
+        file_stat = os.stat(self.status_path)
+        signature = (file_stat.st_mtime_ns, file_stat.st_size)
+        if signature == self._status_signature:
+            return None
+
+        with open(self.status_path, 'r', errors="replace") as status_file:
+            content = status_file.read()
+        # OpenVPN перезаписывает файл целиком; без END файл прочитан во время записи
+        if "END" not in content[-16:]:
+            raise ValueError("status файл записан не полностью")
+
+        self._status_signature = signature
+        return self.parse_status(content)
+
+    async def _query_management(self) -> str:
+        """Запрашивает status 2 у интерфейса управления OpenVPN"""
+        if self.management_address.startswith("/"):
+            connection = asyncio.open_unix_connection(self.management_address)
+        else:
+            host, _, port = self.management_address.rpartition(":")
+            connection = asyncio.open_connection(host or "127.0.0.1", int(port))
+        reader, writer = await asyncio.wait_for(connection, self.timeout)
+
+        try:
+            async def read_response() -> str:
+                if self.management_password:
+                    await reader.readuntil(b":")
+                    writer.write(self.management_password.encode() + b"\n")
+                writer.write(b"status 2\n")
+                await writer.drain()
+
+                lines = []
+                while True:
+                    line = (await reader.readline()).decode(errors="replace").rstrip("\r\n")
+                    if not line and reader.at_eof():
+                        raise ValueError("интерфейс управления закрыл соединение")
+                    if line.startswith("ERROR"):
+                        raise ValueError(line)
+                    lines.append(line)
+                    if line == "END":
+                        return "\n".join(lines)
+
+            return await asyncio.wait_for(read_response(), self.timeout)
+        finally:
+            writer.close()
+
+    async def _collect_loop(self):
+        """Периодически обновляет снимок подключенных клиентов"""
+        while True:
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Ошибка при сборе статуса OpenVPN")
+            await asyncio.sleep(self.interval)
+
+    @staticmethod
+    def format_bytes(value: int) -> str:
+        """Форматирует количество байт"""
+        for unit in ("B", "KB", "MB", "GB"):
+            if value < 1024:
+                return f"{value:.0f} {unit}" if unit == "B" else f"{value:.1f} {unit}"
+            value /= 1024
+        return f"{value:.1f} TB"
+
+    @staticmethod
+    def _format_duration(seconds: float) -> str:
+        """Форматирует длительность подключения"""
+        seconds = int(max(seconds, 0))
+        days, seconds = divmod(seconds, 86400)
+        hours, seconds = divmod(seconds, 3600)
+        minutes = seconds // 60
+        if days:
+            return f"{days} д {hours} ч"
+        if hours:
+            return f"{hours} ч {minutes} мин"
+        return f"{minutes} мин"
@@ -0,0 +1,202 @@
+import bisect
+import calendar
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+# Статусы строк pki/index.txt
+STATUS_VALID = "V"
+STATUS_REVOKED = "R"
+STATUS_EXPIRED = "E"
+
+
+class CertificateRecord:
+    """Запись о сертификате из базы easy-rsa"""
+
+    __slots__ = ("common_name", "status", "expires_at", "revoked_at", "serial")
+
+    def __init__(self, common_name: str, status: str, expires_at: int, revoked_at: int, serial: str):
+        self.common_name = common_name
+        self.status = status
+        self.expires_at = expires_at
+        self.revoked_at = revoked_at
+        self.serial = serial
+
+    def is_valid(self, now: Optional[float] = None) -> bool:
+        """Действителен ли сертификат: не отозван и не истек"""
+        return self.status == STATUS_VALID and self.expires_at > (time.time() if now is None else now)
+
+
+class PkiIndex:
+    """Индекс сертификатов easy-rsa, построенный по pki/index.txt"""
+
+    # См. UserIndex.RACY_MTIME_SECONDS
+    RACY_MTIME_SECONDS = 1.0
+
+    def __init__(self, index_path: str):
+        self.index_path = index_path
+        self.version = 0
+        self._records: Dict[str, CertificateRecord] = {}
+        self._expiry: List[Tuple[int, str]] = []
+        self._expiry_dirty = False
+        self._signature: Optional[Tuple[int, int, int]] = None
+        # Прочитанная часть файла и ее последняя строка для проверки, что файл только дописан
+        self._offset = 0
+        self._last_line = b""
+        self._lock = threading.RLock()
+
+    def refresh(self) -> bool:
+        """
+        Синхронизирует индекс с index.txt, если файл изменился
+
+        Новые сертификаты дописываются в конец файла, поэтому обычно
+        разбирается только добавленная часть. Если файл был переписан
+        (отзыв меняет строку в середине), он разбирается заново.
+
+        Returns:
+            bool: True, если index.txt существует
+        """
+        with self._lock:
+            try:
+                file_stat = os.stat(self.index_path)
+            except FileNotFoundError:
+                if self._records:
+                    self._reset()
+                    self.version += 1
+                self._signature = None
+                return False
+
+            signature = (file_stat.st_ino, file_stat.st_size, file_stat.st_mtime_ns)
+            if signature == self._signature:
+                return True
+
+            with open(self.index_path, 'rb') as index_file:
+                if not self._is_appended(index_file, file_stat.st_size):
+                    self._reset()
+                index_file.seek(self._offset)
+                changed = self._parse(index_file.read())
+
+            if changed:
+                self.version += 1
+
+            # Недавнее изменение не запоминаем, чтобы не пропустить следующее
+            if time.time() - file_stat.st_mtime_ns / 1e9 > self.RACY_MTIME_SECONDS:
+                self._signature = signature
+            else:
+                self._signature = None
+            return True
+
+    def invalidate(self):
+        """Заставляет разобрать файл заново при следующем обращении"""
+        with self._lock:
+            self._signature = None
+            self._offset = 0
+            self._last_line = b""
+
+    def get(self, common_name: str) -> Optional[CertificateRecord]:
+        """Получает актуальную запись о сертификате пользователя"""
+        return self._records.get(common_name)
+
+    def has_valid(self, common_name: str) -> bool:
+        """Есть ли у пользователя действующий (не отозванный) сертификат"""
+        record = self._records.get(common_name)
+        return record is not None and record.status == STATUS_VALID
+
+    def get_expiring(self, within: float, now: Optional[float] = None) -> List[CertificateRecord]:
+        """
+        Получает действующие сертификаты, истекающие в заданный срок
+
+        Args:
+            within: Срок, секунды
+            now: Текущее время (по умолчанию time.time())
+
+        Returns:
+            List[CertificateRecord]: Сертификаты в порядке истечения, включая уже истекшие
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            if self._expiry_dirty:
+                self._expiry = sorted(
+                    (record.expires_at, common_name)
+                    for common_name, record in self._records.items() if record.status == STATUS_VALID
+                )
+                self._expiry_dirty = False
+            end_idx = bisect.bisect_right(self._expiry, (now + within, "\U0010ffff"))
+            return [self._records[common_name] for _, common_name in self._expiry[:end_idx]]
+
+    def _is_appended(self, index_file, size: int) -> bool:
+        """Проверяет, что уже разобранная часть файла не изменилась"""
+        if not self._offset or size < self._offset:
+            return False
+        index_file.seek(self._offset - len(self._last_line))
+        return index_file.read(len(self._last_line)) == self._last_line
+
+    def _reset(self):
+        self._records = {}
+        self._expiry = []
+        self._expiry_dirty = False
+        self._offset = 0
+        self._last_line = b""
+
+    def _parse(self, data: bytes) -> bool:
+        """Разбирает полные строки и сдвигает позицию чтения"""
+        end_idx = data.rfind(b"\n") + 1
+        if not end_idx:
+            return False
+
+        changed = False
+        lines = data[:end_idx].splitlines(keepends=True)
+        for line in lines:
+            record = self._parse_line(line.decode(errors="replace"))
+            if record is None:
+                continue
+            current = self._records.get(record.common_name)
+            # У одного имени могут быть отозванные и действующий сертификаты; приоритет у действующего
+            if current is None or record.status == STATUS_VALID or current.status != STATUS_VALID \
+                    or current.serial == record.serial:
+                self._records[record.common_name] = record
+                changed = True
+
+        self._offset += end_idx
+        self._last_line = lines[-1]
+        if changed:
+            self._expiry_dirty = True
+        return changed
+
+    def _parse_line(self, line: str) -> Optional[CertificateRecord]:
+        """
+        Разбирает строку index.txt:
+        статус, срок действия, дата отзыва[,причина], серийный номер, файл, subject
+        """
+        fields = line.rstrip("\r\n").split("\t")
+        if len(fields) < 6 or fields[0] not in (STATUS_VALID, STATUS_REVOKED, STATUS_EXPIRED):
+            return None
+
+        common_name = ""
+        for part in fields[5].split("/"):
+            if part.startswith("CN="):
+                common_name = part[3:]
+        if not common_name:
+            return None
+
+        return CertificateRecord(
+            common_name=common_name,
+            status=fields[0],
+            expires_at=self._parse_time(fields[1]),
+            revoked_at=self._parse_time(fields[2].split(",")[0]),
+            serial=fields[3],
+        )
+
+    @staticmethod
+    def _parse_time(value: str) -> int:
+        """Переводит время ASN.1 (YYMMDDHHMMSSZ или YYYYMMDDHHMMSSZ, UTC) в unix time"""
+        value = value.rstrip("Z")
+        if len(value) == 12:
+            # Двузначный год по правилам UTCTime: 50-99 - это 1950-1999
+            value = ("19" if int(value[:2]) >= 50 else "20") + value
+        if len(value) != 14 or not value.isdigit():
+            return 0
+        return calendar.timegm((int(value[:4]), int(value[4:6]), int(value[6:8]),
+                                int(value[8:10]), int(value[10:12]), int(value[12:14]), 0, 0, 0))
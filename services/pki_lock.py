@@ -0,0 +1,68 @@
+import asyncio
+import contextlib
+import fcntl
+import os
+import time
+from typing import AsyncIterator, Iterator
+
+
+class PkiLock:
+    """
+    Межпроцессная блокировка изменений PKI easy-rsa
+
+    Используется flock на отдельном файле, поэтому ту же блокировку берет
+    add_user.sh (утилита flock). Блокировка нужна только изменяющим PKI
+    командам (gen-req и удаление ключа и запроса после ошибки, sign-req,
+    revoke, gen-crl): чтение index.txt и списков пользователей ее не берет
+    и не ждет.
+    """
+
+    # Интервал повторных попыток взять занятую блокировку
+    POLL_INTERVAL = 0.05
+
+    def __init__(self, lock_path: str, timeout: float = 120.0):
+        self.lock_path = lock_path
+        self.timeout = timeout
+        # Корутины бота ждут друг друга здесь, не опрашивая файл
+        self._async_lock = asyncio.Lock()
+
+    @contextlib.asynccontextmanager
+    async def acquire_async(self) -> AsyncIterator[None]:
+        """Берет блокировку, не блокируя event loop"""
+        async with self._async_lock:
+            fd = self._open()
+            try:
+                deadline = time.monotonic() + self.timeout
+                while not self._try_lock(fd):
+                    if time.monotonic() > deadline:
+                        raise TimeoutError(f"PKI занята другим процессом дольше {self.timeout:.0f} с")
+                    await asyncio.sleep(self.POLL_INTERVAL)
+                yield
+            finally:
+                # Закрытие дескриптора снимает flock
+                os.close(fd)
+
+    @contextlib.contextmanager
+    def acquire(self) -> Iterator[None]:
+        """Берет блокировку в синхронном коде"""
+        fd = self._open()
+        try:
+            deadline = time.monotonic() + self.timeout
+            while not self._try_lock(fd):
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"PKI занята другим процессом дольше {self.timeout:.0f} с")
+                time.sleep(self.POLL_INTERVAL)
+            yield
+        finally:
+            os.close(fd)
+
+    def _open(self) -> int:
+        return os.open(self.lock_path, os.O_RDWR | os.O_CREAT | os.O_CLOEXEC, 0o600)
+
+    @staticmethod
+    def _try_lock(fd: int) -> bool:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
@@ -0,0 +1,108 @@
+import os
+import threading
+import uuid
+from typing import Optional, Tuple
+
+
+class ProfileBuilder:
+    """Сборщик .ovpn профилей с кэшированным заголовком client-common.txt"""
+
+    def __init__(self, client_common_path: str, ovpn_dir: str):
+        self.client_common_path = client_common_path
+        self.ovpn_dir = ovpn_dir
+        self._header: Optional[bytes] = None
+        self._header_version: Optional[Tuple[int, int]] = None
+        self._lock = threading.Lock()
+
+    def get_header(self) -> bytes:
+        """
+        Получает заголовок профиля - client-common.txt без строк комментариев
+
+        Файл перечитывается, только если изменились его mtime или размер.
+
+        Returns:
+            bytes: Отфильтрованное содержимое client-common.txt
+        """
+        stat = os.stat(self.client_common_path)
+        version = (stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            if version != self._header_version:
+                with open(self.client_common_path, 'rb') as common_file:
+                    self._header = b"".join(line for line in common_file if not line.startswith(b'#'))
+                self._header_version = version
+            return self._header
+
+    def render(self, inline_credentials: str) -> bytes:
+        """
+        Собирает содержимое профиля в памяти
+
+        Args:
+            inline_credentials: Inline блок с ключами пользователя
+
+        Returns:
+            bytes: Содержимое .ovpn файла
+        """
+        return self.get_header() + inline_credentials.encode()
+
+    def build(self, username: str, inline_credentials: str) -> int:
+        """
+        Атомарно записывает .ovpn файл пользователя
+
+        Args:
+            username: Имя пользователя
+            inline_credentials: Inline блок с ключами пользователя
+
+        Returns:
+            int: Размер записанного файла в байтах
+        """
+        return self._write(username, self.get_header(), inline_credentials.encode())
+
+    def build_if_changed(self, username: str, inline_credentials: str,
+                         header: Optional[bytes] = None) -> Optional[int]:
+        """
+        Перезаписывает профиль, только если его содержимое изменится
+
+        Args:
+            username: Имя пользователя
+            inline_credentials: Inline блок с ключами пользователя
+            header: Заранее полученный заголовок (для массовой пересборки)
+
+        Returns:
+            Optional[int]: Размер нового файла или None, если файл не изменился
+        """
+        header = self.get_header() if header is None else header
+        credentials = inline_credentials.encode()
+        ovpn_file_path = os.path.join(self.ovpn_dir, f"{username}.ovpn")
+
+        try:
+            if os.path.getsize(ovpn_file_path) == len(header) + len(credentials):
+                with open(ovpn_file_path, 'rb') as ovpn_file:
+                    if ovpn_file.read() == header + credentials:
+                        return None
+        except FileNotFoundError:
+            pass
+
+        return self._write(username, header, credentials)
+
+    def _write(self, username: str, *chunks: bytes) -> int:
+        """Записывает части профиля во временный файл и переименовывает его"""
+        os.makedirs(self.ovpn_dir, exist_ok=True)
+        ovpn_file_path = os.path.join(self.ovpn_dir, f"{username}.ovpn")
+        # Временный файл не попадает под маску *.ovpn, поэтому не виден в списках
+        tmp_path = os.path.join(self.ovpn_dir, f".{username}.{uuid.uuid4().hex}.tmp")
+
+        try:
+            with open(tmp_path, 'xb') as ovpn_file:
+                for chunk in chunks:
+                    ovpn_file.write(chunk)
+                ovpn_file.flush()
+                os.fsync(ovpn_file.fileno())
+                size = ovpn_file.tell()
+            os.replace(tmp_path, ovpn_file_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        return size
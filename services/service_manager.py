@@ -1,18 +1,131 @@
+import os
 from .user_service import UserService
 from .file_service import FileService
 from .system_service import SystemService
+from .job_service import JobService
+from .key_pool_service import KeyPoolService
+from .file_id_cache import FileIdCache
+from .metrics_service import MetricsService
+from .openvpn_status_service import OpenVPNStatusService
+from .traffic_service import TrafficService
+from .audit_service import AuditService
+from .instance_service import InstanceService, VpnInstance
 
 
 class ServiceManager:
     """Менеджер сервисов для централизованного управления"""
     
     def __init__(self):
-        self.user_service = UserService()
-        self.file_service = FileService()
-        self.system_service = SystemService()
+        # Директория для постоянных данных бота (реестр пользователей, кэши, журналы)
+        self.data_dir = os.getenv('BOT_DATA_DIR', 'data')
+        
+        self.metrics_service = MetricsService()
+        self.metrics_service.describe("bot_handler_duration_seconds", "histogram", "Время выполнения обработчиков")
+        self.metrics_service.describe("bot_handler_errors_total", "counter", "Необработанные ошибки обработчиков")
+        self.metrics_service.describe("ovpn_subprocess_duration_seconds", "histogram", "Время этапов выпуска сертификата")
+        self.metrics_service.describe("ovpn_directory_scan_seconds", "histogram", "Время сканирования директории профилей")
+        self.metrics_service.describe("bot_throttled_total", "counter", "Отклоненные ограничителем запросы")
+        
+        # Серверы OpenVPN через запятую; без списка - один сервер с путями из OVPN_DIR, EASY_RSA_DIR и т.д.
+        instance_names = [name for name in os.getenv('OVPN_INSTANCES', '').replace(' ', '').split(',') if name]
+        self.instance_service = InstanceService(
+            [self._create_instance(name) for name in instance_names] or [self._create_instance("")]
+        )
+        # Сервисы первого сервера - сервера по умолчанию для команд без указания сервера
+        default_instance = self.instance_service.default
+        self.user_service = default_instance.user_service
+        self.job_service = default_instance.job_service
+        self.key_pool_service = default_instance.key_pool_service
+        self.file_id_cache = default_instance.file_id_cache
+        self.openvpn_status_service = default_instance.status_service
+        self.traffic_service = default_instance.traffic_service
+        
+        self.file_service = FileService(export_dir=os.path.join(self.data_dir, "exports"))
+        self.system_service = SystemService(
+            proc_dir=os.getenv('SYSTEM_PROC_DIR', '/proc'),
+            interface=os.getenv('SYSTEM_INTERFACE', 'tun0'),
+            interval=float(os.getenv('SYSTEM_SAMPLE_INTERVAL', '5'))
+        )
+        self.audit_service = AuditService(
+            os.path.join(self.data_dir, "audit"),
+            max_bytes=int(os.getenv('AUDIT_MAX_BYTES', str(10 * 1024 * 1024))),
+            backups=int(os.getenv('AUDIT_BACKUPS', '5')),
+            fsync_interval=float(os.getenv('AUDIT_FSYNC_INTERVAL', '5'))
+        )
+    
+    def _create_instance(self, name: str) -> VpnInstance:
+        """
+        Создает сервисы одного сервера OpenVPN
+        
+        Пути сервера name задаются переменными INSTANCE_<NAME>_OVPN_DIR и
+        INSTANCE_<NAME>_EASY_RSA_DIR; client-common.txt, tc.key, crl.pem и status файл
+        OpenVPN по умолчанию ищутся рядом с директорией easy-rsa, как в стандартной установке.
+        Безымянный сервер использует прежние переменные OVPN_DIR, EASY_RSA_DIR и т.д.
+        """
+        if name:
+            if not name.replace('_', '').replace('-', '').isalnum():
+                raise ValueError(f"Некорректное имя сервера в OVPN_INSTANCES: {name}")
+            prefix = f"INSTANCE_{name.upper()}_"
+            ovpn_dir = os.getenv(prefix + 'OVPN_DIR')
+            easy_rsa_dir = os.getenv(prefix + 'EASY_RSA_DIR')
+            if not ovpn_dir or not easy_rsa_dir:
+                raise ValueError(f"Для сервера {name} не заданы {prefix}OVPN_DIR и {prefix}EASY_RSA_DIR")
+            server_dir = os.path.dirname(easy_rsa_dir.rstrip('/'))
+            data_dir = os.path.join(self.data_dir, "instances", name)
+        else:
+            prefix = ""
+            ovpn_dir = os.getenv('OVPN_DIR', '/root/ovpns')
+            easy_rsa_dir = os.getenv('EASY_RSA_DIR', '/etc/openvpn/server/easy-rsa')
+            server_dir = '/etc/openvpn/server'
+            data_dir = self.data_dir
+        
+        user_service = UserService(
+            ovpn_dir=ovpn_dir,
+            easy_rsa_dir=easy_rsa_dir,
+            client_common_path=os.getenv(prefix + 'CLIENT_COMMON_PATH', os.path.join(server_dir, 'client-common.txt')),
+            data_dir=data_dir,
+            instance=name
+        )
+        user_service.tls_crypt_key_path = os.getenv(prefix + 'TLS_CRYPT_KEY', os.path.join(server_dir, 'tc.key'))
+        user_service.crl_path = os.getenv(prefix + 'CRL_PATH', os.path.join(server_dir, 'crl.pem'))
+        user_service.metrics = self.metrics_service
+        user_service.crl_coalesce_delay = float(os.getenv('CRL_COALESCE_DELAY', '1'))
+        user_service.user_index.metrics = self.metrics_service
+        
+        job_service = JobService(
+            user_service,
+            workers=int(os.getenv(prefix + 'CERT_WORKERS', os.getenv('CERT_WORKERS', '2'))),
+            max_queue=int(os.getenv('CERT_QUEUE_SIZE', '100'))
+        )
+        key_pool_service = KeyPoolService(
+            os.getenv(prefix + 'KEY_POOL_DIR', os.path.join(easy_rsa_dir, "keypool")),
+            size=int(os.getenv(prefix + 'KEY_POOL_SIZE', os.getenv('KEY_POOL_SIZE', '0'))),
+            refill_interval=float(os.getenv('KEY_POOL_REFILL_INTERVAL', '5')),
+            algorithm=os.getenv('KEY_POOL_ALGORITHM', 'rsa:2048')
+        )
+        key_pool_service.set_busy_check(job_service.is_busy)
+        if key_pool_service.enabled:
+            user_service.key_pool = key_pool_service
+        file_id_cache = FileIdCache(os.path.join(data_dir, "file_ids.jsonl"))
+        
+        status_service = OpenVPNStatusService(
+            os.getenv(prefix + 'OPENVPN_STATUS_PATH', os.path.join(server_dir, 'openvpn-status.log')),
+            management_address=os.getenv(prefix + 'OPENVPN_MANAGEMENT', ''),
+            management_password=os.getenv(prefix + 'OPENVPN_MANAGEMENT_PASSWORD', ''),
+            interval=float(os.getenv('ONLINE_REFRESH_INTERVAL', '10'))
+        )
+        # Счетчики сессий ведутся по серверу: одно имя на двух серверах - разные пользователи
+        traffic_service = TrafficService()
+        status_service.add_listener(traffic_service.on_snapshot)
+        return VpnInstance(name, user_service, job_service, key_pool_service, file_id_cache,
+                           status_service, traffic_service)
+    
+    def get_instance_service(self) -> InstanceService:
+        """Получает сервис серверов OpenVPN"""
+        return self.instance_service
     
     def get_user_service(self) -> UserService:
-        """Получает сервис для работы с пользователями"""
+        """Получает сервис для работы с пользователями сервера по умолчанию"""
         return self.user_service
     
     def get_file_service(self) -> FileService:
@@ -22,3 +135,51 @@ class ServiceManager:
     def get_system_service(self) -> SystemService:
         """Получает сервис для работы с системной информацией"""
         return self.system_service
+    
+    def get_job_service(self) -> JobService:
+        """Получает сервис очереди выпуска сертификатов сервера по умолчанию"""
+        return self.job_service
+    
+    def get_key_pool_service(self) -> KeyPoolService:
+        """Получает сервис пула заранее сгенерированных ключей сервера по умолчанию"""
+        return self.key_pool_service
+    
+    def get_file_id_cache(self) -> FileIdCache:
+        """Получает кэш file_id отправленных файлов сервера по умолчанию"""
+        return self.file_id_cache
+    
+    def get_openvpn_status_service(self) -> OpenVPNStatusService:
+        """Получает сервис списка подключенных клиентов сервера по умолчанию"""
+        return self.openvpn_status_service
+    
+    def get_traffic_service(self) -> TrafficService:
+        """Получает сервис истории трафика сервера по умолчанию"""
+        return self.traffic_service
+    
+    def get_audit_service(self) -> AuditService:
+        """Получает сервис журнала аудита"""
+        return self.audit_service
+    
+    def get_metrics_service(self) -> MetricsService:
+        """Получает сервис метрик"""
+        return self.metrics_service
+    
+    async def start(self):
+        """Запускает фоновые задачи сервисов"""
+        await self.audit_service.start()
+        for instance in self.instance_service.instances:
+            await instance.start()
+        await self.system_service.start()
+        
+        metrics_port = int(os.getenv('METRICS_PORT', '0'))
+        if metrics_port:
+            await self.metrics_service.start_http_server(os.getenv('METRICS_HOST', '127.0.0.1'), metrics_port)
+    
+    async def stop(self):
+        """Останавливает фоновые задачи сервисов"""
+        await self.metrics_service.stop_http_server()
+        await self.system_service.stop()
+        for instance in self.instance_service.instances:
+            await instance.stop()
+        # Журнал останавливается последним, чтобы записать события завершившихся задач
+        await self.audit_service.stop()
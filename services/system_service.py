@@ -1,18 +1,102 @@
+import asyncio
+import collections
+import logging
 import platform
 import datetime
 import os
-from typing import Dict
+import time
+from typing import Dict, List, Optional
+from .openvpn_status_service import OpenVPNStatusService
+
+
+logger = logging.getLogger(__name__)
+
+# Символы для мини-графиков истории
+SPARK_CHARS = "▁▂▃▄▅▆▇█"
 
 
 class SystemService:
     """Сервис для работы с системной информацией"""
     
-    def __init__(self, host: str = None):
+    def __init__(self, host: str = None, proc_dir: str = "/proc", interface: str = "tun0",
+                 interval: float = 5.0, history_size: int = 60):
         self.host = host or os.getenv('HOST', 'Не указан')
+        self.proc_dir = proc_dir
+        self.interface = interface
+        self.interval = interval
+        # Платформа и версия Python не меняются, поэтому вычисляются один раз
+        self.platform = f"{platform.system()} {platform.release()}"
+        self.python_version = platform.python_version()
+        self.history: "collections.deque[Dict]" = collections.deque(maxlen=history_size)
+        self._previous_cpu: Optional[List[int]] = None
+        self._previous_net: Optional[tuple] = None
+        self._task: Optional[asyncio.Task] = None
+    
+    async def start(self):
+        """Запускает фоновый сбор метрик хоста"""
+        if self._task:
+            return
+        self._task = asyncio.create_task(self._sample_loop(), name="system-sampler")
+    
+    async def stop(self):
+        """Останавливает фоновый сбор метрик хоста"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+    
+    def sample(self) -> Dict:
+        """
+        Снимает текущие метрики хоста из /proc и добавляет их в историю
+        
+        Скорость CPU и сети считается по разнице с предыдущим снимком,
+        поэтому в первом снимке эти значения отсутствуют.
+        
+        Returns:
+            Dict: Снимок метрик
+        """
+        now = time.monotonic()
+        snapshot = {'time': time.time()}
+        
+        with open(os.path.join(self.proc_dir, "loadavg"), 'r') as loadavg_file:
+            snapshot['load'] = tuple(float(value) for value in loadavg_file.read().split()[:3])
+        
+        with open(os.path.join(self.proc_dir, "stat"), 'r') as stat_file:
+            cpu = [int(value) for value in stat_file.readline().split()[1:]]
+        if self._previous_cpu:
+            total = sum(cpu) - sum(self._previous_cpu)
+            # idle и iowait
+            idle = sum(cpu[3:5]) - sum(self._previous_cpu[3:5])
+            snapshot['cpu_percent'] = (total - idle) / total * 100 if total > 0 else 0.0
+        self._previous_cpu = cpu
+        
+        meminfo = {}
+        with open(os.path.join(self.proc_dir, "meminfo"), 'r') as meminfo_file:
+            for line in meminfo_file:
+                name, _, value = line.partition(":")
+                meminfo[name] = int(value.split()[0]) * 1024
+        snapshot['mem_total'] = meminfo.get('MemTotal', 0)
+        snapshot['mem_available'] = meminfo.get('MemAvailable', meminfo.get('MemFree', 0))
+        
+        net = self._read_interface_counters()
+        if net and self._previous_net:
+            elapsed = now - self._previous_net[0]
+            if elapsed > 0:
+                snapshot['rx_rate'] = max(net[0] - self._previous_net[1], 0) / elapsed
+                snapshot['tx_rate'] = max(net[1] - self._previous_net[2], 0) / elapsed
+        self._previous_net = (now, *net) if net else None
+        
+        with open(os.path.join(self.proc_dir, "sys", "fs", "file-nr"), 'r') as file_nr:
+            snapshot['open_files'] = int(file_nr.read().split()[0])
+        # Дескрипторы самого бота считаются по /proc текущего процесса, даже если proc_dir смонтирован с хоста
+        snapshot['bot_fds'] = len(os.listdir("/proc/self/fd"))
+        
+        self.history.append(snapshot)
+        return snapshot
     
     def get_system_info(self) -> Dict[str, str]:
         """
-        Получает информацию о системе
+        Получает информацию о системе из последнего снимка, не обращаясь к /proc
         
         Returns:
             Dict[str, str]: Словарь с информацией о системе
@@ -20,10 +104,11 @@ class SystemService:
         try:
             return {
                 'host': self.host,
-                'platform': f"{platform.system()} {platform.release()}",
-                'python_version': platform.python_version(),
+                'platform': self.platform,
+                'python_version': self.python_version,
                 'current_time': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                'bot_status': '✅ Работает'
+                'bot_status': '✅ Работает',
+                'snapshot': self.history[-1] if self.history else None,
             }
         except Exception as e:
             return {
@@ -42,7 +127,7 @@ class SystemService:
         if 'error' in info:
             return f"❌ **Ошибка:** {info['error']}"
         
-        return (
+        text = (
             "🖥️ **Информация о сервере:**\n\n"
             f"🌐 **Хост:** `{info['host']}`\n"
             f"🖥️ **Платформа:** {info['platform']}\n"
@@ -50,3 +135,65 @@ class SystemService:
             f"⏰ **Время сервера:** {info['current_time']}\n"
             f"🤖 **Статус бота:** {info['bot_status']}"
         )
+        
+        snapshot = info['snapshot']
+        if not snapshot:
+            return text
+        
+        history = list(self.history)
+        minutes = max((history[-1]['time'] - history[0]['time']) / 60, 0)
+        load = snapshot['load']
+        used = snapshot['mem_total'] - snapshot['mem_available']
+        text += (
+            f"\n\n📈 **Нагрузка** (история за {minutes:.0f} мин):\n"
+            f"⚙️ **Load average:** {load[0]:.2f} / {load[1]:.2f} / {load[2]:.2f}\n"
+        )
+        if 'cpu_percent' in snapshot:
+            text += f"🧮 **CPU:** {snapshot['cpu_percent']:.0f}% `{self._sparkline(history, 'cpu_percent')}`\n"
+        if snapshot['mem_total']:
+            text += (
+                f"🧠 **Память:** {OpenVPNStatusService.format_bytes(used)} из {OpenVPNStatusService.format_bytes(snapshot['mem_total'])} "
+                f"({used / snapshot['mem_total'] * 100:.0f}%)\n"
+            )
+        if 'rx_rate' in snapshot:
+            text += (
+                f"🔌 **{self.interface}:** ⬇️ {OpenVPNStatusService.format_bytes(snapshot['rx_rate'])}/с "
+                f"`{self._sparkline(history, 'rx_rate')}` · ⬆️ {OpenVPNStatusService.format_bytes(snapshot['tx_rate'])}/с "
+                f"`{self._sparkline(history, 'tx_rate')}`\n"
+            )
+        text += f"📂 **Открытые файлы:** {snapshot['open_files']} (бот: {snapshot['bot_fds']})"
+        return text
+    
+    async def _sample_loop(self):
+        """Периодически снимает метрики хоста"""
+        while True:
+            try:
+                await asyncio.to_thread(self.sample)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Ошибка при сборе метрик хоста")
+            await asyncio.sleep(self.interval)
+    
+    def _read_interface_counters(self) -> Optional[tuple]:
+        """Читает счетчики байт интерфейса из /proc/net/dev"""
+        try:
+            with open(os.path.join(self.proc_dir, "net", "dev"), 'r') as net_file:
+                for line in net_file:
+                    name, _, counters = line.partition(":")
+                    if name.strip() == self.interface:
+                        values = counters.split()
+                        return int(values[0]), int(values[8])
+        except OSError:
+            pass
+        return None
+    
+    def _sparkline(self, history: List[Dict], key: str, width: int = 20) -> str:
+        """Строит мини-график значения по последним снимкам"""
+        values = [snapshot[key] for snapshot in history[-width:] if key in snapshot]
+        if not values:
+            return ""
+        low, high = min(values), max(values)
+        if high == low:
+            return SPARK_CHARS[0] * len(values)
+        return "".join(SPARK_CHARS[int((value - low) / (high - low) * (len(SPARK_CHARS) - 1))] for value in values)
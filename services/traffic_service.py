@@ -0,0 +1,283 @@
+import re
+import time
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .openvpn_status_service import ConnectedClient, OpenVPNStatusService
+
+
+# Уровни агрегации: (длительность корзины, количество корзин).
+# Каждый отсчет сразу добавляется во все уровни, поэтому запросы читают
+# только готовые агрегаты и не зависят от частоты опроса OpenVPN.
+TRAFFIC_TIERS = (
+    (900, 96),       # 15 минут, последние сутки
+    (3600, 168),     # 1 час, последняя неделя
+    (86400, 90),     # 1 сутки, последние 90 дней
+)
+
+# Максимальное количество точек в истории /traffic
+HISTORY_POINTS = 24
+
+# Время хранения истории: охват самого грубого уровня
+RETENTION_SECONDS = max(resolution * capacity for resolution, capacity in TRAFFIC_TIERS)
+
+PERIOD_UNITS = {'m': 60, 'h': 3600, 'd': 86400}
+
+
+class _RingBuffer:
+    """Кольцевой буфер корзин фиксированной длительности со счетчиками байт"""
+
+    __slots__ = ("resolution", "capacity", "head", "values")
+
+    def __init__(self, resolution: int, capacity: int):
+        self.resolution = resolution
+        self.capacity = capacity
+        # Номер последней записанной корзины
+        self.head = -1
+        # Пары (получено, отправлено) для каждой корзины подряд
+        self.values = array('Q', bytes(16 * capacity))
+
+    def add(self, timestamp: float, received: int, sent: int):
+        """Добавляет байты в корзину, соответствующую времени"""
+        bucket = int(timestamp) // self.resolution
+        if bucket > self.head:
+            # Обнуляем корзины, пропущенные с последней записи
+            for skipped in range(max(self.head + 1, bucket - self.capacity + 1), bucket + 1):
+                slot = skipped % self.capacity * 2
+                self.values[slot] = 0
+                self.values[slot + 1] = 0
+            self.head = bucket
+        elif bucket <= self.head - self.capacity:
+            return
+
+        slot = bucket % self.capacity * 2
+        self.values[slot] += received
+        self.values[slot + 1] += sent
+
+    def iter_buckets(self, start_bucket: int, end_bucket: int) -> Iterable[Tuple[int, int, int]]:
+        """Перебирает корзины из диапазона, еще хранящиеся в буфере"""
+        start_bucket = max(start_bucket, self.head - self.capacity + 1)
+        for bucket in range(start_bucket, end_bucket + 1):
+            if bucket > self.head:
+                yield bucket, 0, 0
+            else:
+                slot = bucket % self.capacity * 2
+                yield bucket, self.values[slot], self.values[slot + 1]
+
+
+class _TrafficSeries:
+    """Агрегаты трафика одного пользователя по всем уровням"""
+
+    __slots__ = ("tiers", "total_received", "total_sent", "last_seen")
+
+    def __init__(self):
+        self.tiers = tuple(_RingBuffer(resolution, capacity) for resolution, capacity in TRAFFIC_TIERS)
+        self.total_received = 0
+        self.total_sent = 0
+        self.last_seen = 0.0
+
+    def add(self, timestamp: float, received: int, sent: int):
+        for tier in self.tiers:
+            tier.add(timestamp, received, sent)
+        self.total_received += received
+        self.total_sent += sent
+        self.last_seen = timestamp
+
+
+class TrafficService:
+    """Сервис накопления истории трафика пользователей по данным статуса OpenVPN"""
+
+    def __init__(self):
+        self._series: Dict[str, _TrafficSeries] = {}
+        # Последние счетчики байт активных сессий: (имя, адрес, начало) -> (получено, отправлено)
+        self._sessions: Dict[Tuple[str, str, int], Tuple[int, int]] = {}
+        self._last_snapshot_at: Optional[float] = None
+
+    def on_snapshot(self, clients: Tuple[ConnectedClient, ...], timestamp: float):
+        """
+        Учитывает прирост счетчиков между двумя снимками подключенных клиентов
+
+        Args:
+            clients: Подключенные клиенты
+            timestamp: Время снимка
+        """
+        sessions = {}
+        for client in clients:
+            key = (client.common_name, client.real_address, client.connected_since)
+            sessions[key] = (client.bytes_received, client.bytes_sent)
+
+            previous = self._sessions.get(key)
+            if previous is None:
+                # Трафик сессий, начавшихся до первого снимка, не относится к наблюдаемому периоду
+                if self._last_snapshot_at is None or client.connected_since < self._last_snapshot_at:
+                    continue
+                previous = (0, 0)
+
+            received = client.bytes_received - previous[0]
+            sent = client.bytes_sent - previous[1]
+            # Счетчики уменьшились - сессия переподключилась с тем же ключом
+            if received < 0 or sent < 0:
+                received, sent = client.bytes_received, client.bytes_sent
+            if received or sent:
+                series = self._series.get(client.common_name)
+                if series is None:
+                    series = self._series[client.common_name] = _TrafficSeries()
+                series.add(timestamp, received, sent)
+
+        self._sessions = sessions
+        self._last_snapshot_at = timestamp
+        self._prune(timestamp)
+
+    def get_top(self, period: int, limit: int = 10, now: Optional[float] = None) -> List[Tuple[str, int, int]]:
+        """
+        Получает пользователей с наибольшим трафиком за период
+
+        Args:
+            period: Длительность периода, секунды
+            limit: Количество пользователей
+            now: Конец периода (по умолчанию текущее время)
+
+        Returns:
+            List[Tuple[str, int, int]]: (имя, получено сервером, отправлено сервером)
+        """
+        now = time.time() if now is None else now
+        totals = []
+        for username, series in self._series.items():
+            received, sent = self._sum(series, period, now)
+            if received or sent:
+                totals.append((username, received, sent))
+        totals.sort(key=lambda item: item[1] + item[2], reverse=True)
+        return totals[:limit]
+
+    def get_history(self, username: str, period: int,
+                    now: Optional[float] = None) -> Optional[Tuple[int, List[Tuple[int, int, int]]]]:
+        """
+        Получает историю трафика пользователя, сжатую до HISTORY_POINTS точек
+
+        Args:
+            username: Имя пользователя
+            period: Длительность периода, секунды
+            now: Конец периода (по умолчанию текущее время)
+
+        Returns:
+            Optional[Tuple[int, List[Tuple[int, int, int]]]]: Шаг в секундах и точки
+                (начало точки, получено, отправлено) или None, если данных нет
+        """
+        series = self._series.get(username)
+        if series is None:
+            return None
+
+        now = time.time() if now is None else now
+        tier = self._select_tier(series, period)
+        end_bucket = int(now) // tier.resolution
+        start_bucket = int(now - period) // tier.resolution + 1
+        buckets_per_point = max(1, -(-(end_bucket - start_bucket + 1) // HISTORY_POINTS))
+
+        points: List[Tuple[int, int, int]] = []
+        for bucket, received, sent in tier.iter_buckets(start_bucket, end_bucket):
+            point_start = (start_bucket + (bucket - start_bucket) // buckets_per_point * buckets_per_point) * tier.resolution
+            if points and points[-1][0] == point_start:
+                _, point_received, point_sent = points[-1]
+                points[-1] = (point_start, point_received + received, point_sent + sent)
+            else:
+                points.append((point_start, received, sent))
+        return buckets_per_point * tier.resolution, points
+
+    def get_totals(self, username: str) -> Optional[Tuple[int, int]]:
+        """Получает суммарный трафик пользователя с момента запуска бота"""
+        series = self._series.get(username)
+        return (series.total_received, series.total_sent) if series else None
+
+    @staticmethod
+    def parse_period(text: str, default: str = "24h") -> Optional[Tuple[int, str]]:
+        """
+        Разбирает период вида 30m, 24h или 7d
+
+        Args:
+            text: Период из аргумента команды
+            default: Период, если аргумент пуст
+
+        Returns:
+            Optional[Tuple[int, str]]: (длительность в секундах, нормализованная запись) или None
+        """
+        match = re.fullmatch(r"(\d+)\s*([mhd])", (text or default).strip().lower())
+        if not match:
+            return None
+        seconds = int(match.group(1)) * PERIOD_UNITS[match.group(2)]
+        if not 0 < seconds <= RETENTION_SECONDS:
+            return None
+        return seconds, f"{match.group(1)}{match.group(2)}"
+
+    def format_top(self, period: int, period_title: str, limit: int = 10) -> str:
+        """
+        Форматирует рейтинг пользователей по трафику для отправки в Telegram
+
+        Returns:
+            str: Отформатированная строка с рейтингом
+        """
+        top = self.get_top(period, limit)
+        if not top:
+            return f"📊 За {period_title} трафика не зафиксировано"
+
+        text = f"📊 **Топ по трафику за {period_title}:**\n\n"
+        for place, (username, received, sent) in enumerate(top, 1):
+            text += (
+                f"{place}. **{username}** — {OpenVPNStatusService.format_bytes(received + sent)} "
+                f"(⬆️ {OpenVPNStatusService.format_bytes(received)} · ⬇️ {OpenVPNStatusService.format_bytes(sent)})\n"
+            )
+        return text
+
+    def format_traffic(self, username: str, period: int, period_title: str) -> str:
+        """
+        Форматирует историю трафика пользователя для отправки в Telegram
+
+        Returns:
+            str: Отформатированная строка с историей
+        """
+        history = self.get_history(username, period)
+        if history is None:
+            return f"📭 Для пользователя **{username}** нет данных о трафике"
+
+        step, points = history
+        peak = max((received + sent for _, received, sent in points), default=0)
+        period_received = sum(received for _, received, _ in points)
+        period_sent = sum(sent for _, _, sent in points)
+        time_format = "%d.%m %H:%M" if step < 86400 else "%d.%m"
+
+        text = (
+            f"📈 **Трафик {username} за {period_title}:**\n"
+            f"⬆️ {OpenVPNStatusService.format_bytes(period_received)} · "
+            f"⬇️ {OpenVPNStatusService.format_bytes(period_sent)}\n\n"
+        )
+        for point_start, received, sent in points:
+            bar = "▇" * round((received + sent) / peak * 10) if peak else ""
+            text += (
+                f"`{time.strftime(time_format, time.localtime(point_start))}` "
+                f"{bar or '·'} {OpenVPNStatusService.format_bytes(received + sent)}\n"
+            )
+        return text
+
+    def _select_tier(self, series: _TrafficSeries, period: int) -> _RingBuffer:
+        """Выбирает самый подробный уровень, покрывающий период"""
+        for tier in series.tiers:
+            if tier.resolution * tier.capacity >= period:
+                return tier
+        return series.tiers[-1]
+
+    def _sum(self, series: _TrafficSeries, period: int, now: float) -> Tuple[int, int]:
+        """Суммирует трафик за период по корзинам подходящего уровня"""
+        tier = self._select_tier(series, period)
+        end_bucket = int(now) // tier.resolution
+        start_bucket = int(now - period) // tier.resolution + 1
+        received = sent = 0
+        for _, bucket_received, bucket_sent in tier.iter_buckets(start_bucket, end_bucket):
+            received += bucket_received
+            sent += bucket_sent
+        return received, sent
+
+    def _prune(self, now: float):
+        """Удаляет пользователей без трафика за все время хранения"""
+        expired = [username for username, series in self._series.items()
+                   if now - series.last_seen > RETENTION_SECONDS]
+        for username in expired:
+            del self._series[username]
@@ -0,0 +1,126 @@
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+class UserIndex:
+    """Наблюдатель за директорией с .ovpn файлами, сообщающий об изменениях"""
+
+    # Если директория изменялась совсем недавно, ее mtime может не измениться
+    # при следующей записи в пределах того же такта файловой системы,
+    # поэтому такой снимок считается ненадежным и перечитывается
+    RACY_MTIME_SECONDS = 1.0
+
+    def __init__(self, ovpn_dir: str, extension: str = ".ovpn"):
+        self.ovpn_dir = ovpn_dir
+        self.extension = extension
+        # Размер и время изменения (нс) каждого профиля по последнему сканированию
+        self._files: Dict[str, Tuple[int, Optional[int]]] = {}
+        self._scanned = False
+        self._dir_mtime_ns: Optional[int] = None
+        self._listeners: List[Callable[[List[Tuple[str, int, float]], List[str], bool], None]] = []
+        self._lock = threading.RLock()
+        # Сервис метрик (MetricsService), если включен
+        self.metrics = None
+
+    def add_listener(self, listener: Callable[[List[Tuple[str, int, float]], List[str], bool], None]):
+        """
+        Подписывает функцию на изменения директории, найденные сканированием
+
+        Args:
+            listener: Функция, получающая добавленные и измененные профили (имя, размер, время изменения),
+                имена удаленных профилей и признак полного списка (первое сканирование)
+        """
+        self._listeners.append(listener)
+
+    def refresh(self) -> bool:
+        """
+        Синхронизирует индекс с директорией, если она изменилась
+
+        Returns:
+            bool: True, если директория существует
+        """
+        with self._lock:
+            try:
+                dir_stat = os.stat(self.ovpn_dir)
+            except FileNotFoundError:
+                if self._files:
+                    self._notify([], list(self._files), False)
+                    self._files = {}
+                self._dir_mtime_ns = None
+                return False
+
+            if dir_stat.st_mtime_ns == self._dir_mtime_ns:
+                return True
+
+            started = time.perf_counter()
+            self._rescan()
+            if self.metrics:
+                self.metrics.observe("ovpn_directory_scan_seconds", time.perf_counter() - started)
+
+            # Недавнее изменение не запоминаем, чтобы не пропустить следующее
+            if time.time() - dir_stat.st_mtime_ns / 1e9 > self.RACY_MTIME_SECONDS:
+                self._dir_mtime_ns = dir_stat.st_mtime_ns
+            else:
+                self._dir_mtime_ns = None
+            return True
+
+    def add(self, username: str, size: int):
+        """
+        Запоминает профиль, записанный самим ботом, чтобы сканирование не сообщало о нем
+
+        Args:
+            username: Имя пользователя
+            size: Размер .ovpn файла в байтах
+        """
+        try:
+            mtime_ns = os.stat(os.path.join(self.ovpn_dir, username + self.extension)).st_mtime_ns
+        except FileNotFoundError:
+            mtime_ns = None
+        with self._lock:
+            self._files[username] = (size, mtime_ns)
+
+    def remove(self, username: str):
+        """
+        Забывает профиль, удаленный самим ботом
+
+        Args:
+            username: Имя пользователя
+        """
+        with self._lock:
+            self._files.pop(username, None)
+
+    def count(self) -> int:
+        """Получает количество профилей в директории"""
+        return len(self._files)
+
+    def _rescan(self):
+        """Находит разницу между индексом и содержимым директории и сообщает о ней"""
+        # Первое сканирование передает полный список, чтобы подписчики сверили с ним свои данные
+        full = not self._scanned
+        current: Dict[str, Tuple[int, Optional[int]]] = {}
+        added = []
+        with os.scandir(self.ovpn_dir) as entries:
+            for entry in entries:
+                if not entry.name.endswith(self.extension) or not entry.is_file():
+                    continue
+                username = entry.name[:-len(self.extension)]
+                # Профиль, переписанный вне бота (add_user.sh, вручную), сообщается как добавленный
+                entry_stat = entry.stat()
+                current[username] = (entry_stat.st_size, entry_stat.st_mtime_ns)
+                if full or self._files.get(username) != current[username]:
+                    added.append((username, entry_stat.st_size, entry_stat.st_mtime))
+
+        removed = list(self._files.keys() - current.keys())
+        if not added and not removed and not full:
+            return
+
+        # Состояние меняется только после подписчиков: если они упали, разница найдется снова
+        self._notify(added, removed, full)
+        self._scanned = True
+        self._files = current
+
+    def _notify(self, added: List[Tuple[str, int, float]], removed: List[str], full: bool):
+        for listener in self._listeners:
+            listener(added, removed, full)
@@ -0,0 +1,335 @@
+import contextlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+# Статусы пользователей в реестре
+STATUS_ACTIVE = "active"
+STATUS_REVOKED = "revoked"
+STATUS_REMOVED = "removed"
+
+# Разделитель сервера и имени в полном имени пользователя (udp:alice)
+INSTANCE_SEPARATOR = ":"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    status TEXT NOT NULL DEFAULT 'active',
+    created_at REAL NOT NULL,
+    created_by INTEGER,
+    serial TEXT,
+    file_size INTEGER NOT NULL DEFAULT 0,
+    revoked_at REAL
+);
+CREATE INDEX IF NOT EXISTS users_active_username ON users(username) WHERE status = 'active';
+CREATE INDEX IF NOT EXISTS users_created_at ON users(created_at);
+"""
+
+
+class UserRecord:
+    """
+    Пользователь в списках бота
+
+    Хранятся только имя и размер профиля; имя файла, путь и размер в KB
+    вычисляются при обращении, чтобы большие списки не держали их в памяти.
+    """
+
+    __slots__ = ("username", "file_size", "instance", "status", "expires_at", "_ovpn_dir", "_extension")
+
+    def __init__(self, username: str, file_size: int, ovpn_dir: str, extension: str, instance: str = ""):
+        self.username = username
+        self.file_size = file_size
+        # Имя сервера OpenVPN; пустое, если сервер один и не назван
+        self.instance = instance
+        # Статус сертификата заполняется только для записей отображаемой страницы
+        self.status: Optional[str] = None
+        self.expires_at: Optional[int] = None
+        self._ovpn_dir = ovpn_dir
+        self._extension = extension
+
+    @property
+    def key(self) -> str:
+        """Полное имя пользователя, однозначное среди всех серверов"""
+        if self.instance:
+            return self.instance + INSTANCE_SEPARATOR + self.username
+        return self.username
+
+    @property
+    def filename(self) -> str:
+        """Имя .ovpn файла"""
+        return self.username + self._extension
+
+    @property
+    def archive_name(self) -> str:
+        """Путь .ovpn файла в ZIP архиве: профили разных серверов лежат в своих папках"""
+        if self.instance:
+            return f"{self.instance}/{self.username}{self._extension}"
+        return self.username + self._extension
+
+    @property
+    def file_path(self) -> str:
+        """Путь к .ovpn файлу"""
+        return os.path.join(self._ovpn_dir, self.username + self._extension)
+
+    @property
+    def size_kb(self) -> float:
+        """Размер .ovpn файла в KB"""
+        return self.file_size / 1024
+
+
+class UserRegistry:
+    """Постоянный реестр пользователей в SQLite"""
+
+    def __init__(self, db_path: str, ovpn_dir: str, extension: str = ".ovpn", instance: str = ""):
+        self.db_path = db_path
+        self.ovpn_dir = ovpn_dir
+        self.extension = extension
+        self.instance = instance
+        # Версия для курсоров и кэша страниц, увеличивается при каждом изменении списка
+        self.version = 0
+        # Полный список для текущей версии: повторные запросы не создают записи заново
+        self._all_users: Optional[Tuple[int, List[UserRecord]]] = None
+        self._lock = threading.RLock()
+
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        # Запросы выполняются и из event loop, и из пула потоков, поэтому соединение общее под блокировкой
+        self._connection = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(SCHEMA)
+
+    def apply_changes(self, added: Iterable[Tuple[str, int, float, Optional[str]]],
+                      removed: Iterable[str], full: bool = False):
+        """
+        Применяет к реестру изменения директории с .ovpn файлами
+
+        Args:
+            added: Новые или измененные профили: (имя, размер, время изменения файла, серийный номер)
+            removed: Имена удаленных профилей
+            full: added содержит все профили директории, остальные активные записи устарели
+        """
+        added = list(added)
+        with self._lock, self._transaction() as cursor:
+            # Время изменения файла - лучшая оценка времени создания для профилей, появившихся вне бота
+            cursor.executemany(
+                "INSERT INTO users (username, status, created_at, serial, file_size) VALUES (?, 'active', ?, ?, ?) "
+                "ON CONFLICT(username) DO UPDATE SET status = 'active', file_size = excluded.file_size, "
+                "serial = COALESCE(excluded.serial, users.serial), "
+                "created_at = CASE WHEN users.status = 'active' THEN users.created_at ELSE excluded.created_at END",
+                [(username, mtime, serial, size) for username, size, mtime, serial in added]
+            )
+            if full:
+                cursor.execute("CREATE TEMP TABLE IF NOT EXISTS present (username TEXT PRIMARY KEY)")
+                cursor.execute("DELETE FROM present")
+                cursor.executemany("INSERT OR IGNORE INTO present VALUES (?)", [(item[0],) for item in added])
+                cursor.execute(
+                    "UPDATE users SET status = 'removed' WHERE status = 'active' "
+                    "AND username NOT IN (SELECT username FROM present)"
+                )
+            cursor.executemany(
+                "UPDATE users SET status = 'removed' WHERE username = ? AND status = 'active'",
+                [(username,) for username in removed]
+            )
+            self.version += 1
+
+    def record_created(self, username: str, file_size: int, created_by: Optional[int] = None,
+                       serial: Optional[str] = None):
+        """
+        Записывает пользователя, созданного ботом
+
+        Args:
+            username: Имя пользователя
+            file_size: Размер .ovpn файла в байтах
+            created_by: Telegram ID администратора
+            serial: Серийный номер сертификата
+        """
+        with self._lock, self._transaction() as cursor:
+            cursor.execute(
+                "INSERT INTO users (username, status, created_at, created_by, serial, file_size) "
+                "VALUES (?, 'active', ?, ?, ?, ?) "
+                "ON CONFLICT(username) DO UPDATE SET status = 'active', created_at = excluded.created_at, "
+                "created_by = excluded.created_by, serial = excluded.serial, "
+                "file_size = excluded.file_size, revoked_at = NULL",
+                (username, time.time(), created_by, serial, file_size)
+            )
+            self.version += 1
+
+    def mark_revoked(self, username: str):
+        """Помечает пользователя отозванным"""
+        with self._lock, self._transaction() as cursor:
+            cursor.execute(
+                "UPDATE users SET status = 'revoked', revoked_at = ? WHERE username = ?",
+                (time.time(), username)
+            )
+            self.version += 1
+
+    def count(self) -> int:
+        """Получает количество активных пользователей"""
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM users WHERE status = 'active'").fetchone()[0]
+
+    def get_details(self, username: str) -> Optional[Dict]:
+        """
+        Получает все сведения о пользователе, включая отозванных
+
+        Returns:
+            Optional[Dict]: Запись реестра или None
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT username, status, created_at, created_by, serial, file_size, revoked_at "
+                "FROM users WHERE username = ?", (username,)
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("username", "status", "created_at", "created_by", "serial", "file_size", "revoked_at"), row))
+
+    def get_snapshot_page(self, per_page: int, cursor: Optional[str] = None, position: int = 0) -> Dict:
+        """
+        Получает страницу активных пользователей, начинающуюся с пользователя-курсора
+
+        Args:
+            per_page: Количество пользователей на странице
+            cursor: Имя первого пользователя страницы
+            position: Позиция начала страницы, если курсор не задан
+
+        Returns:
+            Dict: Версия, позиция, всего пользователей, пользователи страницы
+                и курсоры соседних страниц в виде (имя, позиция)
+        """
+        with self._lock:
+            total = self.count()
+            if cursor is not None:
+                position = self._position_of(cursor)
+            position = max(0, min(position, max(total - 1, 0)))
+
+            rows = None
+            if cursor is not None and position < total:
+                # Переход по курсору: диапазонные запросы по индексу, без OFFSET по всему списку
+                rows = self._connection.execute(
+                    "SELECT username, file_size FROM users WHERE status = 'active' AND username >= ? "
+                    "ORDER BY username LIMIT ?", (cursor, per_page + 1)
+                ).fetchall()
+                prev_row = self._connection.execute(
+                    "SELECT username FROM users WHERE status = 'active' AND username < ? "
+                    "ORDER BY username DESC LIMIT 1 OFFSET ?", (cursor, min(per_page, position) - 1)
+                ).fetchone() if position > 0 else None
+
+            # Курсор удален или стоит после последнего пользователя: показываем страницу по позиции
+            if not rows:
+                rows = self._connection.execute(
+                    "SELECT username, file_size FROM users WHERE status = 'active' "
+                    "ORDER BY username LIMIT ? OFFSET ?", (per_page + 1, position)
+                ).fetchall()
+                prev_row = self._connection.execute(
+                    "SELECT username FROM users WHERE status = 'active' ORDER BY username LIMIT 1 OFFSET ?",
+                    (max(position - per_page, 0),)
+                ).fetchone() if position > 0 else None
+
+            prev_cursor = (prev_row[0], max(position - per_page, 0)) if prev_row else None
+            next_position = position + per_page
+            return {
+                'version': self.version,
+                'position': position,
+                'total': total,
+                'users': [self._make_user(username, size) for username, size in rows[:per_page]],
+                'prev_cursor': prev_cursor,
+                'next_cursor': (rows[per_page][0], next_position) if len(rows) > per_page else None,
+            }
+
+    def find_prefix(self, prefix: str, limit: int) -> Tuple[int, int, List[UserRecord]]:
+        """
+        Ищет активных пользователей по префиксу имени диапазонным запросом по индексу
+
+        Returns:
+            Tuple[int, int, List[UserRecord]]: (позиция первого совпадения, всего совпадений, первые совпадения)
+        """
+        upper = prefix + "\U0010ffff"
+        with self._lock:
+            total = self._connection.execute(
+                "SELECT COUNT(*) FROM users WHERE status = 'active' AND username >= ? AND username < ?",
+                (prefix, upper)
+            ).fetchone()[0]
+            rows = self._connection.execute(
+                "SELECT username, file_size FROM users WHERE status = 'active' AND username >= ? AND username < ? "
+                "ORDER BY username LIMIT ?", (prefix, upper, limit)
+            ).fetchall()
+            return self._position_of(prefix), total, [self._make_user(username, size) for username, size in rows]
+
+    def get_range(self, start: str, limit: int, inclusive: bool = True,
+                  descending: bool = False) -> List[UserRecord]:
+        """
+        Получает активных пользователей, следующих за именем start, диапазонным запросом по индексу
+
+        Args:
+            start: Имя, с которого начинается диапазон
+            limit: Максимальное количество пользователей
+            inclusive: Включать ли пользователя с именем start
+            descending: Идти от start к началу списка (пользователи возвращаются в обратном порядке)
+        """
+        if descending:
+            condition, order = ("<=" if inclusive else "<"), "DESC"
+        else:
+            condition, order = (">=" if inclusive else ">"), "ASC"
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT username, file_size FROM users WHERE status = 'active' AND username {condition} ? "
+                f"ORDER BY username {order} LIMIT ?", (start, limit)
+            ).fetchall()
+        return [self._make_user(username, size) for username, size in rows]
+
+    def count_before(self, username: str, inclusive: bool = False) -> int:
+        """Получает количество активных пользователей, стоящих в списке перед именем (или на нем)"""
+        with self._lock:
+            if inclusive:
+                return self._connection.execute(
+                    "SELECT COUNT(*) FROM users WHERE status = 'active' AND username <= ?", (username,)
+                ).fetchone()[0]
+            return self._position_of(username)
+
+    def get_all(self) -> List[UserRecord]:
+        """
+        Получает всех активных пользователей в отсортированном порядке
+
+        Записи общие для всех вызывающих до следующего изменения реестра,
+        поэтому изменять их нельзя; сам список - копия.
+        """
+        with self._lock:
+            if self._all_users is None or self._all_users[0] != self.version:
+                rows = self._connection.execute(
+                    "SELECT username, file_size FROM users WHERE status = 'active' ORDER BY username"
+                ).fetchall()
+                self._all_users = (self.version, [self._make_user(username, size) for username, size in rows])
+            return list(self._all_users[1])
+
+    def close(self):
+        """Закрывает соединение с базой"""
+        with self._lock:
+            self._connection.close()
+
+    def _position_of(self, username: str) -> int:
+        """Позиция, на которой стоит (или встал бы) пользователь в отсортированном списке"""
+        return self._connection.execute(
+            "SELECT COUNT(*) FROM users WHERE status = 'active' AND username < ?", (username,)
+        ).fetchone()[0]
+
+    def _make_user(self, username: str, file_size: int) -> UserRecord:
+        return UserRecord(username, file_size, self.ovpn_dir, self.extension, self.instance)
+
+    @contextlib.contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Cursor]:
+        """Выполняет изменения одной транзакцией"""
+        cursor = self._connection.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            yield cursor
+            cursor.execute("COMMIT")
+        except BaseException:
+            cursor.execute("ROLLBACK")
+            raise
+        finally:
+            cursor.close()
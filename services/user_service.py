@@ -1,16 +1,59 @@
+import asyncio
+import contextlib
+import csv
+import hashlib
+import io
 import subprocess
 import os
-import glob
-from typing import List, Dict, Optional, Tuple
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, List, Dict, Optional, Tuple
+from .user_index import UserIndex
+from .user_registry import UserRegistry, UserRecord
+from .profile_builder import ProfileBuilder
+from .pki_index import PkiIndex, CertificateRecord, STATUS_REVOKED
+from .pki_lock import PkiLock
+
+
+# Сертификаты, истекающие в этот срок, помечаются в списке пользователей
+EXPIRING_SOON_SECONDS = 30 * 86400
 
 
 class UserService:
     """Сервис для работы с пользователями OpenVPN"""
     
-    def __init__(self, ovpn_dir: str = "/root/ovpns", easy_rsa_dir: str = "/etc/openvpn/server/easy-rsa"):
+    def __init__(self, ovpn_dir: str = "/root/ovpns", easy_rsa_dir: str = "/etc/openvpn/server/easy-rsa",
+                 client_common_path: str = "/etc/openvpn/server/client-common.txt", data_dir: str = "data",
+                 instance: str = ""):
+        # Имя сервера OpenVPN, которому принадлежит PKI; пустое, если сервер один
+        self.instance = instance
         self.ovpn_dir = ovpn_dir
         self.easy_rsa_dir = easy_rsa_dir
-        self.client_common_path = "/etc/openvpn/server/client-common.txt"
+        self.client_common_path = client_common_path
+        # Отпечаток client-common.txt, из которого собраны текущие профили
+        self.template_state_path = os.path.join(data_dir, "client-common.sha256")
+        self.tls_crypt_key_path = "/etc/openvpn/server/tc.key"
+        # CRL, который OpenVPN проверяет при подключении (crl-verify в server.conf)
+        self.crl_path = "/etc/openvpn/server/crl.pem"
+        self.cert_days = 3650
+        # Отзывы, пришедшие в пределах этой задержки, применяются одним gen-crl
+        self.crl_coalesce_delay = 1.0
+        self._crl_waiters: List[asyncio.Future] = []
+        self._crl_task: Optional[asyncio.Task] = None
+        # Подпись, отзыв и gen-crl изменяют общие файлы PKI (index.txt, serial, crl.pem),
+        # поэтому выполняются строго по одной, в том числе с add_user.sh
+        self.pki_lock = PkiLock(os.path.join(easy_rsa_dir, "pki.lock"))
+        self.user_index = UserIndex(ovpn_dir)
+        self.pki_index = PkiIndex(os.path.join(easy_rsa_dir, "pki", "index.txt"))
+        # Списки, поиск и счетчики обслуживает реестр; директория только сообщает ему о внешних изменениях
+        self.registry = UserRegistry(os.path.join(data_dir, "users.sqlite3"), ovpn_dir, instance=instance)
+        self.user_index.add_listener(self._on_profiles_changed)
+        self.profile_builder = ProfileBuilder(client_common_path, ovpn_dir)
+        # Пул заранее сгенерированных ключей (KeyPoolService), если включен
+        self.key_pool = None
+        # Сервис метрик (MetricsService), если включен
+        self.metrics = None
     
     def create_user(self, username: str) -> Tuple[bool, str]:
         """
@@ -24,7 +67,7 @@ class UserService:
         """
         try:
             # Проверяем валидность имени пользователя
-            if not self._is_valid_username(username):
+            if not self.is_valid_username(username):
                 return False, "Имя пользователя может содержать только буквы, цифры, дефисы и подчеркивания!"
             
             # Проверяем, что OpenVPN установлен
@@ -50,45 +93,207 @@ class UserService:
         except Exception as e:
             return False, f"Ошибка при создании пользователя: {str(e)}"
     
-    def get_all_users(self) -> Tuple[bool, List[Dict], str]:
+    async def create_user_async(self, username: str,
+                                on_stage: Optional[Callable[[str], Awaitable[None]]] = None,
+                                created_by: Optional[int] = None) -> Tuple[bool, str]:
+        """
+        Создает нового пользователя OpenVPN, не блокируя event loop
+
+        Генерация ключа и подпись сертификата выполняются отдельными
+        асинхронными вызовами easyrsa, запись .ovpn файла - в пуле потоков.
+
+        Args:
+            username: Имя пользователя
+            on_stage: Корутина, вызываемая при переходе к очередному этапу
+            created_by: Telegram ID администратора для реестра
+
+        Returns:
+            Tuple[bool, str]: (успех, сообщение об ошибке или успехе)
+        """
+        async def notify(stage: str):
+            if on_stage:
+                await on_stage(stage)
+
+        try:
+            if not self.is_valid_username(username):
+                return False, "Имя пользователя может содержать только буквы, цифры, дефисы и подчеркивания!"
+
+            if not self._is_openvpn_installed():
+                return False, "OpenVPN не установлен или easy-rsa не найден на хосте"
+
+            if self._user_exists(username):
+                return False, f"Пользователь {username} уже существует"
+
+            await notify("generating_key")
+            success, message = await self._generate_key_async(username)
+            if not success:
+                return False, message
+
+            await notify("signing")
+            success, message = await self._sign_certificate_async(username)
+            if not success:
+                return False, message
+
+            await notify("writing_ovpn")
+            success, message = await asyncio.to_thread(self._create_ovpn_file, username, created_by)
+            if not success:
+                return False, message
+
+            return True, f"Пользователь {username} успешно создан!"
+
+        except Exception as e:
+            return False, f"Ошибка при создании пользователя: {str(e)}"
+
+    async def revoke_user_async(self, username: str) -> Tuple[bool, str]:
+        """
+        Отзывает сертификат пользователя и удаляет его .ovpn файл
+        
+        Args:
+            username: Имя пользователя
+            
+        Returns:
+            Tuple[bool, str]: (успех, сообщение об ошибке или успехе)
+        """
+        results, crl_success, crl_message = await self.revoke_users_async([username])
+        _, success, message = results[0]
+        if success and not crl_success:
+            return False, f"Сертификат отозван, но CRL не обновлен: {crl_message}"
+        return success, message
+    
+    async def revoke_users_async(self, usernames: List[str]) -> Tuple[List[Tuple[str, bool, str]], bool, str]:
+        """
+        Отзывает сертификаты нескольких пользователей
+        
+        Каждый сертификат отзывается отдельным easyrsa revoke, а CRL
+        пересоздается один раз для всех отзывов, пришедших почти одновременно.
+        
+        Args:
+            usernames: Имена пользователей
+            
+        Returns:
+            Tuple[List[Tuple[str, bool, str]], bool, str]: (результаты по пользователям,
+                успех обновления CRL, сообщение об ошибке обновления CRL)
+        """
+        results = []
+        for username in usernames:
+            try:
+                results.append((username, *await self._revoke_certificate_async(username)))
+            except Exception as e:
+                results.append((username, False, f"Ошибка при отзыве сертификата: {str(e)}"))
+        
+        if not any(success for _, success, _ in results):
+            return results, True, ""
+        
+        crl_success, crl_message = await self._update_crl_async()
+        return results, crl_success, crl_message
+    
+    def get_all_users(self) -> Tuple[bool, List[UserRecord], str]:
         """
         Получает список всех пользователей
         
         Returns:
-            Tuple[bool, List[Dict], str]: (успех, список пользователей, сообщение об ошибке)
+            Tuple[bool, List[UserRecord], str]: (успех, список пользователей, сообщение об ошибке)
         """
         try:
-            if not os.path.exists(self.ovpn_dir):
+            if not self.user_index.refresh():
                 return False, [], "Директория с .ovpn файлами не найдена!"
             
-            # Получаем список всех .ovpn файлов
-            ovpn_files = glob.glob(os.path.join(self.ovpn_dir, "*.ovpn"))
+            users = self.registry.get_all()
             
-            if not ovpn_files:
+            if not users:
                 return True, [], "Список пользователей пуст"
             
-            # Сортируем файлы по имени
-            ovpn_files.sort()
-            
-            # Формируем список пользователей
-            users = []
-            for file_path in ovpn_files:
-                filename = os.path.basename(file_path)
-                username = filename.replace('.ovpn', '')
-                file_size = os.path.getsize(file_path)
-                
-                users.append({
-                    'username': username,
-                    'filename': filename,
-                    'file_path': file_path,
-                    'size_kb': file_size / 1024
-                })
-            
             return True, users, ""
             
         except Exception as e:
             return False, [], f"Ошибка при получении списка пользователей: {str(e)}"
     
+    def get_users_page(self, per_page: int, cursor: Optional[str] = None,
+                       position: int = 0) -> Tuple[bool, Dict, str]:
+        """
+        Получает страницу пользователей из реестра
+        
+        Args:
+            per_page: Количество пользователей на странице
+            cursor: Имя первого пользователя страницы
+            position: Позиция начала страницы, если курсор не задан
+            
+        Returns:
+            Tuple[bool, Dict, str]: (успех, страница снимка индекса, сообщение об ошибке)
+        """
+        try:
+            if not self.user_index.refresh():
+                return False, {}, "Директория с .ovpn файлами не найдена!"
+            
+            page = self.registry.get_snapshot_page(per_page, cursor, position)
+            page['status_version'] = self.fill_certificate_status(page['users'])
+            
+            return True, page, ""
+            
+        except Exception as e:
+            return False, {}, f"Ошибка при получении списка пользователей: {str(e)}"
+    
+    def fill_certificate_status(self, users: List[UserRecord]) -> Tuple[int, int]:
+        """
+        Заполняет статус и срок действия сертификатов пользователей страницы
+        
+        Returns:
+            Tuple[int, int]: Версия статусов: статус сертификата меняется и без изменения
+                директории, поэтому входит в версию страницы
+        """
+        self.pki_index.refresh()
+        now = time.time()
+        for user in users:
+            user.status, user.expires_at = self._get_certificate_status(user.username, now)
+        return self.pki_index.version, int(now // 86400)
+    
+    def find_users(self, prefix: str, limit: int) -> Tuple[bool, List[UserRecord], int, int, str]:
+        """
+        Ищет пользователей по префиксу имени
+        
+        Args:
+            prefix: Префикс имени пользователя
+            limit: Максимальное количество возвращаемых пользователей
+            
+        Returns:
+            Tuple[bool, List[UserRecord], int, int, str]: (успех, найденные пользователи, всего совпадений,
+                позиция первого совпадения в общем списке, сообщение об ошибке)
+        """
+        try:
+            if not self.user_index.refresh():
+                return False, [], 0, 0, "Директория с .ovpn файлами не найдена!"
+            
+            position, total, matches = self.registry.find_prefix(prefix, limit)
+            return True, matches, total, position, ""
+            
+        except Exception as e:
+            return False, [], 0, 0, f"Ошибка при поиске пользователей: {str(e)}"
+    
+    def count_users(self) -> int:
+        """Получает количество активных пользователей"""
+        self.user_index.refresh()
+        return self.registry.count()
+    
+    def get_expiring_certificates(self, days: int) -> Tuple[bool, List[CertificateRecord], str]:
+        """
+        Получает действующие сертификаты, истекающие в ближайшие дни
+        
+        Args:
+            days: Количество дней
+            
+        Returns:
+            Tuple[bool, List[CertificateRecord], str]: (успех, сертификаты в порядке истечения,
+                сообщение об ошибке)
+        """
+        try:
+            if not self.pki_index.refresh():
+                return False, [], "Файл pki/index.txt не найден"
+            
+            return True, self.pki_index.get_expiring(days * 86400), ""
+            
+        except Exception as e:
+            return False, [], f"Ошибка при чтении базы сертификатов: {str(e)}"
+    
     def get_user_file(self, username: str) -> Tuple[bool, str, str]:
         """
         Получает путь к файлу пользователя
@@ -110,7 +315,146 @@ class UserService:
         except Exception as e:
             return False, "", f"Ошибка при получении файла: {str(e)}"
     
-    def _is_valid_username(self, username: str) -> bool:
+    def parse_usernames(self, text: str, csv_format: bool = False) -> Tuple[List[str], List[str]]:
+        """
+        Разбирает список имен пользователей из текста или CSV
+        
+        В тексте имена разделяются пробелами, запятыми, точками с запятой или
+        переводами строк. В CSV берется только первый столбец. Строки,
+        начинающиеся с '#', и заголовок username/name пропускаются.
+        
+        Args:
+            text: Текст со списком имен
+            csv_format: Разбирать текст как CSV
+            
+        Returns:
+            Tuple[List[str], List[str]]: (корректные имена без повторов, некорректные имена)
+        """
+        valid, invalid = [], []
+        
+        for name in self.split_usernames(text, csv_format):
+            if self.is_valid_username(name):
+                valid.append(name)
+            else:
+                invalid.append(name)
+        
+        return valid, invalid
+    
+    @staticmethod
+    def split_usernames(text: str, csv_format: bool = False) -> List[str]:
+        """
+        Выделяет имена из текста или CSV без проверки
+        
+        Returns:
+            List[str]: Имена без повторов, комментариев и заголовка
+        """
+        if csv_format:
+            names = [row[0].strip() for row in csv.reader(io.StringIO(text)) if row and row[0].strip()]
+        else:
+            names = [
+                name
+                for line in text.splitlines() if not line.strip().startswith('#')
+                for name in line.replace(',', ' ').replace(';', ' ').split()
+            ]
+        
+        result = []
+        seen = set()
+        for name in names:
+            if name.startswith('#') or name.lower() in ('username', 'name') or name in seen:
+                continue
+            seen.add(name)
+            result.append(name)
+        return result
+    
+    def regenerate_profiles(self, force: bool = False, workers: int = 4) -> Tuple[bool, Dict, str]:
+        """
+        Пересобирает .ovpn файлы после изменения client-common.txt
+        
+        Профили пересобираются из inline файлов PKI в пуле потоков;
+        файлы, содержимое которых не изменится, не перезаписываются.
+        
+        Args:
+            force: Пересобрать, даже если шаблон не изменился
+            workers: Количество потоков
+            
+        Returns:
+            Tuple[bool, Dict, str]: (успех, статистика, сообщение об ошибке)
+        """
+        try:
+            if not os.path.exists(self.client_common_path):
+                return False, {}, "Файл client-common.txt не найден"
+            
+            header = self.profile_builder.get_header()
+            fingerprint = hashlib.sha256(header).hexdigest()
+            stats = {
+                'template_changed': fingerprint != self._read_template_fingerprint(),
+                'total': 0, 'rebuilt': 0, 'unchanged': 0, 'failed': 0,
+                'errors': [], 'elapsed': 0.0, 'throughput': 0.0
+            }
+            
+            if not stats['template_changed'] and not force:
+                return True, stats, ""
+            
+            if not self.user_index.refresh():
+                return False, {}, "Директория с .ovpn файлами не найдена!"
+            
+            usernames = [user.username for user in self.registry.get_all()]
+            stats['total'] = len(usernames)
+            
+            def rebuild(username: str) -> Tuple[str, Optional[int], str]:
+                try:
+                    size = self.profile_builder.build_if_changed(
+                        username, self._read_inline_credentials(username), header
+                    )
+                    return username, size, ""
+                except Exception as e:
+                    return username, None, str(e)
+            
+            started = time.monotonic()
+            rebuilt = []
+            with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+                for username, size, error_message in executor.map(rebuild, usernames):
+                    if error_message:
+                        stats['failed'] += 1
+                        stats['errors'].append((username, error_message))
+                    elif size is None:
+                        stats['unchanged'] += 1
+                    else:
+                        stats['rebuilt'] += 1
+                        self.user_index.add(username, size)
+                        rebuilt.append((username, size, time.time(), None))
+            # Новые размеры записываются одной транзакцией, время создания и серийный номер сохраняются
+            if rebuilt:
+                self.registry.apply_changes(rebuilt, [])
+            
+            stats['elapsed'] = time.monotonic() - started
+            stats['throughput'] = stats['total'] / stats['elapsed'] if stats['elapsed'] else 0.0
+            
+            if not stats['failed']:
+                self._write_template_fingerprint(fingerprint)
+            
+            return True, stats, ""
+            
+        except Exception as e:
+            return False, {}, f"Ошибка при пересборке профилей: {str(e)}"
+    
+    def _read_template_fingerprint(self) -> Optional[str]:
+        """Читает отпечаток шаблона, из которого собраны профили"""
+        try:
+            with open(self.template_state_path, 'r') as state_file:
+                return state_file.read().strip()
+        except FileNotFoundError:
+            return None
+    
+    def _write_template_fingerprint(self, fingerprint: str):
+        """Сохраняет отпечаток шаблона после успешной пересборки"""
+        os.makedirs(os.path.dirname(self.template_state_path) or ".", exist_ok=True)
+        tmp_path = f"{self.template_state_path}.tmp"
+        with open(tmp_path, 'w') as state_file:
+            state_file.write(fingerprint)
+        os.replace(tmp_path, self.template_state_path)
+    
+    def is_valid_username(self, username: str) -> bool:
         """Проверяет валидность имени пользователя"""
         return username.replace('_', '').replace('-', '').isalnum()
     
@@ -119,64 +463,330 @@ class UserService:
         return os.path.exists(os.path.join(self.easy_rsa_dir, "easyrsa"))
     
     def _user_exists(self, username: str) -> bool:
-        """Проверяет, существует ли пользователь"""
+        """Проверяет, есть ли у пользователя действующий сертификат"""
+        if self.pki_index.refresh():
+            return self.pki_index.has_valid(username)
+        
+        # Без index.txt проверяем наличие файла сертификата
         cert_path = os.path.join(self.easy_rsa_dir, "pki", "issued", f"{username}.crt")
         return os.path.exists(cert_path)
     
+    def _get_certificate_status(self, username: str, now: float) -> Tuple[str, Optional[int]]:
+        """Получает статус и срок действия сертификата пользователя для списка"""
+        record = self.pki_index.get(username)
+        if record is None:
+            return 'unknown', None
+        if record.status == STATUS_REVOKED:
+            status = 'revoked'
+        elif not record.is_valid(now):
+            status = 'expired'
+        elif record.expires_at - now < EXPIRING_SOON_SECONDS:
+            status = 'expiring'
+        else:
+            status = 'valid'
+        return status, record.expires_at
+    
     def _create_certificate(self, username: str) -> Tuple[bool, str]:
         """Создает сертификат для пользователя"""
         try:
-            # Переходим в директорию easy-rsa
-            original_cwd = os.getcwd()
-            os.chdir(self.easy_rsa_dir)
-            
-            # Устанавливаем правильные права доступа для pki директории
-            subprocess.run(["chmod", "-R", "755", "pki/"], check=True)
-            subprocess.run(["chown", "-R", "root:root", "pki/"], check=True)
-            
             # Создаем сертификат для пользователя
-            result = subprocess.run(
-                ["./easyrsa", "--batch", "--days=3650", "build-client-full", username, "nopass"],
-                capture_output=True,
-                text=True
-            )
+            with self.pki_lock.acquire(), self._timed("build-client-full"):
+                result = subprocess.run(
+                    ["./easyrsa", "--batch", f"--days={self.cert_days}", "build-client-full", username, "nopass"],
+                    cwd=self.easy_rsa_dir,
+                    capture_output=True,
+                    text=True
+                )
             
             if result.returncode != 0:
                 return False, f"Ошибка при создании сертификата: {result.stderr}"
             
+            self._fix_permissions(username)
             return True, "Сертификат создан успешно"
             
         except Exception as e:
             return False, f"Ошибка при создании сертификата: {str(e)}"
-        finally:
-            os.chdir(original_cwd)
     
-    def _create_ovpn_file(self, username: str) -> Tuple[bool, str]:
-        """Создает .ovpn файл для пользователя"""
+    def _fix_permissions(self, username: str):
+        """
+        Выставляет владельца и права на файлы PKI, созданные для пользователя
+        
+        Затрагиваются только файлы этого пользователя, поэтому время
+        не растет с размером PKI и не мешает параллельным выпускам.
+        """
+        pki_dir = os.path.join(self.easy_rsa_dir, "pki")
+        with self._timed("fix-permissions"):
+            for path, mode in (
+                (os.path.join(pki_dir, "private", f"{username}.key"), 0o600),
+                (os.path.join(pki_dir, "inline", "private", f"{username}.inline"), 0o600),
+                (os.path.join(pki_dir, "reqs", f"{username}.req"), 0o644),
+                (os.path.join(pki_dir, "issued", f"{username}.crt"), 0o644),
+            ):
+                if not os.path.exists(path):
+                    continue
+                # Сменить владельца может только root; без root файлы и так принадлежат боту
+                if os.geteuid() == 0:
+                    os.chown(path, 0, 0)
+                os.chmod(path, mode)
+    
+    def _timed(self, stage: str):
+        """Замеряет длительность этапа выпуска сертификата, если метрики включены"""
+        if not self.metrics:
+            return contextlib.nullcontext()
+        return self.metrics.time("ovpn_subprocess_duration_seconds", stage=stage, instance=self.instance)
+    
+    async def _run_easyrsa_async(self, *args: str) -> Tuple[int, str]:
+        """Запускает easyrsa в директории easy-rsa, не блокируя event loop"""
+        command = next((arg for arg in args if not arg.startswith("--")), "")
+        with self._timed(command):
+            process = await asyncio.create_subprocess_exec(
+                "./easyrsa", *args,
+                cwd=self.easy_rsa_dir,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+            _, stderr = await process.communicate()
+        return process.returncode, stderr.decode(errors="replace")
+
+    async def _generate_key_async(self, username: str) -> Tuple[bool, str]:
+        """Генерирует ключ и запрос на сертификат для пользователя"""
+        try:
+            # gen-req пишет в pki/private и pki/reqs, поэтому выполняется под блокировкой PKI,
+            # как и удаление этих файлов после неудачной подписи
+            key_path = self.key_pool.take() if self.key_pool else None
+            async with self.pki_lock.acquire_async():
+                if key_path and await self._create_request_from_key_async(username, key_path):
+                    # Если в пуле был готовый ключ, остается только создать запрос
+                    self.key_pool.record_hit()
+                    message = "Ключ взят из пула"
+                else:
+                    if key_path:
+                        self.key_pool.record_miss()
+                    returncode, stderr = await self._run_easyrsa_async("--batch", "gen-req", username, "nopass")
+                    if returncode != 0:
+                        await asyncio.to_thread(self._remove_request_files, username)
+                        return False, f"Ошибка при генерации ключа: {stderr}"
+                    message = "Ключ создан успешно"
+
+            await asyncio.to_thread(self._fix_permissions, username)
+            return True, message
+
+        except Exception as e:
+            return False, f"Ошибка при генерации ключа: {str(e)}"
+
+    async def _create_request_from_key_async(self, username: str, key_path: str) -> bool:
+        """
+        Создает запрос на сертификат для заранее сгенерированного ключа
+        
+        Ключ переносится в pki/private под именем пользователя, а CN
+        задается при создании запроса, как это делает easyrsa gen-req.
+        
+        Returns:
+            bool: True, если запрос создан; иначе ключ удаляется и вызывающий
+            создает ключ через gen-req
+        """
+        private_key_path = os.path.join(self.easy_rsa_dir, "pki", "private", f"{username}.key")
+        request_path = os.path.join(self.easy_rsa_dir, "pki", "reqs", f"{username}.req")
+        
+        if os.path.exists(private_key_path) or os.path.exists(request_path):
+            os.remove(key_path)
+            return False
+        
+        try:
+            # os.replace не переносит файл между файловыми системами (KEY_POOL_DIR
+            # на другом разделе), тогда ключ создается обычным gen-req
+            os.replace(key_path, private_key_path)
+            with self._timed("openssl-req"):
+                process = await asyncio.create_subprocess_exec(
+                    "openssl", "req", "-new", "-batch",
+                    "-key", private_key_path,
+                    "-subj", f"/CN={username}",
+                    "-out", request_path,
+                    stdout=asyncio.subprocess.DEVNULL,
+                    stderr=asyncio.subprocess.DEVNULL
+                )
+                returncode = await process.wait()
+        except OSError:
+            returncode = None
+        if returncode == 0:
+            return True
+        
+        for path in (key_path, private_key_path, request_path):
+            if os.path.exists(path):
+                os.remove(path)
+        return False
+
+    async def _sign_certificate_async(self, username: str) -> Tuple[bool, str]:
+        """Подписывает запрос на сертификат пользователя"""
+        try:
+            async with self.pki_lock.acquire_async():
+                returncode, stderr = await self._run_easyrsa_async(
+                    "--batch", f"--days={self.cert_days}", "sign-req", "client", username
+                )
+                if returncode != 0:
+                    # Иначе оставшиеся ключ и запрос не дадут повторно создать пользователя
+                    await asyncio.to_thread(self._remove_request_files, username)
+            if returncode != 0:
+                return False, f"Ошибка при подписи сертификата: {stderr}"
+
+            await asyncio.to_thread(self._fix_permissions, username)
+            return True, "Сертификат подписан успешно"
+
+        except Exception as e:
+            return False, f"Ошибка при подписи сертификата: {str(e)}"
+
+    def _remove_request_files(self, username: str):
+        """Удаляет ключ и запрос пользователя, для которого не выпущен сертификат"""
+        pki_dir = os.path.join(self.easy_rsa_dir, "pki")
+        if os.path.exists(os.path.join(pki_dir, "issued", f"{username}.crt")):
+            return
+        for path in (os.path.join(pki_dir, "private", f"{username}.key"),
+                     os.path.join(pki_dir, "reqs", f"{username}.req")):
+            if os.path.exists(path):
+                os.remove(path)
+    
+    async def _revoke_certificate_async(self, username: str) -> Tuple[bool, str]:
+        """Отзывает сертификат пользователя и удаляет его файлы"""
+        if not self.is_valid_username(username):
+            return False, "Некорректное имя пользователя"
+        
+        if not self._is_openvpn_installed():
+            return False, "OpenVPN не установлен или easy-rsa не найден на хосте"
+        
+        if not self._user_exists(username):
+            return False, f"Пользователь {username} не найден"
+        
+        async with self.pki_lock.acquire_async():
+            returncode, stderr = await self._run_easyrsa_async("--batch", "revoke", username)
+        if returncode != 0:
+            return False, f"Ошибка при отзыве сертификата: {stderr}"
+        
+        # Как и openvpn-install, удаляем ключ и запрос, чтобы имя можно было использовать повторно;
+        # inline файл тоже удаляется, иначе новый профиль собрался бы со старым ключом
+        pki_dir = os.path.join(self.easy_rsa_dir, "pki")
+        for path in (
+            os.path.join(pki_dir, "reqs", f"{username}.req"),
+            os.path.join(pki_dir, "private", f"{username}.key"),
+            os.path.join(pki_dir, "inline", "private", f"{username}.inline"),
+            os.path.join(self.ovpn_dir, f"{username}.ovpn"),
+        ):
+            if os.path.exists(path):
+                os.remove(path)
+        self.user_index.remove(username)
+        self.registry.mark_revoked(username)
+        
+        return True, f"Пользователь {username} отозван"
+    
+    async def _update_crl_async(self) -> Tuple[bool, str]:
+        """Ставит в очередь пересоздание CRL и дожидается его результата"""
+        future = asyncio.get_running_loop().create_future()
+        self._crl_waiters.append(future)
+        if self._crl_task is None or self._crl_task.done():
+            self._crl_task = asyncio.create_task(self._crl_update_loop())
+        return await future
+    
+    async def _crl_update_loop(self):
+        """Пересоздает CRL, пока есть ожидающие отзывы"""
+        while self._crl_waiters:
+            await asyncio.sleep(self.crl_coalesce_delay)
+            # Отзывы, пришедшие во время gen-crl, обработает следующая итерация
+            waiters, self._crl_waiters = self._crl_waiters, []
+            try:
+                result = await self._generate_crl_async()
+            except Exception as e:
+                result = (False, f"Ошибка при обновлении CRL: {str(e)}")
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_result(result)
+    
+    async def _generate_crl_async(self) -> Tuple[bool, str]:
+        """Пересоздает CRL и атомарно заменяет файл, который читает OpenVPN"""
+        async with self.pki_lock.acquire_async():
+            returncode, stderr = await self._run_easyrsa_async("--batch", f"--days={self.cert_days}", "gen-crl")
+            if returncode != 0:
+                return False, f"Ошибка при обновлении CRL: {stderr}"
+            # Копируем под блокировкой, чтобы не прочитать crl.pem, который переписывает другой процесс
+            tmp_path = f"{self.crl_path}.tmp"
+            shutil.copyfile(os.path.join(self.easy_rsa_dir, "pki", "crl.pem"), tmp_path)
+        
+        # OpenVPN после сброса привилегий читает CRL от имени nobody, поэтому права берутся у старого файла
+        if os.path.exists(self.crl_path):
+            crl_stat = os.stat(self.crl_path)
+            # Сменить владельца может только root
+            if os.geteuid() == 0:
+                os.chown(tmp_path, crl_stat.st_uid, crl_stat.st_gid)
+            os.chmod(tmp_path, crl_stat.st_mode & 0o777)
+        else:
+            os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, self.crl_path)
+        
+        return True, "CRL обновлен"
+    
+    def _read_inline_credentials(self, username: str) -> str:
+        """
+        Получает inline блок с ключами пользователя
+
+        easyrsa создает pki/inline файл для build-client-full, но не во всех
+        версиях для sign-req, поэтому при его отсутствии блок собирается
+        из файлов PKI так же, как это делает openvpn-install.
+        """
+        pki_dir = os.path.join(self.easy_rsa_dir, "pki")
+        inline_file_path = os.path.join(pki_dir, "inline", "private", f"{username}.inline")
+        if os.path.exists(inline_file_path):
+            with open(inline_file_path, 'r') as inline_file:
+                return inline_file.read()
+
+        with open(os.path.join(pki_dir, "ca.crt"), 'r') as ca_file:
+            ca = ca_file.read()
+        with open(os.path.join(pki_dir, "issued", f"{username}.crt"), 'r') as cert_file:
+            cert = cert_file.read()
+        with open(os.path.join(pki_dir, "private", f"{username}.key"), 'r') as key_file:
+            key = key_file.read()
+
+        # Оставляем только PEM блок сертификата, без текстового описания
+        cert = cert[cert.find("-----BEGIN CERTIFICATE-----"):]
+
+        inline = (
+            f"<ca>\n{ca.strip()}\n</ca>\n"
+            f"<cert>\n{cert.strip()}\n</cert>\n"
+            f"<key>\n{key.strip()}\n</key>\n"
+        )
+
+        if os.path.exists(self.tls_crypt_key_path):
+            with open(self.tls_crypt_key_path, 'r') as tls_file:
+                tls_key = tls_file.read()
+            tls_key = tls_key[tls_key.find("-----BEGIN OpenVPN Static key"):]
+            inline += f"<tls-crypt>\n{tls_key.strip()}\n</tls-crypt>\n"
+
+        return inline
+
+    def _create_ovpn_file(self, username: str, created_by: Optional[int] = None) -> Tuple[bool, str]:
+        """Создает .ovpn файл для пользователя и записывает его в реестр"""
         try:
-            # Создаем директорию, если она не существует
-            os.makedirs(self.ovpn_dir, exist_ok=True)
-            
             if not os.path.exists(self.client_common_path):
                 return False, "Файл client-common.txt не найден"
             
-            # Создаем .ovpn файл
-            ovpn_file_path = os.path.join(self.ovpn_dir, f"{username}.ovpn")
-            inline_file_path = os.path.join(self.easy_rsa_dir, "pki", "inline", "private", f"{username}.inline")
-            
-            with open(ovpn_file_path, 'w') as ovpn_file:
-                # Добавляем содержимое client-common.txt
-                with open(self.client_common_path, 'r') as common_file:
-                    for line in common_file:
-                        if not line.startswith('#'):
-                            ovpn_file.write(line)
-                
-                # Добавляем inline содержимое
-                if os.path.exists(inline_file_path):
-                    with open(inline_file_path, 'r') as inline_file:
-                        ovpn_file.write(inline_file.read())
+            # Заголовок берется из кэша, файл записывается атомарно
+            size = self.profile_builder.build(username, self._read_inline_credentials(username))
+            self.user_index.add(username, size)
+            self.registry.record_created(username, size, created_by, self._get_serial(username))
             
             return True, f"Файл {username}.ovpn создан успешно"
             
         except Exception as e:
             return False, f"Ошибка при создании .ovpn файла: {str(e)}"
+    
+    def _get_serial(self, username: str) -> Optional[str]:
+        """Получает серийный номер действующего сертификата пользователя"""
+        self.pki_index.refresh()
+        record = self.pki_index.get(username)
+        return record.serial if record else None
+    
+    def _on_profiles_changed(self, added: List[Tuple[str, int, float]], removed: List[str], full: bool):
+        """Переносит в реестр профили, появившиеся или удаленные вне бота (например, add_user.sh)"""
+        self.pki_index.refresh()
+        entries = []
+        for username, size, mtime in added:
+            record = self.pki_index.get(username)
+            entries.append((username, size, mtime, record.serial if record else None))
+        self.registry.apply_changes(entries, removed, full)
@@ -0,0 +1,117 @@
+import asyncio
+import hmac
+import logging
+from typing import Optional, Set
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+
+
+logger = logging.getLogger(__name__)
+
+# Заголовок, в котором Telegram передает секрет, заданный при set_webhook
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    """HTTP сервер для получения обновлений Telegram через webhook"""
+
+    def __init__(self, dp: Dispatcher, bot: Bot, path: str = "/webhook",
+                 secret_token: Optional[str] = None, max_concurrent_updates: int = 32):
+        self.dp = dp
+        self.bot = bot
+        self.path = path
+        self.secret_token = secret_token
+        self.max_concurrent_updates = max_concurrent_updates
+        self._semaphore = asyncio.Semaphore(max_concurrent_updates)
+        self._tasks: Set[asyncio.Task] = set()
+        self._draining = False
+        self._runner: Optional[web.AppRunner] = None
+
+    def create_app(self) -> web.Application:
+        """Создает aiohttp приложение с обработчиком webhook"""
+        app = web.Application()
+        app.router.add_post(self.path, self.handle_update)
+        return app
+
+    async def start(self, host: str, port: int, public_url: Optional[str] = None):
+        """
+        Запускает HTTP сервер и, если задан публичный адрес, регистрирует webhook
+
+        Args:
+            host: Адрес для прослушивания
+            port: Порт
+            public_url: Адрес, по которому Telegram будет отправлять обновления
+        """
+        self._runner = web.AppRunner(self.create_app(), access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        logger.info("Webhook сервер слушает http://%s:%s%s", host, port, self.path)
+
+        if public_url:
+            await self.bot.set_webhook(
+                url=public_url,
+                secret_token=self.secret_token,
+                max_connections=min(self.max_concurrent_updates, 100),
+                allowed_updates=self.dp.resolve_used_update_types(),
+            )
+            logger.info("Webhook зарегистрирован: %s", public_url)
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        """Принимает обновление и ставит его в обработку"""
+        if self.secret_token:
+            received = request.headers.get(SECRET_TOKEN_HEADER, "")
+            if not hmac.compare_digest(received.encode(), self.secret_token.encode()):
+                return web.Response(status=401)
+
+        # Во время остановки Telegram повторит доставку после перезапуска
+        if self._draining:
+            return web.Response(status=503)
+
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        except Exception as e:
+            logger.warning("Некорректное обновление: %s", e)
+            return web.Response(status=400)
+
+        # Если все слоты заняты, ответ задерживается, и Telegram притормаживает доставку
+        await self._semaphore.acquire()
+        task = asyncio.create_task(self._process_update(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.Response()
+
+    async def stop(self, drain_timeout: float = 30.0):
+        """
+        Останавливает прием обновлений и дожидается обработки уже принятых
+
+        Args:
+            drain_timeout: Максимальное время ожидания обработки, секунды
+        """
+        self._draining = True
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + drain_timeout
+        # Запросы, ожидавшие слот, могут добавить задачи уже во время ожидания
+        while self._tasks:
+            logger.info("Ожидание обработки %s обновлений", len(self._tasks))
+            _, pending = await asyncio.wait(set(self._tasks), timeout=max(deadline - loop.time(), 0))
+            if pending:
+                logger.warning("Прервана обработка %s обновлений", len(pending))
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+                break
+
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _process_update(self, update: Update):
+        """Передает обновление диспетчеру и освобождает слот"""
+        try:
+            await self.dp.feed_update(self.bot, update)
+        except Exception as e:
+            logger.exception("Ошибка обработки обновления %s: %s", update.update_id, e)
+        finally:
+            self._semaphore.release()
@@ -0,0 +1,108 @@
+import asyncio
+import json
+
+from services.audit_service import AuditService
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_torn_last_line_is_dropped_on_start(tmp_path):
+    async def scenario():
+        audit = AuditService(str(tmp_path))
+        await audit.start()
+        audit.log("create", 1, "alice")
+        audit.log("download", 1, "bob")
+        await audit.stop()
+
+        # Аварийная остановка посреди записи строки, которая не попала в индекс
+        with open(audit._segment_path(1), 'ab') as log_file:
+            log_file.write(b'{"ts":1,"action":"revoke","actor":1,"us')
+
+        audit = AuditService(str(tmp_path))
+        await audit.start()
+        audit.log("revoke", 1, "alice")
+        await audit.stop()
+        return audit
+
+    audit = run(scenario())
+    with open(audit._segment_path(1), 'rb') as log_file:
+        lines = log_file.read().splitlines()
+    assert [json.loads(line)['action'] for line in lines] == ["create", "download", "revoke"]
+
+    async def read():
+        return await audit.get_events(), await audit.get_events("alice")
+
+    events, alice_events = run(read())
+    assert [(event['action'], event['user']) for event in events] == [
+        ("revoke", "alice"), ("download", "bob"), ("create", "alice"),
+    ]
+    assert [event['action'] for event in alice_events] == ["revoke", "create"]
+
+
+def test_unindexed_lines_are_recovered_on_start(tmp_path):
+    async def scenario():
+        audit = AuditService(str(tmp_path))
+        await audit.start()
+        audit.log("create", 1, "alice")
+        await audit.stop()
+
+        # Строка журнала записана, а строка индекса - нет
+        with open(audit._segment_path(1), 'ab') as log_file:
+            log_file.write(b'{"ts":2,"action":"download","actor":1,"user":"alice","ok":true}\n')
+
+        audit = AuditService(str(tmp_path))
+        await audit.start()
+        events = await audit.get_events("alice")
+        await audit.stop()
+        return events
+
+    assert [event['action'] for event in run(scenario())] == ["download", "create"]
+
+
+def test_identical_events_are_not_collapsed(tmp_path, monkeypatch):
+    # Повторные скачивания в одну миллисекунду дают одинаковые события
+    monkeypatch.setattr("services.audit_service.time.time", lambda: 1000.0)
+
+    async def scenario():
+        audit = AuditService(str(tmp_path))
+        await audit.start()
+        audit.log("download", 1, "alice")
+        audit.log("download", 1, "alice")
+        await asyncio.to_thread(audit._write_batch, audit._take_batch())
+        audit._writing = []
+        audit.log("download", 1, "alice")
+        events = await audit.get_events("alice")
+        await audit.stop()
+        return events
+
+    assert len(run(scenario())) == 3
+
+
+def test_batch_written_during_read_is_not_duplicated(tmp_path):
+    async def scenario():
+        audit = AuditService(str(tmp_path))
+        await audit.start()
+        audit.log("download", 1, "alice")
+        audit.log("download", 1, "alice")
+        # Пачка записана, но еще не убрана из _writing, как при чтении во время записи
+        await asyncio.to_thread(audit._write_batch, audit._take_batch())
+        audit.log("download", 1, "alice")
+        events = await audit.get_events("alice")
+        await audit.stop()
+        return events
+
+    assert len(run(scenario())) == 3
+
+
+def test_format_events_keeps_values_inside_code_spans():
+    audit = AuditService("unused")
+    text = audit.format_events([
+        {'ts': 0, 'action': "download", 'actor': 1, 'user': "alice_1", 'ok': True, 'actor_name': "admin_*bot"},
+        {'ts': 0, 'action': "some_action", 'actor': None, 'user': "", 'ok': False},
+    ])
+    assert "(`@admin_*bot`)" in text
+    assert "`some_action`" in text
+    # Вне `...` не остается символов разметки из значений событий
+    assert "_" not in "".join(text.split("`")[::2])
@@ -0,0 +1,69 @@
+import asyncio
+import os
+
+import pytest
+
+from services.file_id_cache import FileIdCache
+
+
+@pytest.fixture
+def profile(tmp_path):
+    path = tmp_path / "alice.ovpn"
+    path.write_bytes(b"client\n")
+    return str(path)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return FileIdCache(str(tmp_path / "file_ids.jsonl"))
+
+
+def test_file_id_survives_restart(tmp_path, cache, profile):
+    asyncio.run(cache.put("alice", profile, "file-1"))
+    assert cache.get("alice", profile) == "file-1"
+    assert FileIdCache(cache.path).get("alice", profile) == "file-1"
+
+
+def test_rewritten_file_invalidates_file_id(cache, profile):
+    asyncio.run(cache.put("alice", profile, "file-1"))
+    stat = os.stat(profile)
+
+    # Тот же inode и размер, но другое время изменения
+    with open(profile, 'r+b') as ovpn_file:
+        ovpn_file.write(b"CLIENT\n")
+    os.utime(profile, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+    assert cache.get("alice", profile) is None
+    assert FileIdCache(cache.path).get("alice", profile) is None
+
+
+def test_replaced_file_invalidates_file_id(tmp_path, cache, profile):
+    asyncio.run(cache.put("alice", profile, "file-1"))
+    stat = os.stat(profile)
+
+    # Профиль пересобран через временный файл: новый inode, те же mtime и размер
+    replacement = tmp_path / "alice.tmp"
+    replacement.write_bytes(b"client\n")
+    os.utime(replacement, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    os.replace(replacement, profile)
+
+    assert cache.get("alice", profile) is None
+
+
+def test_invalidate_is_persisted(cache, profile):
+    asyncio.run(cache.put("alice", profile, "file-1"))
+    asyncio.run(cache.invalidate("alice"))
+    assert cache.get("alice", profile) is None
+    assert FileIdCache(cache.path).get("alice", profile) is None
+
+
+def test_journal_is_compacted_on_load(cache, profile):
+    async def scenario():
+        for number in range(150):
+            await cache.put("alice", profile, f"file-{number}")
+
+    asyncio.run(scenario())
+    reloaded = FileIdCache(cache.path)
+    assert reloaded.get("alice", profile) == "file-149"
+    with open(cache.path) as cache_file:
+        assert len(cache_file.readlines()) == 1
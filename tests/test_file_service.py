@@ -0,0 +1,71 @@
+import time
+
+import pytest
+
+from services.file_service import FileService
+from services.user_registry import UserRegistry
+
+
+@pytest.fixture
+def file_service(tmp_path):
+    return FileService(files_per_page=2, export_dir=str(tmp_path / "exports"))
+
+
+def test_cursor_round_trip(file_service):
+    callback_data = file_service.encode_cursor(1295, "alice", 40)
+    assert callback_data == "pg:zz:alice"
+    assert file_service.decode_cursor(callback_data) == (1295, "alice", 0)
+
+
+def test_instance_qualified_cursor_round_trip(file_service):
+    callback_data = file_service.encode_cursor(7, "udp:alice", 3)
+    assert file_service.decode_cursor(callback_data) == (7, "udp:alice", 0)
+
+
+@pytest.mark.parametrize("username", ["a" * 64, "tcp-frankfurt:" + "b" * 50, "пользователь" * 3])
+def test_long_cursor_falls_back_to_position(file_service, username):
+    callback_data = file_service.encode_cursor(2 ** 40, username, 123456)
+    assert len(callback_data.encode()) <= FileService.CALLBACK_DATA_LIMIT
+    assert file_service.decode_cursor(callback_data) == (2 ** 40, None, 123456)
+
+
+def test_cursor_at_the_limit_keeps_the_name(file_service):
+    username = "c" * (FileService.CALLBACK_DATA_LIMIT - len("pg:1:"))
+    callback_data = file_service.encode_cursor(1, username, 5)
+    assert len(callback_data.encode()) == FileService.CALLBACK_DATA_LIMIT
+    assert file_service.decode_cursor(callback_data) == (1, username, 0)
+
+
+def test_rendered_buttons_fit_callback_data_limit(tmp_path, file_service):
+    registry = UserRegistry(str(tmp_path / "users.sqlite3"), str(tmp_path / "ovpns"))
+    names = [f"{number:02d}" + "x" * 70 for number in range(5)]
+    registry.apply_changes([(name, 100, time.time(), None) for name in names], [], full=True)
+
+    page = registry.get_snapshot_page(2, cursor=names[2])
+    _, keyboard = file_service.render_page(page)
+    navigation = keyboard.inline_keyboard[-1]
+    assert all(len(button.callback_data.encode()) <= FileService.CALLBACK_DATA_LIMIT for button in navigation)
+
+    # Кнопки с позицией ведут на те же страницы
+    prev_version, prev_cursor, prev_position = file_service.decode_cursor(navigation[0].callback_data)
+    assert (prev_version, prev_cursor, prev_position) == (page['version'], None, 0)
+    next_page = registry.get_snapshot_page(2, position=file_service.decode_cursor(navigation[-1].callback_data)[2])
+    assert [user.username for user in next_page['users']] == names[4:]
+    registry.close()
+
+
+def test_stale_cursor_opens_page_in_current_snapshot(tmp_path, file_service):
+    registry = UserRegistry(str(tmp_path / "users.sqlite3"), str(tmp_path / "ovpns"))
+    registry.apply_changes([(name, 100, time.time(), None) for name in "bcdf"], [], full=True)
+    page = registry.get_snapshot_page(2)
+    callback_data = file_service.encode_cursor(page['version'], *page['next_cursor'])
+
+    # Пока кнопка висела в чате, список изменился
+    registry.apply_changes([("a", 100, time.time(), None)], ["c"])
+
+    version, cursor, position = file_service.decode_cursor(callback_data)
+    page = registry.get_snapshot_page(2, cursor=cursor, position=position)
+    assert version != page['version']
+    assert [user.username for user in page['users']] == ["d", "f"]
+    assert page['position'] == 2
+    registry.close()
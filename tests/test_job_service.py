@@ -0,0 +1,112 @@
+import asyncio
+
+from services.job_service import (
+    JobService, STAGE_DONE, STAGE_FAILED, STAGE_GENERATING_KEY, STAGE_QUEUED, STAGE_SIGNING, STAGE_WRITING_OVPN,
+)
+
+
+class FakeUserService:
+    """Проходит этапы выпуска, ожидая release перед подписью"""
+
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.release = asyncio.Event()
+        self.release.set()
+
+    async def create_user_async(self, username, on_stage=None, *args):
+        await on_stage(STAGE_GENERATING_KEY)
+        await asyncio.sleep(0.01)
+        await self.release.wait()
+        await on_stage(STAGE_SIGNING)
+        await on_stage(STAGE_WRITING_OVPN)
+        if username in self.fail:
+            return False, "sign-req failed"
+        return True, f"Пользователь {username} успешно создан!"
+
+
+def test_job_passes_stages_in_order_with_timings():
+    async def scenario():
+        service = JobService(FakeUserService(), workers=1)
+        stages = []
+
+        async def on_progress(job):
+            stages.append(job.stage)
+
+        success, job, _ = service.submit("alice", on_progress=on_progress)
+        assert success and job.stage == STAGE_QUEUED
+        result = await job.done
+        await service.stop()
+        return service, job, stages, result
+
+    service, job, stages, result = asyncio.run(scenario())
+    assert result == (True, "Пользователь alice успешно создан!")
+    assert stages == [STAGE_GENERATING_KEY, STAGE_SIGNING, STAGE_WRITING_OVPN, STAGE_DONE]
+    assert job.finished and job.success
+    assert set(job.stage_timings) == {STAGE_QUEUED, STAGE_GENERATING_KEY, STAGE_SIGNING, STAGE_WRITING_OVPN}
+    assert job.stage_timings[STAGE_GENERATING_KEY] >= 0.01
+
+    stats = service.get_stats()
+    assert stats['completed'] == 1 and stats['failed'] == 0 and stats['active'] == 0
+    assert stats['average_timings'][STAGE_GENERATING_KEY] >= 0.01
+
+
+def test_failed_job_and_duplicate_username():
+    async def scenario():
+        service = JobService(FakeUserService(fail={"bob"}), workers=1)
+        _, job, _ = service.submit("bob")
+        duplicate = service.submit("bob")
+        result = await job.done
+        await service.stop()
+        return service, job, duplicate, result
+
+    service, job, duplicate, result = asyncio.run(scenario())
+    assert result == (False, "sign-req failed")
+    assert job.stage == STAGE_FAILED
+    assert duplicate[0] is False and job.job_id in duplicate[2]
+    assert service.get_stats()['failed'] == 1
+
+
+def test_full_queue_rejects_new_jobs():
+    async def scenario():
+        user_service = FakeUserService()
+        user_service.release.clear()
+        service = JobService(user_service, workers=1, max_queue=1)
+        first = service.submit("alice")
+        await asyncio.sleep(0)
+        second = service.submit("bob")
+        third = service.submit("carol")
+        user_service.release.set()
+        await asyncio.gather(first[1].done, second[1].done)
+        await service.stop()
+        return first, second, third
+
+    first, second, third = asyncio.run(scenario())
+    assert first[0] and second[0]
+    assert third[0] is False and "переполнена" in third[2]
+
+
+def test_stop_fails_running_and_queued_jobs():
+    async def scenario():
+        user_service = FakeUserService()
+        user_service.release.clear()
+        service = JobService(user_service, workers=1)
+        progress = []
+
+        async def on_progress(job):
+            progress.append((job.username, job.stage))
+
+        _, running, _ = service.submit("alice", on_progress=on_progress)
+        _, queued, _ = service.submit("bob", on_progress=on_progress)
+        await asyncio.sleep(0.02)
+        await service.stop()
+        after_stop = service.submit("carol")
+        return service, running, queued, progress, after_stop
+
+    service, running, queued, progress, after_stop = asyncio.run(scenario())
+    for job in (running, queued):
+        assert job.done.done() and not job.done.cancelled()
+        assert job.done.result()[0] is False
+        assert job.stage == STAGE_FAILED
+    assert ("alice", STAGE_FAILED) in progress and ("bob", STAGE_FAILED) in progress
+    assert service.get_stats()['failed'] == 2
+    assert after_stop[0] is False
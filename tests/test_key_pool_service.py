@@ -0,0 +1,70 @@
+import asyncio
+import errno
+import os
+import stat
+
+import pytest
+
+from benchmarks.fake_pki import create_environment
+from services.key_pool_service import KeyPoolService
+from services.user_service import UserService
+
+
+@pytest.fixture
+def key_pool(tmp_path):
+    return KeyPoolService(str(tmp_path / "keypool"), size=2, algorithm="ec:prime256v1")
+
+
+@pytest.fixture
+def user_service(tmp_path, key_pool):
+    paths = create_environment(str(tmp_path), 0)
+    service = UserService(paths['ovpn_dir'], paths['easy_rsa_dir'], paths['client_common_path'],
+                          data_dir=str(tmp_path / "data"))
+    service.crl_path = str(tmp_path / "crl.pem")
+    service.tls_crypt_key_path = str(tmp_path / "tc.key")
+    service.key_pool = key_pool
+    yield service
+    service.registry.close()
+
+
+def fill_pool(key_pool):
+    os.makedirs(key_pool.pool_dir, exist_ok=True)
+    asyncio.run(key_pool._generate_key())
+
+
+def test_generated_key_is_private_from_the_start(key_pool):
+    old_umask = os.umask(0o022)
+    try:
+        fill_pool(key_pool)
+    finally:
+        os.umask(old_umask)
+
+    key_path = key_pool._keys[0]
+    assert stat.S_IMODE(os.stat(key_path).st_mode) == 0o600
+    assert not [name for name in os.listdir(key_pool.pool_dir) if name.endswith(".tmp")]
+
+
+def test_hit_is_counted_after_request_is_created(user_service, key_pool):
+    fill_pool(key_pool)
+
+    success, message = asyncio.run(user_service.create_user_async("alice"))
+    assert success, message
+    assert (key_pool.hits, key_pool.misses) == (1, 0)
+
+
+def test_key_pool_on_another_filesystem_falls_back_to_gen_req(user_service, key_pool, monkeypatch):
+    fill_pool(key_pool)
+    pool_key = key_pool._keys[0]
+    replace = os.replace
+
+    def cross_device_replace(src, dst):
+        if src.startswith(key_pool.pool_dir):
+            raise OSError(errno.EXDEV, "Invalid cross-device link")
+        return replace(src, dst)
+
+    monkeypatch.setattr(os, "replace", cross_device_replace)
+
+    success, message = asyncio.run(user_service.create_user_async("alice"))
+    assert success, message
+    assert (key_pool.hits, key_pool.misses) == (0, 1)
+    assert not os.path.exists(pool_key)
@@ -0,0 +1,31 @@
+import asyncio
+import socket
+
+from services.metrics_service import MetricsService
+
+
+def test_render_histogram_and_counter():
+    metrics = MetricsService()
+    metrics.describe("stage_seconds", "histogram", "Время этапов", buckets=(0.1, 1.0))
+    metrics.observe("stage_seconds", 0.05, stage="sign_req")
+    metrics.observe("stage_seconds", 0.5, stage="sign_req")
+    metrics.inc("errors_total", handler="create")
+
+    text = metrics.render()
+    assert 'stage_seconds_bucket{stage="sign_req",le="0.1"} 1' in text
+    assert 'stage_seconds_bucket{stage="sign_req",le="1"} 2' in text
+    assert 'stage_seconds_count{stage="sign_req"} 2' in text
+    assert 'errors_total{handler="create"} 1' in text
+
+
+def test_busy_port_does_not_stop_the_bot():
+    async def scenario():
+        with socket.socket() as busy:
+            busy.bind(("127.0.0.1", 0))
+            busy.listen()
+            metrics = MetricsService()
+            await metrics.start_http_server("127.0.0.1", busy.getsockname()[1])
+            assert metrics._runner is None
+            await metrics.stop_http_server()
+
+    asyncio.run(scenario())
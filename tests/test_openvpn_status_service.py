@@ -0,0 +1,139 @@
+import asyncio
+import time
+
+from services.openvpn_status_service import OpenVPNStatusService
+
+CONNECTED_SINCE = int(time.mktime(time.strptime("Thu Jun 18 04:23:03 2015", "%a %b %d %H:%M:%S %Y")))
+
+STATUS_V1 = """OpenVPN CLIENT LIST
+Updated,Thu Jun 18 08:12:15 2015
+Common Name,Real Address,Bytes Received,Bytes Sent,Connected Since
+alice,203.0.113.5:51234,1000,2000,Thu Jun 18 04:23:03 2015
+bob,198.51.100.7:1194,30,40,Thu Jun 18 04:23:03 2015
+ROUTING TABLE
+Virtual Address,Common Name,Real Address,Last Ref
+192.168.10.0/24C,alice,203.0.113.5:51234,Thu Jun 18 08:12:09 2015
+10.8.0.2,alice,203.0.113.5:51234,Thu Jun 18 08:12:09 2015
+10.8.0.3,bob,198.51.100.7:1194,Thu Jun 18 08:12:09 2015
+GLOBAL STATS
+Max bcast/mcast queue length,0
+END
+"""
+
+STATUS_V2_ROWS = [
+    ["TITLE", "OpenVPN 2.5.1 x86_64-pc-linux-gnu"],
+    ["TIME", "Thu Jun 18 08:12:15 2015", "1434615135"],
+    ["HEADER", "CLIENT_LIST", "Common Name", "Real Address", "Virtual Address", "Virtual IPv6 Address",
+     "Bytes Received", "Bytes Sent", "Connected Since", "Connected Since (time_t)", "Username", "Client ID",
+     "Peer ID", "Data Channel Cipher"],
+    ["CLIENT_LIST", "alice", "203.0.113.5:51234", "10.8.0.2", "", "1000", "2000", "Thu Jun 18 04:23:03 2015",
+     str(CONNECTED_SINCE), "UNDEF", "0", "0", "AES-256-GCM"],
+    ["CLIENT_LIST", "bob", "198.51.100.7:1194", "10.8.0.3", "", "30", "40", "Thu Jun 18 04:23:03 2015",
+     str(CONNECTED_SINCE), "UNDEF", "1", "1", "AES-256-GCM"],
+    ["HEADER", "ROUTING_TABLE", "Virtual Address", "Common Name", "Real Address", "Last Ref", "Last Ref (time_t)"],
+    ["ROUTING_TABLE", "10.8.0.2", "alice", "203.0.113.5:51234", "Thu Jun 18 08:12:09 2015", "1434615129"],
+    ["GLOBAL_STATS", "Max bcast/mcast queue length", "0"],
+    ["END"],
+]
+
+STATUS_V2 = "".join(",".join(row) + "\n" for row in STATUS_V2_ROWS)
+STATUS_V3 = "".join("\t".join(row) + "\n" for row in STATUS_V2_ROWS)
+
+
+def summary(clients):
+    return sorted(
+        (client.common_name, client.real_address, client.virtual_address,
+         client.bytes_received, client.bytes_sent, client.connected_since)
+        for client in clients
+    )
+
+
+EXPECTED = [
+    ("alice", "203.0.113.5:51234", "10.8.0.2", 1000, 2000, CONNECTED_SINCE),
+    ("bob", "198.51.100.7:1194", "10.8.0.3", 30, 40, CONNECTED_SINCE),
+]
+
+
+def test_parse_status_version_1():
+    assert summary(OpenVPNStatusService.parse_status(STATUS_V1)) == EXPECTED
+
+
+def test_parse_status_version_2():
+    assert summary(OpenVPNStatusService.parse_status(STATUS_V2)) == EXPECTED
+
+
+def test_parse_status_version_3():
+    assert summary(OpenVPNStatusService.parse_status(STATUS_V3)) == EXPECTED
+
+
+def test_partial_status_file_is_read_again(tmp_path):
+    status_path = tmp_path / "openvpn-status.log"
+    service = OpenVPNStatusService(str(status_path))
+
+    # OpenVPN еще не дописал файл: строки END нет
+    status_path.write_text(STATUS_V2[:STATUS_V2.index("HEADER,ROUTING_TABLE")])
+    assert not asyncio.run(service.refresh())
+    assert service.last_error and service.updated_at is None
+
+    status_path.write_text(STATUS_V2)
+    assert asyncio.run(service.refresh())
+    assert summary(service.clients) == EXPECTED
+    assert service.last_error is None
+
+    # Неизменившийся файл повторно не разбирается
+    assert not asyncio.run(service.refresh())
+    assert summary(service.clients) == EXPECTED
+
+
+def run_management(password, reply_lines):
+    commands = []
+
+    async def handle(reader, writer):
+        if password:
+            writer.write(b"ENTER PASSWORD:")
+            await writer.drain()
+            commands.append((await reader.readline()).decode().strip())
+            writer.write(b"SUCCESS: password is correct\r\n")
+        writer.write(b">INFO:OpenVPN Management Interface Version 3 -- type 'help' for more info\r\n")
+        await writer.drain()
+        commands.append((await reader.readline()).decode().strip())
+        writer.write("".join(line + "\r\n" for line in reply_lines).encode())
+        await writer.drain()
+        writer.close()
+
+    async def scenario():
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        service = OpenVPNStatusService("", management_address=f"127.0.0.1:{port}",
+                                       management_password=password, timeout=2.0)
+        try:
+            updated = await service.refresh()
+        finally:
+            server.close()
+            await server.wait_closed()
+        return service, updated
+
+    service, updated = asyncio.run(scenario())
+    return service, updated, commands
+
+
+def test_query_management_with_password():
+    service, updated, commands = run_management("secret", STATUS_V2.splitlines())
+    assert updated
+    assert commands == ["secret", "status 2"]
+    assert summary(service.clients) == [
+        ("alice", "203.0.113.5:51234", "10.8.0.2", 1000, 2000, CONNECTED_SINCE),
+        ("bob", "198.51.100.7:1194", "10.8.0.3", 30, 40, CONNECTED_SINCE),
+    ]
+
+
+def test_query_management_without_password():
+    service, updated, commands = run_management("", STATUS_V2.splitlines())
+    assert updated and commands == ["status 2"]
+    assert len(service.clients) == 2
+
+
+def test_query_management_error_reply():
+    service, updated, _ = run_management("", ["ERROR: unknown command"])
+    assert not updated
+    assert service.last_error.startswith("ERROR")
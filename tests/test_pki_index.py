@@ -0,0 +1,102 @@
+import calendar
+
+import pytest
+
+from services.pki_index import PkiIndex, STATUS_EXPIRED, STATUS_REVOKED, STATUS_VALID
+
+
+def row(status, expires, revoked, serial, common_name):
+    return f"{status}\t{expires}\t{revoked}\t{serial}\tunknown\t/CN={common_name}\n"
+
+
+@pytest.fixture
+def index_path(tmp_path):
+    return tmp_path / "index.txt"
+
+
+def load(index_path, *rows):
+    index_path.write_text("".join(rows))
+    index = PkiIndex(str(index_path))
+    assert index.refresh()
+    return index
+
+
+def test_valid_revoked_and_expired_rows(index_path):
+    index = load(
+        index_path,
+        row("V", "350101000000Z", "", "01", "alice"),
+        row("R", "350101000000Z", "240305120000Z,keyCompromise", "02", "bob"),
+        row("E", "20230101000000Z", "", "03", "carol"),
+    )
+
+    alice = index.get("alice")
+    assert alice.status == STATUS_VALID and alice.serial == "01"
+    assert alice.expires_at == calendar.timegm((2035, 1, 1, 0, 0, 0))
+    assert alice.revoked_at == 0
+
+    bob = index.get("bob")
+    assert bob.status == STATUS_REVOKED
+    assert bob.revoked_at == calendar.timegm((2024, 3, 5, 12, 0, 0))
+
+    carol = index.get("carol")
+    assert carol.status == STATUS_EXPIRED
+    assert carol.expires_at == calendar.timegm((2023, 1, 1, 0, 0, 0))
+
+    assert index.has_valid("alice")
+    assert not index.has_valid("bob") and not index.has_valid("carol")
+
+
+def test_two_digit_years_before_2050_are_in_this_century(index_path):
+    index = load(index_path, row("V", "491231235959Z", "", "01", "alice"), row("E", "991231000000Z", "", "02", "bob"))
+    assert index.get("alice").expires_at == calendar.timegm((2049, 12, 31, 23, 59, 59))
+    assert index.get("bob").expires_at == calendar.timegm((1999, 12, 31, 0, 0, 0))
+
+
+def test_reissued_certificate_takes_priority_over_revoked(index_path):
+    index = load(
+        index_path,
+        row("V", "350101000000Z", "", "02", "alice"),
+        row("R", "350101000000Z", "240101000000Z", "01", "alice"),
+    )
+    assert index.get("alice").serial == "02"
+    assert index.has_valid("alice")
+
+
+def test_revocation_rewrites_row(index_path):
+    index = load(index_path, row("V", "350101000000Z", "", "01", "alice"), row("V", "350101000000Z", "", "02", "bob"))
+    index_path.write_text(
+        row("R", "350101000000Z", "240101000000Z", "01", "alice") + row("V", "350101000000Z", "", "02", "bob")
+    )
+    index.refresh()
+    assert index.get("alice").status == STATUS_REVOKED
+    assert index.has_valid("bob")
+
+
+def test_malformed_and_partial_rows_are_skipped(index_path):
+    index = load(
+        index_path,
+        "garbage\n",
+        row("X", "350101000000Z", "", "01", "alice"),
+        "V\t350101000000Z\t\t02\tunknown\t/O=example\n",
+        row("V", "350101000000Z", "", "03", "bob"),
+        "V\t350101000000Z\t\t04\tunknown\t/CN=car",
+    )
+    assert index.get("alice") is None
+    assert index.get("bob").serial == "03"
+    assert index.get("car") is None
+
+    with open(index_path, 'a') as index_file:
+        index_file.write("ol\n")
+    index.refresh()
+    assert index.get("carol").serial == "04"
+
+
+def test_expiring_skips_revoked(index_path):
+    now = calendar.timegm((2034, 12, 25, 0, 0, 0))
+    index = load(
+        index_path,
+        row("V", "350101000000Z", "", "01", "alice"),
+        row("R", "350101000000Z", "240101000000Z", "02", "bob"),
+        row("V", "360101000000Z", "", "03", "carol"),
+    )
+    assert [record.common_name for record in index.get_expiring(30 * 86400, now=now)] == ["alice"]
@@ -0,0 +1,75 @@
+import asyncio
+import subprocess
+import sys
+import time
+
+import pytest
+
+from services.pki_lock import PkiLock
+
+# Внешний процесс, держащий блокировку, как add_user.sh под flock
+HOLDER = """
+import fcntl, sys, time
+with open(sys.argv[1], 'a') as lock_file:
+    fcntl.flock(lock_file, fcntl.LOCK_EX)
+    print("locked", flush=True)
+    time.sleep(float(sys.argv[2]))
+"""
+
+
+@pytest.fixture
+def lock_path(tmp_path):
+    return str(tmp_path / ".pki.lock")
+
+
+def hold_in_other_process(lock_path, seconds):
+    process = subprocess.Popen([sys.executable, "-c", HOLDER, lock_path, str(seconds)],
+                               stdout=subprocess.PIPE, text=True)
+    assert process.stdout.readline().strip() == "locked"
+    return process
+
+
+def test_coroutines_take_the_lock_one_at_a_time(lock_path):
+    lock = PkiLock(lock_path)
+    active = []
+    overlaps = []
+
+    async def change_pki(name):
+        async with lock.acquire_async():
+            active.append(name)
+            overlaps.append(len(active))
+            await asyncio.sleep(0.01)
+            active.remove(name)
+
+    async def scenario():
+        await asyncio.gather(*(change_pki(name) for name in ("alice", "bob", "carol")))
+
+    asyncio.run(scenario())
+    assert overlaps == [1, 1, 1]
+
+
+def test_bot_waits_for_other_process(lock_path):
+    process = hold_in_other_process(lock_path, 0.3)
+    try:
+        started = time.monotonic()
+        with PkiLock(lock_path).acquire():
+            waited = time.monotonic() - started
+    finally:
+        process.wait()
+    assert waited >= 0.2
+
+
+def test_busy_lock_times_out(lock_path):
+    process = hold_in_other_process(lock_path, 5)
+    try:
+        lock = PkiLock(lock_path, timeout=0.2)
+
+        async def scenario():
+            async with lock.acquire_async():
+                pass
+
+        with pytest.raises(TimeoutError):
+            asyncio.run(scenario())
+    finally:
+        process.kill()
+        process.wait()
@@ -0,0 +1,58 @@
+import os
+
+import pytest
+
+from services.profile_builder import ProfileBuilder
+
+
+@pytest.fixture
+def builder(tmp_path):
+    common_path = tmp_path / "client-common.txt"
+    common_path.write_bytes(b"# comment\nclient\ndev tun\n")
+    return ProfileBuilder(str(common_path), str(tmp_path / "ovpns"))
+
+
+def profile_path(builder, username):
+    return os.path.join(builder.ovpn_dir, f"{username}.ovpn")
+
+
+def test_build_writes_header_without_comments(builder):
+    size = builder.build("alice", "<ca>\nCA\n</ca>\n")
+    with open(profile_path(builder, "alice"), 'rb') as ovpn_file:
+        content = ovpn_file.read()
+    assert content == b"client\ndev tun\n<ca>\nCA\n</ca>\n"
+    assert size == len(content)
+    assert os.listdir(builder.ovpn_dir) == ["alice.ovpn"]
+
+
+def test_rebuild_replaces_file_atomically(builder):
+    builder.build("alice", "old\n")
+    with open(profile_path(builder, "alice"), 'rb') as reader:
+        builder.build("alice", "new\n")
+        # Уже открытый файл (например, отправляемый в Telegram) остается целым
+        assert reader.read() == b"client\ndev tun\nold\n"
+    with open(profile_path(builder, "alice"), 'rb') as ovpn_file:
+        assert ovpn_file.read() == b"client\ndev tun\nnew\n"
+
+
+def test_failed_write_keeps_old_profile(builder, monkeypatch):
+    builder.build("alice", "old\n")
+
+    def failing_fsync(fd):
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(os, "fsync", failing_fsync)
+    with pytest.raises(OSError):
+        builder.build("alice", "new\n")
+
+    with open(profile_path(builder, "alice"), 'rb') as ovpn_file:
+        assert ovpn_file.read() == b"client\ndev tun\nold\n"
+    assert os.listdir(builder.ovpn_dir) == ["alice.ovpn"]
+
+
+def test_build_if_changed_skips_identical_profile(builder):
+    builder.build("alice", "same\n")
+    inode = os.stat(profile_path(builder, "alice")).st_ino
+    assert builder.build_if_changed("alice", "same\n") is None
+    assert os.stat(profile_path(builder, "alice")).st_ino == inode
+    assert builder.build_if_changed("alice", "other\n") == len(b"client\ndev tun\nother\n")
@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+
+from benchmarks.fake_pki import create_environment
+from services.service_manager import ServiceManager
+
+STATUS_TEMPLATE = """OpenVPN CLIENT LIST
+Updated,Thu Jun 18 08:12:15 2015
+Common Name,Real Address,Bytes Received,Bytes Sent,Connected Since
+{name},203.0.113.5:51234,1000,2000,Thu Jun 18 04:23:03 2015
+ROUTING TABLE
+Virtual Address,Common Name,Real Address,Last Ref
+GLOBAL STATS
+END
+"""
+
+
+@pytest.fixture
+def service_manager(tmp_path, monkeypatch):
+    monkeypatch.setenv("BOT_DATA_DIR", str(tmp_path / "data"))
+    monkeypatch.setenv("OVPN_INSTANCES", "udp,tcp")
+    for name, client in (("udp", "alice"), ("tcp", "bob")):
+        paths = create_environment(str(tmp_path / name), 0)
+        monkeypatch.setenv(f"INSTANCE_{name.upper()}_OVPN_DIR", paths['ovpn_dir'])
+        monkeypatch.setenv(f"INSTANCE_{name.upper()}_EASY_RSA_DIR", paths['easy_rsa_dir'])
+        # Status файл по умолчанию лежит рядом с easy-rsa сервера
+        with open(tmp_path / name / "openvpn-status.log", 'w') as status_file:
+            status_file.write(STATUS_TEMPLATE.format(name=client))
+
+    manager = ServiceManager()
+    yield manager
+    for instance in manager.get_instance_service().instances:
+        instance.user_service.registry.close()
+
+
+def test_online_collects_clients_of_every_server(service_manager):
+    instance_service = service_manager.get_instance_service()
+
+    async def scenario():
+        for instance in instance_service.instances:
+            assert await instance.status_service.refresh()
+
+    asyncio.run(scenario())
+    udp, tcp = instance_service.instances
+    assert [client.common_name for client in udp.status_service.clients] == ["alice"]
+    assert [client.common_name for client in tcp.status_service.clients] == ["bob"]
+    assert udp.traffic_service is not tcp.traffic_service
+
+    text = instance_service.format_per_instance(lambda instance: instance.status_service.format_online())
+    assert text.index("Сервер udp") < text.index("alice") < text.index("Сервер tcp") < text.index("bob")
+
+
+def test_subprocess_metrics_are_labelled_with_server(service_manager):
+    tcp = service_manager.get_instance_service().get("tcp")
+
+    success, message = asyncio.run(tcp.user_service.create_user_async("bob"))
+    assert success, message
+
+    metrics = service_manager.get_metrics_service()
+    assert 'ovpn_subprocess_duration_seconds_count{instance="tcp",stage="gen-req"} 1' in metrics.render()
+    assert "`tcp:gen-req`" in metrics.format_stats()
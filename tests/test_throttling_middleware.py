@@ -0,0 +1,148 @@
+import asyncio
+from unittest import mock
+
+import pytest
+from aiogram.dispatcher.event.handler import HandlerObject
+from aiogram.types import Message
+
+from middlewares import throttling_middleware
+from middlewares.throttling_middleware import CLASS_CHEAP, CLASS_EXPENSIVE, ThrottleBudget, ThrottlingMiddleware
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(throttling_middleware, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def middleware(clock):
+    return ThrottlingMiddleware({
+        CLASS_EXPENSIVE: ThrottleBudget(per_minute=6, burst=2, max_in_flight=2),
+        CLASS_CHEAP: ThrottleBudget(per_minute=60, burst=3, max_in_flight=10),
+    })
+
+
+async def cmd_create(event, data):
+    return "done"
+
+
+async def cmd_help(event, data):
+    return "done"
+
+
+def message(text, chat_id=1):
+    return Message.model_validate({
+        "message_id": 1, "date": 0, "text": text,
+        "chat": {"id": chat_id, "type": "private"},
+        "from": {"id": chat_id, "is_bot": False, "first_name": "Admin"},
+    })
+
+
+def call(middleware, event, callback=cmd_create, command_class=CLASS_EXPENSIVE):
+    data = {
+        "event_chat": event.chat,
+        "handler": HandlerObject(callback=callback, flags={"throttling": command_class}),
+    }
+    return middleware(callback, event, data)
+
+
+@pytest.fixture
+def replies():
+    with mock.patch.object(Message, "answer", new_callable=mock.AsyncMock) as answer:
+        yield answer
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_bucket_empties_and_refills(middleware, clock, replies):
+    assert run(call(middleware, message("/create_user a"))) == "done"
+    assert run(call(middleware, message("/create_user b"))) == "done"
+    assert run(call(middleware, message("/create_user c"))) is None
+    assert "Слишком много запросов" in replies.await_args.args[0]
+
+    # 6 запросов в минуту: токен пополняется за 10 секунд
+    clock.now += 9
+    assert run(call(middleware, message("/create_user c"))) is None
+    clock.now += 1
+    assert run(call(middleware, message("/create_user c"))) == "done"
+
+
+def test_rate_limit_notice_is_sent_once_per_empty_bucket(middleware, replies):
+    for text in ("/create_user a", "/create_user b", "/create_user c", "/create_user d", "/create_user e"):
+        run(call(middleware, message(text)))
+    assert replies.await_count == 1
+
+
+def test_expensive_and_cheap_budgets_are_separate(middleware, replies):
+    for text in ("/create_user a", "/create_user b"):
+        run(call(middleware, message(text)))
+    assert run(call(middleware, message("/create_user c"))) is None
+    assert run(call(middleware, message("/help"), callback=cmd_help, command_class=CLASS_CHEAP)) == "done"
+
+
+def test_budgets_are_per_chat(middleware, replies):
+    for text in ("/create_user a", "/create_user b"):
+        run(call(middleware, message(text)))
+    assert run(call(middleware, message("/create_user c"))) is None
+    assert run(call(middleware, message("/create_user c", chat_id=2))) == "done"
+
+
+def test_duplicate_in_flight_request_is_rejected(middleware, replies):
+    async def scenario():
+        release = asyncio.Event()
+        calls = []
+
+        async def cmd_create(event, data):
+            calls.append(event.text)
+            await release.wait()
+            return "done"
+
+        first = asyncio.create_task(call(middleware, message("/create_user a"), callback=cmd_create))
+        await asyncio.sleep(0)
+        duplicate = await call(middleware, message("/create_user a"), callback=cmd_create)
+        release.set()
+        return await first, duplicate, calls
+
+    first, duplicate, calls = run(scenario())
+    assert (first, duplicate) == ("done", None)
+    assert calls == ["/create_user a"]
+    assert "уже выполняется" in replies.await_args.args[0]
+    # Отклоненный дубликат не расходует токен
+    assert middleware._buckets[(1, CLASS_EXPENSIVE)].tokens == 1
+
+
+def test_global_in_flight_limit_rejects_immediately(middleware, replies):
+    async def scenario():
+        release = asyncio.Event()
+
+        async def cmd_create(event, data):
+            await release.wait()
+            return "done"
+
+        running = [
+            asyncio.create_task(call(middleware, message(f"/create_user {name}", chat_id=chat_id), callback=cmd_create))
+            for chat_id, name in ((1, "a"), (2, "b"))
+        ]
+        await asyncio.sleep(0)
+        rejected = await asyncio.wait_for(
+            call(middleware, message("/create_user c", chat_id=3), callback=cmd_create), 1
+        )
+        release.set()
+        return await asyncio.gather(*running), rejected
+
+    results, rejected = run(scenario())
+    assert results == ["done", "done"] and rejected is None
+    assert "перегружен" in replies.await_args.args[0]
+    assert middleware._in_flight[CLASS_EXPENSIVE] == 0 and not middleware._in_flight_keys
@@ -0,0 +1,80 @@
+from services.openvpn_status_service import ConnectedClient
+from services.traffic_service import TrafficService, _RingBuffer, _TrafficSeries
+
+# Начало суток, кратное длительности корзин всех уровней
+DAY = 20000 * 86400
+
+
+def buckets(ring, start_bucket, end_bucket):
+    return [(received, sent) for _, received, sent in ring.iter_buckets(start_bucket, end_bucket)]
+
+
+def test_ring_buffer_reuses_slots_after_wraparound():
+    ring = _RingBuffer(10, 4)
+    ring.add(0, 1, 1)
+    ring.add(15, 2, 2)
+    # Корзина 4 занимает слот корзины 0, который должен быть обнулен
+    ring.add(45, 3, 3)
+    ring.add(25, 5, 5)
+    assert buckets(ring, 0, 4) == [(2, 2), (5, 5), (0, 0), (3, 3)]
+
+
+def test_ring_buffer_gap_longer_than_capacity_clears_everything():
+    ring = _RingBuffer(10, 4)
+    for timestamp in range(0, 40, 10):
+        ring.add(timestamp, 1, 0)
+    ring.add(1000, 7, 0)
+    assert buckets(ring, 97, 100) == [(0, 0), (0, 0), (0, 0), (7, 0)]
+
+
+def test_ring_buffer_ignores_samples_older_than_capacity():
+    ring = _RingBuffer(10, 4)
+    ring.add(100, 1, 0)
+    ring.add(60, 5, 0)
+    ring.add(70, 2, 0)
+    assert buckets(ring, 7, 10) == [(2, 0), (0, 0), (0, 0), (1, 0)]
+
+
+def test_day_rolls_out_of_fine_tier_but_stays_in_hourly():
+    service = TrafficService()
+    series = service._series["alice"] = _TrafficSeries()
+    series.add(DAY + 60, 100, 10)
+    now = DAY + 86400 + 3600
+
+    # За последние сутки 15-минутный уровень уже перезаписан, неделя берется из часового
+    assert service.get_top(86400, now=now) == []
+    assert service.get_top(7 * 86400, now=now) == [("alice", 100, 10)]
+    assert service.get_totals("alice") == (100, 10)
+
+
+def test_history_uses_tier_covering_period():
+    service = TrafficService()
+    series = service._series["alice"] = _TrafficSeries()
+    for hour in range(48):
+        series.add(DAY + hour * 3600, 1, 0)
+    now = DAY + 48 * 3600 - 1
+
+    step, points = service.get_history("alice", 86400, now=now)
+    assert step == 3600 and len(points) == 24
+    assert sum(received for _, received, _ in points) == 24
+
+    step, points = service.get_history("alice", 7 * 86400, now=now)
+    assert step == 7 * 3600
+    assert sum(received for _, received, _ in points) == 48
+
+
+def test_snapshots_count_counter_deltas():
+    service = TrafficService()
+
+    def snapshot(timestamp, received, sent, connected_since=DAY):
+        service.on_snapshot((ConnectedClient("alice", "1.2.3.4:1194", "10.8.0.2", received, sent, connected_since),),
+                            timestamp)
+
+    # Трафик до первого снимка не учитывается
+    snapshot(DAY + 10, 1000, 100)
+    snapshot(DAY + 20, 1500, 150)
+    # Переподключение с тем же началом сессии: счетчики начались заново
+    snapshot(DAY + 30, 200, 20)
+    # Новая сессия после первого снимка учитывается целиком
+    snapshot(DAY + 40, 50, 5, connected_since=DAY + 35)
+    assert service.get_totals("alice") == (750, 75)
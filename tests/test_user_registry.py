@@ -0,0 +1,64 @@
+import time
+
+import pytest
+
+from services.user_registry import UserRegistry
+
+
+@pytest.fixture
+def registry(tmp_path):
+    registry = UserRegistry(str(tmp_path / "users.sqlite3"), str(tmp_path / "ovpns"))
+    registry.apply_changes([(name, 100, time.time(), None) for name in "abcd"], [], full=True)
+    yield registry
+    registry.close()
+
+
+def usernames(page):
+    return [user.username for user in page['users']]
+
+
+def test_cursor_page(registry):
+    page = registry.get_snapshot_page(2, cursor="c")
+    assert usernames(page) == ["c", "d"]
+    assert page['position'] == 2
+    assert page['prev_cursor'] == ("a", 0)
+    assert page['next_cursor'] is None
+
+
+def test_cursor_of_deleted_user_moves_to_next(registry):
+    registry.apply_changes([], ["b"])
+    page = registry.get_snapshot_page(2, cursor="b")
+    assert usernames(page) == ["c", "d"]
+    assert page['position'] == 1
+    assert page['prev_cursor'] == ("a", 0)
+
+
+def test_cursor_of_deleted_last_user(registry):
+    registry.apply_changes([], ["d"])
+    page = registry.get_snapshot_page(2, cursor="d")
+    assert usernames(page) == ["c"]
+    assert page['position'] == 2
+    assert page['prev_cursor'] == ("a", 0)
+    assert page['next_cursor'] is None
+
+
+def test_cursor_past_the_end(registry):
+    page = registry.get_snapshot_page(2, cursor="zz")
+    assert usernames(page) == ["d"]
+    assert page['position'] == 3
+    assert page['prev_cursor'] == ("b", 1)
+
+
+def test_cursor_in_empty_registry(tmp_path):
+    registry = UserRegistry(str(tmp_path / "users.sqlite3"), str(tmp_path / "ovpns"))
+    page = registry.get_snapshot_page(2, cursor="a")
+    assert page['users'] == [] and page['total'] == 0
+    assert page['prev_cursor'] is None and page['next_cursor'] is None
+    registry.close()
+
+
+def test_position_page(registry):
+    page = registry.get_snapshot_page(2, position=1)
+    assert usernames(page) == ["b", "c"]
+    assert page['next_cursor'] == ("d", 3)
+    assert page['prev_cursor'] == ("a", 0)
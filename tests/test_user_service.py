@@ -0,0 +1,80 @@
+import asyncio
+import os
+
+import pytest
+
+from benchmarks.fake_pki import create_environment
+from services.user_service import UserService
+
+
+@pytest.fixture
+def easyrsa_commands():
+    return []
+
+
+@pytest.fixture
+def user_service(tmp_path, easyrsa_commands):
+    paths = create_environment(str(tmp_path), 0)
+    service = UserService(paths['ovpn_dir'], paths['easy_rsa_dir'], paths['client_common_path'],
+                          data_dir=str(tmp_path / "data"))
+    service.crl_path = str(tmp_path / "crl.pem")
+    service.tls_crypt_key_path = str(tmp_path / "tc.key")
+    service.crl_coalesce_delay = 0.05
+
+    # Считаем команды easyrsa, оставляя настоящий (фейковый) запуск
+    run_easyrsa = service._run_easyrsa_async
+
+    async def counting_run_easyrsa(*args):
+        easyrsa_commands.append(next(arg for arg in args if not arg.startswith("--")))
+        return await run_easyrsa(*args)
+
+    service._run_easyrsa_async = counting_run_easyrsa
+    yield service
+    service.registry.close()
+
+
+def create_users(service, usernames):
+    async def scenario():
+        for username in usernames:
+            success, message = await service.create_user_async(username)
+            assert success, message
+    asyncio.run(scenario())
+
+
+def test_bulk_revoke_runs_gen_crl_once(user_service, easyrsa_commands):
+    create_users(user_service, ["alice", "bob", "carol"])
+    easyrsa_commands.clear()
+
+    results, crl_success, _ = asyncio.run(user_service.revoke_users_async(["alice", "bob", "carol", "nobody"]))
+
+    assert [success for _, success, _ in results] == [True, True, True, False]
+    assert crl_success
+    assert easyrsa_commands.count("revoke") == 3
+    assert easyrsa_commands.count("gen-crl") == 1
+    assert os.path.exists(user_service.crl_path)
+    assert not os.listdir(user_service.ovpn_dir)
+
+
+def test_overlapping_revokes_share_one_gen_crl(user_service, easyrsa_commands):
+    create_users(user_service, ["alice", "bob", "carol", "dave"])
+    easyrsa_commands.clear()
+    # Задержка с запасом покрывает все четыре revoke, которые выполняются по одному под блокировкой PKI
+    user_service.crl_coalesce_delay = 1.0
+
+    async def scenario():
+        return await asyncio.gather(
+            user_service.revoke_user_async("alice"),
+            user_service.revoke_user_async("bob"),
+            user_service.revoke_users_async(["carol", "dave"]),
+        )
+
+    first, second, (results, crl_success, _) = asyncio.run(scenario())
+    assert first[0] and second[0] and crl_success
+    assert all(success for _, success, _ in results)
+    assert easyrsa_commands.count("gen-crl") == 1
+
+
+def test_failed_revokes_skip_gen_crl(user_service, easyrsa_commands):
+    results, crl_success, _ = asyncio.run(user_service.revoke_users_async(["nobody"]))
+    assert not results[0][1] and crl_success
+    assert "gen-crl" not in easyrsa_commands
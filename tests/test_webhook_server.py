@@ -0,0 +1,113 @@
+import asyncio
+
+from aiogram import Bot
+from aiohttp.test_utils import TestClient, TestServer
+
+from services.webhook_server import SECRET_TOKEN_HEADER, WebhookServer
+
+UPDATE = {
+    "update_id": 1,
+    "message": {
+        "message_id": 1,
+        "date": 0,
+        "chat": {"id": 42, "type": "private"},
+        "from": {"id": 42, "is_bot": False, "first_name": "Admin"},
+        "text": "/start",
+    },
+}
+
+
+class FakeDispatcher:
+    def __init__(self):
+        self.updates = []
+        self.release = asyncio.Event()
+        self.release.set()
+
+    async def feed_update(self, bot, update):
+        await self.release.wait()
+        self.updates.append(update.update_id)
+
+
+async def start_client(secret_token="secret"):
+    dp = FakeDispatcher()
+    server = WebhookServer(dp, Bot("123456:" + "A" * 35), secret_token=secret_token)
+    client = TestClient(TestServer(server.create_app()))
+    await client.start_server()
+    return server, dp, client
+
+
+def run(scenario):
+    async def wrapper():
+        server, dp, client = await start_client()
+        try:
+            return await scenario(server, dp, client)
+        finally:
+            await client.close()
+            await server.bot.session.close()
+    return asyncio.run(wrapper())
+
+
+def test_update_reaches_dispatcher():
+    async def scenario(server, dp, client):
+        response = await client.post("/webhook", json=UPDATE, headers={SECRET_TOKEN_HEADER: "secret"})
+        assert response.status == 200
+        await asyncio.gather(*server._tasks)
+        assert dp.updates == [1]
+
+    run(scenario)
+
+
+def test_wrong_or_missing_secret_is_rejected():
+    async def scenario(server, dp, client):
+        response = await client.post("/webhook", json=UPDATE, headers={SECRET_TOKEN_HEADER: "wrong"})
+        assert response.status == 401
+        response = await client.post("/webhook", json=UPDATE)
+        assert response.status == 401
+        assert not server._tasks and dp.updates == []
+
+    run(scenario)
+
+
+def test_invalid_update_is_rejected():
+    async def scenario(server, dp, client):
+        response = await client.post("/webhook", data=b"not json", headers={SECRET_TOKEN_HEADER: "secret"})
+        assert response.status == 400
+
+    run(scenario)
+
+
+def test_update_during_draining_is_rejected():
+    async def scenario(server, dp, client):
+        server._draining = True
+        response = await client.post("/webhook", json=UPDATE, headers={SECRET_TOKEN_HEADER: "secret"})
+        assert response.status == 503
+        assert dp.updates == []
+
+    run(scenario)
+
+
+def test_stop_waits_for_accepted_updates():
+    async def scenario(server, dp, client):
+        dp.release.clear()
+        response = await client.post("/webhook", json=UPDATE, headers={SECRET_TOKEN_HEADER: "secret"})
+        assert response.status == 200
+
+        stopping = asyncio.create_task(server.stop(drain_timeout=5))
+        await asyncio.sleep(0.05)
+        assert not stopping.done() and dp.updates == []
+
+        dp.release.set()
+        await asyncio.wait_for(stopping, 1)
+        assert dp.updates == [1]
+
+    run(scenario)
+
+
+def test_stop_cancels_updates_after_timeout():
+    async def scenario(server, dp, client):
+        dp.release.clear()
+        await client.post("/webhook", json=UPDATE, headers={SECRET_TOKEN_HEADER: "secret"})
+        await asyncio.wait_for(server.stop(drain_timeout=0.05), 1)
+        assert not server._tasks and dp.updates == []
+
+    run(scenario)